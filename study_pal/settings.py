@@ -139,6 +139,35 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Where books and questionnaire files are stored, see study_space/storage.py. 'local' and
+# 'sharded' keep them under MEDIA_ROOT on this node; 's3' keeps them on an S3-compatible
+# store (needs boto3) that every API node shares.
+
+FILE_STORAGE = os.environ.get('FILE_STORAGE', 'local')
+
+STORAGES = {
+    'default': {
+        'BACKEND': {
+            'local': 'django.core.files.storage.FileSystemStorage',
+            'sharded': 'study_space.storage.ShardedFileSystemStorage',
+            's3': 'study_space.storage.S3Storage',
+        }[FILE_STORAGE],
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
+if FILE_STORAGE == 's3':
+    STORAGES['default']['OPTIONS'] = {
+        'bucket_name': os.environ.get('S3_BUCKET'),
+        'endpoint_url': os.environ.get('S3_ENDPOINT_URL'),
+        'access_key': os.environ.get('S3_ACCESS_KEY'),
+        'secret_key': os.environ.get('S3_SECRET_KEY'),
+        'region_name': os.environ.get('S3_REGION'),
+        'custom_domain': os.environ.get('S3_CUSTOM_DOMAIN'),
+    }
+
 SWAGGER_SETTINGS = {
     'SECURITY_DEFINITIONS': {
         'Token': {
@@ -153,11 +182,156 @@ SWAGGER_SETTINGS = {
         {'Token': []}
     ],
 }
+# Questionnaire generation jobs, see study_space/jobs.py
+
+QUESTIONAIRRE_JOB_WORKERS = int(os.environ.get('QUESTIONAIRRE_JOB_WORKERS', 2))
+QUESTIONAIRRE_JOB_POLL_INTERVAL = float(os.environ.get('QUESTIONAIRRE_JOB_POLL_INTERVAL', 1.0))
+QUESTIONAIRRE_JOBS_EAGER = os.environ.get('QUESTIONAIRRE_JOBS_EAGER', 'False') == 'True'
+# Seconds a running job stays claimed without a heartbeat before another worker may take it over
+QUESTIONAIRRE_JOB_LEASE = float(os.environ.get('QUESTIONAIRRE_JOB_LEASE', 300))
+# Where run_questionairre_workers serves its generation metrics (/metrics); port 0 disables it
+QUESTIONAIRRE_WORKER_METRICS_HOST = os.environ.get('QUESTIONAIRRE_WORKER_METRICS_HOST', '127.0.0.1')
+QUESTIONAIRRE_WORKER_METRICS_PORT = int(os.environ.get('QUESTIONAIRRE_WORKER_METRICS_PORT', 9464))
+QUESTIONAIRRE_CHUNK_CONCURRENCY = int(os.environ.get('QUESTIONAIRRE_CHUNK_CONCURRENCY', 4))
+# Generate chunks on an event loop with Gemini's async client instead of a thread pool
+QUESTIONAIRRE_ASYNC_GENERATION = os.environ.get('QUESTIONAIRRE_ASYNC_GENERATION', 'False') == 'True'
+# Target number of page text tokens sent to the model per call, by detail level
+QUESTIONAIRRE_CHUNK_TOKENS = {
+    'basic': int(os.environ.get('QUESTIONAIRRE_BASIC_CHUNK_TOKENS', 6000)),
+    'intermediate': int(os.environ.get('QUESTIONAIRRE_INTERMEDIATE_CHUNK_TOKENS', 3500)),
+    'detailed': int(os.environ.get('QUESTIONAIRRE_DETAILED_CHUNK_TOKENS', 2000)),
+}
+# Fraction of token counts verified against Gemini's tokenizer, see study_space/tokens.py
+QUESTIONAIRRE_TOKEN_VERIFY_RATE = float(os.environ.get('QUESTIONAIRRE_TOKEN_VERIFY_RATE', 0.0))
+QUESTIONAIRRE_RESULT_CACHE = os.environ.get('QUESTIONAIRRE_RESULT_CACHE', 'True') == 'True'
+# Live progress streams, see study_space/streaming.py
+QUESTIONAIRRE_STREAM_POLL_INTERVAL = float(os.environ.get('QUESTIONAIRRE_STREAM_POLL_INTERVAL', 0.5))
+QUESTIONAIRRE_STREAM_KEEPALIVE = float(os.environ.get('QUESTIONAIRRE_STREAM_KEEPALIVE', 15))
+
+# Parallel PDF text extraction, see study_space/pdf_engine.py
+
+PDF_EXTRACTION = {
+    'WORKERS': int(os.environ.get('PDF_EXTRACTION_WORKERS', os.cpu_count() or 1)),
+    'PAGES_PER_TASK': int(os.environ.get('PDF_EXTRACTION_PAGES_PER_TASK', 8)),
+    'PAGE_TIMEOUT': float(os.environ.get('PDF_EXTRACTION_PAGE_TIMEOUT', 10)),
+    'MEMORY_LIMIT_MB': int(os.environ.get('PDF_EXTRACTION_MEMORY_LIMIT_MB', 0)) or None,
+    # Smaller PDFs are extracted in the calling process, faster than handing them to the pool
+    'MIN_PAGES': int(os.environ.get('PDF_EXTRACTION_MIN_PAGES', 64)),
+}
+
+# Model backend every generation call goes through, see study_space/llm.py. Set
+# LLM_BACKEND=study_space.llm.StubBackend to run without network.
+
+LLM_BACKEND = {
+    'BACKEND': os.environ.get('LLM_BACKEND', 'study_space.llm.GeminiBackend'),
+    'MODEL': os.environ.get('LLM_MODEL', 'gemini-2.0-flash'),
+    'OPTIONS': {
+        'timeout': float(os.environ.get('LLM_TIMEOUT', 120)),
+    },
+}
+if LLM_BACKEND['BACKEND'] == 'study_space.llm.GeminiBackend':
+    LLM_BACKEND['OPTIONS']['pool_size'] = int(os.environ.get('LLM_POOL_SIZE', 10))
+# Retries of rate limited and failed calls, with jittered exponential backoff
+LLM_RETRY = {
+    'ATTEMPTS': int(os.environ.get('LLM_RETRY_ATTEMPTS', 5)),
+    'BASE_DELAY': float(os.environ.get('LLM_RETRY_BASE_DELAY', 1.0)),
+    'MAX_DELAY': float(os.environ.get('LLM_RETRY_MAX_DELAY', 60.0)),
+}
+# Calls fail fast for RESET_TIMEOUT seconds after FAILURE_THRESHOLD consecutive failures
+LLM_CIRCUIT_BREAKER = {
+    'FAILURE_THRESHOLD': int(os.environ.get('LLM_CIRCUIT_FAILURE_THRESHOLD', 5)),
+    'RESET_TIMEOUT': float(os.environ.get('LLM_CIRCUIT_RESET_TIMEOUT', 30.0)),
+}
+
+# Limits on uploaded books, see study_space/validators.py
+
+BOOK_VALIDATION = {
+    'MAX_SIZE': int(os.environ.get('BOOK_MAX_SIZE', 100 * 1024 * 1024)),
+    'MAX_PAGES': int(os.environ.get('BOOK_MAX_PAGES', 100)),
+}
+
+# Resumable chunked uploads of books, see study_space/uploads.py
+
+BOOK_UPLOADS = {
+    # Storage directory the chunks of unfinished uploads are saved under.
+    'LOCATION': 'uploads',
+    'MAX_CHUNK_SIZE': int(os.environ.get('BOOK_UPLOAD_MAX_CHUNK_SIZE', 8 * 1024 * 1024)),
+    # Unfinished uploads untouched for this long are removed by clear_stale_book_uploads.
+    'EXPIRY_HOURS': float(os.environ.get('BOOK_UPLOAD_EXPIRY_HOURS', 24)),
+}
+
+# How questionnaire files are downloaded, see study_space/downloads.py. 'django' streams the
+# file with FileResponse (sendfile under servers that support wsgi.file_wrapper);
+# 'x-accel-redirect' (nginx) and 'x-sendfile' (Apache, lighttpd) let the front proxy send it;
+# 'redirect' sends clients to the storage's URL, such as a CDN in front of S3.
+
+QUESTIONAIRRE_DOWNLOADS = {
+    'MODE': os.environ.get('QUESTIONAIRRE_DOWNLOAD_MODE', 'django'),
+    # Internal location the proxy maps to MEDIA_ROOT, for 'x-accel-redirect'.
+    'ACCEL_REDIRECT_PREFIX': os.environ.get('QUESTIONAIRRE_ACCEL_REDIRECT_PREFIX', '/protected-media/'),
+}
+
+# Book and questionnaire listings, see study_space/listings.py. Pages are cached in
+# 'CACHE' for 'TIMEOUT' seconds (0 to not cache them); 'VERSION_CACHE' must be shared
+# by every process, as the versions in it tell them when a user's listings changed.
+
+LISTINGS = {
+    'PAGE_SIZE': int(os.environ.get('LISTING_PAGE_SIZE', 100)),
+    'MAX_PAGE_SIZE': int(os.environ.get('LISTING_MAX_PAGE_SIZE', 1000)),
+    'CACHE': 'default',
+    'VERSION_CACHE': 'shared',
+    'TIMEOUT': int(os.environ.get('LISTING_CACHE_TIMEOUT', 300)),
+}
+
+# Budgets for calls to Gemini, see study_space/rate_limit.py. They are shared by every process
+# through the GEMINI_RATE_LIMIT_CACHE alias, whose backend must support compare_and_set and
+# must not evict live buckets, so they are kept apart from other entries in 'rate_limit';
+# GEMINI_RATE_LIMIT_CACHE=process gives each process its own budgets instead.
+
+GEMINI_RATE_LIMIT = {
+    'REQUESTS_PER_MINUTE': int(os.environ.get('GEMINI_REQUESTS_PER_MINUTE', 15)),
+    'TOKENS_PER_MINUTE': int(os.environ.get('GEMINI_TOKENS_PER_MINUTE', 1000000)),
+    'USER_REQUESTS_PER_MINUTE': int(os.environ.get('GEMINI_USER_REQUESTS_PER_MINUTE', 10)),
+    'CACHE': None if os.environ.get('GEMINI_RATE_LIMIT_CACHE') == 'process' else os.environ.get('GEMINI_RATE_LIMIT_CACHE', 'rate_limit'),
+}
+
+# The default cache keeps recent entries in process, in front of the 'shared' cache used by
+# every process, see study_space/cache.py. 'shared' is a directory on the local disk, var/cache
+# unless SHARED_CACHE_LOCATION names another; it holds at most SHARED_CACHE_MAX_ENTRIES entries
+# and drops a third of them at random when full. 'rate_limit' is var/rate_limit, never culled.
+# Nodes that do not share a disk can point SHARED_CACHE_BACKEND to
+# 'study_space.cache.AtomicRedisCache' and SHARED_CACHE_LOCATION and RATE_LIMIT_CACHE_LOCATION
+# to redis:// URLs, the latter of a Redis that does not evict keys. Tests get fresh
+# directories, see study_pal/test_runner.py.
+
+TEST_RUNNER = 'study_pal.test_runner.DiscoverRunner'
+
+SHARED_CACHE_BACKEND = os.environ.get('SHARED_CACHE_BACKEND', 'study_space.cache.LockedFileBasedCache')
+FILE_BASED_SHARED_CACHE = SHARED_CACHE_BACKEND == 'study_space.cache.LockedFileBasedCache'
+
 CACHES = {
-    'default' : {
-        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
-        'LOCATION': 'my_cache_table',
-    }
+    'default': {
+        'BACKEND': 'study_space.cache.TieredCache',
+        'LOCATION': 'default',
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'LOCAL_MAX_ENTRIES': int(os.environ.get('LOCAL_CACHE_MAX_ENTRIES', 1024)),
+            'LOCAL_TIMEOUT': int(os.environ.get('LOCAL_CACHE_TIMEOUT', 5)),
+        },
+    },
+    'shared': {
+        'BACKEND': SHARED_CACHE_BACKEND,
+        'LOCATION': os.environ.get('SHARED_CACHE_LOCATION', os.path.join(BASE_DIR, 'var', 'cache')),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('SHARED_CACHE_MAX_ENTRIES', 10000)),
+            'CULL_FREQUENCY': 3,
+        } if FILE_BASED_SHARED_CACHE else {},
+    },
+    'rate_limit': {
+        'BACKEND': SHARED_CACHE_BACKEND,
+        'LOCATION': os.environ.get('RATE_LIMIT_CACHE_LOCATION', os.path.join(BASE_DIR, 'var', 'rate_limit')),
+        'OPTIONS': {'MAX_ENTRIES': None} if FILE_BASED_SHARED_CACHE else {},
+    },
 }
 
 SECURE_BROWSER_XSS_FILTER = True
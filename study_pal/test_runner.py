@@ -0,0 +1,36 @@
+import copy
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test import override_settings
+from django.test.runner import DiscoverRunner as BaseDiscoverRunner
+
+
+class DiscoverRunner(BaseDiscoverRunner):
+    """
+    Runs the tests with each file based cache in a fresh temporary directory.
+
+    The tests would otherwise read and write the entries at the configured locations, and
+    leave theirs behind.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.cache_override = None
+        cache_settings = copy.deepcopy(settings.CACHES)
+        self.cache_locations = []
+        for cache in cache_settings.values():
+            if cache['BACKEND'] == 'study_space.cache.LockedFileBasedCache':
+                cache['LOCATION'] = tempfile.mkdtemp(prefix='study_pal_cache_')
+                self.cache_locations.append(cache['LOCATION'])
+        if self.cache_locations:
+            self.cache_override = override_settings(CACHES=cache_settings)
+            self.cache_override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        if self.cache_override is not None:
+            self.cache_override.disable()
+            for location in self.cache_locations:
+                shutil.rmtree(location, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
@@ -4,3 +4,19 @@ from django.apps import AppConfig
 class StudySpaceConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'study_space'
+
+    def ready(self):
+        from django.db.models.signals import post_migrate
+
+        # Connects the receivers that drop cached listings, see study_space/listings.py.
+        from study_space import listings  # noqa: F401
+        from study_space.models import backfill_normalized_titles
+
+        post_migrate.connect(backfill_normalized_titles, sender=self)
+
+        # Fails at startup rather than on the first model call.
+        from django.conf import settings
+        from study_space.rate_limit import check_shared_cache
+
+        if settings.GEMINI_RATE_LIMIT.get('CACHE'):
+            check_shared_cache(settings.GEMINI_RATE_LIMIT['CACHE'])
@@ -0,0 +1,53 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from rest_framework.views import APIView
+
+
+class AsyncAPIView(APIView):
+    """
+    APIView whose handlers are coroutines.
+
+    Django runs the view natively on the event loop when served through ASGI, so a
+    request waiting on the database or a network call does not hold a worker thread;
+    under WSGI it still works, run through async_to_sync. Authentication, permission
+    and throttle checks touch the database and run in a thread through sync_to_async.
+    Every handler of a subclass must be 'async def'.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        """
+        Async counterpart of APIView.dispatch.
+
+        Parameters:
+        request (HttpRequest): The incoming request.
+        *args: Positional URL arguments.
+        **kwargs: Keyword URL arguments.
+
+        Returns:
+        Response: The finalized response.
+        """
+
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
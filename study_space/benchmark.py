@@ -0,0 +1,271 @@
+import math
+import random
+import sys
+import time
+import uuid
+from collections import namedtuple
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import transaction
+from django.test import override_settings
+
+from study_space.fast_serializers import BookReadSerializer, QuestionairreReadSerializer
+from study_space.llm import get_llm_backend
+from study_space.models import Book, Questionairre, normalize_title
+from study_space.serializers import BookSerializer, QuestionairreSerializer
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# Outcome of generating a questionnaire for one synthetic book.
+BookResult = namedtuple('BookResult', ['pages', 'seconds', 'llm_calls', 'chunks'])
+
+# Best time to serialize one listing with one kind of serializer.
+ListingResult = namedtuple('ListingResult', ['listing', 'serializer', 'rows', 'seconds'])
+
+WORDS = (
+    'cell membrane protein nucleus mitochondria energy enzyme reaction molecule '
+    'gradient transport division chromosome replication transcription ribosome '
+    'signal receptor pathway metabolism glucose oxygen respiration photosynthesis '
+    'organelle cytoplasm structure function regulation equilibrium diffusion'
+).split()
+
+
+def synthetic_pdf(pages, words_per_page=300, seed=0):
+    """
+    Builds a PDF of 'pages' pages of text, without any PDF library.
+
+    The words are drawn from a fixed vocabulary, so a seed always gives the same PDF
+    and different seeds give PDFs with different content hashes.
+
+    Parameters:
+    pages (int): Number of pages.
+    words_per_page (int, optional): Number of words on each page.
+    seed (int, optional): Seed of the word generator.
+
+    Returns:
+    bytes: The PDF.
+    """
+
+    rng = random.Random(seed)
+    objects = {3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"}
+    kids = []
+    number = 4
+    for _ in range(pages):
+        words = [rng.choice(WORDS) for _ in range(words_per_page)]
+        lines = [" ".join(words[i:i + 12]) for i in range(0, len(words), 12)]
+        text = ("BT /F1 10 Tf 14 TL 56 760 Td " + " T* ".join(f"({line}) Tj" for line in lines) + " ET").encode()
+        objects[number] = (
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (number + 1)
+        )
+        objects[number + 1] = b"<< /Length %d >>\nstream\n%s\nendstream" % (len(text), text)
+        kids.append(number)
+        number += 2
+    objects[1] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    objects[2] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % kid for kid in kids), pages)
+
+    pdf = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for key in sorted(objects):
+        offsets[key] = len(pdf)
+        pdf += b"%d 0 obj\n%s\nendobj\n" % (key, objects[key])
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % number
+    for key in range(1, number):
+        pdf += b"%010d 00000 n \n" % offsets[key]
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (number, xref)
+    return bytes(pdf)
+
+
+def percentile(values, percent):
+    """
+    Returns the nearest-rank percentile of a list of values.
+
+    Parameters:
+    values (list): The values.
+    percent (float): The percentile, between 0 and 100.
+
+    Returns:
+    float: The percentile, or 0.0 if there are no values.
+    """
+
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(math.ceil(percent / 100 * len(ordered)) - 1, 0)]
+
+
+def peak_rss_mb():
+    """
+    Returns the peak resident set size of this process.
+
+    Extraction worker processes are not included; they are started by a forkserver and
+    are not children of this process.
+
+    Returns:
+    float or None: Megabytes, or None where the platform does not report it.
+    """
+
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def run_book(user, pages, seed, detail_level, words_per_page):
+    """
+    Uploads a synthetic book and generates its questionnaire, end to end.
+
+    Runs the same path as the API: upload validation, text extraction, chunk planning,
+    generation and writing the file. The files written are removed afterwards.
+
+    Parameters:
+    user (User): The owner of the book.
+    pages (int): Number of pages of the book.
+    seed (int): Seed of the book's content.
+    detail_level (str): The detail level to generate at.
+    words_per_page (int): Number of words on each page.
+
+    Returns:
+    BookResult: The timings of the book.
+    """
+
+    backend = get_llm_backend()
+    calls = len(backend.prompts)
+    content = synthetic_pdf(pages, words_per_page, seed)
+
+    started = time.perf_counter()
+    book_serializer = BookSerializer(data={
+        'title': f"benchmark {pages} pages {seed}",
+        'file': SimpleUploadedFile(f"benchmark_{seed}.pdf", content, content_type='application/pdf'),
+    })
+    book_serializer.is_valid(raise_exception=True)
+    book = book_serializer.save(user=user)
+    questionairre = QuestionairreSerializer().create({'user': user, 'book': book, 'detail_level': detail_level})
+    seconds = time.perf_counter() - started
+
+    result = BookResult(pages, seconds, len(backend.prompts) - calls, questionairre.questionairre_chunk.count())
+    questionairre.question_answers_file.delete(save=False)
+    book.file.delete(save=False)
+    return result
+
+
+def run_benchmark(page_counts, runs=3, detail_level='basic', latency=0.0, words_per_page=300, concurrency=None):
+    """
+    Generates questionnaires for synthetic books against a local fake LLM.
+
+    Every book has its own content, and the result cache is off, so each run does the
+    full work. The model is replaced by StubBackend answering after 'latency' seconds
+    and the rate limit is lifted. Database changes are rolled back at the end.
+
+    Parameters:
+    page_counts (list): The book sizes to benchmark, in pages.
+    runs (int, optional): Number of books of each size.
+    detail_level (str, optional): The detail level to generate at.
+    latency (float, optional): Seconds the fake LLM takes per call.
+    words_per_page (int, optional): Number of words on each page.
+    concurrency (int, optional): QUESTIONAIRRE_CHUNK_CONCURRENCY to run with, or None for the setting.
+
+    Returns:
+    list: A BookResult per book, in the order they were generated.
+    """
+
+    overrides = {
+        'LLM_BACKEND': {'BACKEND': 'study_space.llm.StubBackend', 'MODEL': 'stub', 'OPTIONS': {'latency': latency}},
+        'GEMINI_RATE_LIMIT': {'REQUESTS_PER_MINUTE': 10 ** 9},
+        'QUESTIONAIRRE_RESULT_CACHE': False,
+    }
+    if concurrency:
+        overrides['QUESTIONAIRRE_CHUNK_CONCURRENCY'] = concurrency
+
+    results = []
+    with override_settings(**overrides), transaction.atomic():
+        user = User.objects.create_user(username=f"benchmark-{uuid.uuid4().hex[:8]}")
+        for pages in page_counts:
+            for run in range(runs):
+                results.append(run_book(user, pages, pages * 1000 + run, detail_level, words_per_page))
+        transaction.set_rollback(True)
+    return results
+
+
+def summarize(results):
+    """
+    Summarizes benchmark results.
+
+    Parameters:
+    results (list): BookResults, from run_benchmark.
+
+    Returns:
+    dict: Number of books and pages, p50 and p95 seconds per book, pages per second,
+    LLM calls per book, and peak RSS of the process in MB.
+    """
+
+    seconds = [result.seconds for result in results]
+    pages = sum(result.pages for result in results)
+    return {
+        'books': len(results),
+        'pages': pages,
+        'p50_seconds': percentile(seconds, 50),
+        'p95_seconds': percentile(seconds, 95),
+        'pages_per_second': pages / sum(seconds) if sum(seconds) else 0.0,
+        'calls_per_book': sum(result.llm_calls for result in results) / len(results) if results else 0.0,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def run_listing_benchmark(rows=10000, runs=3):
+    """
+    Times serializing a user's book and questionnaire listings of 'rows' rows each.
+
+    Each listing is serialized with its ModelSerializer, as the listing endpoints did, and
+    with its ReadSerializer, queries included; the best of 'runs' is kept. Database
+    changes are rolled back at the end.
+
+    Parameters:
+    rows (int, optional): Number of books, and of questionnaires.
+    runs (int, optional): Number of times each listing is serialized with each serializer.
+
+    Returns:
+    list: A ListingResult per listing and serializer.
+    """
+
+    results = []
+    with transaction.atomic():
+        user = User.objects.create_user(username=f"benchmark-{uuid.uuid4().hex[:8]}")
+        Book.objects.bulk_create([
+            Book(title=f"benchmark {i}", normalized_title=normalize_title(f"benchmark {i}"), user=user,
+                 file=f"files/benchmark_{i}.pdf", content_hash=f"{i:064x}")
+            for i in range(rows)
+        ], batch_size=1000)
+        # Some databases do not return the ids of bulk created rows.
+        Questionairre.objects.bulk_create([
+            Questionairre(book=book, user=user, question_answers_file=f"questions/benchmark_{i}.txt",
+                          timings={'generation': 1.0, 'llm_call': 0.5})
+            for i, book in enumerate(Book.objects.filter(user=user).only('pk'))
+        ], batch_size=1000)
+
+        listings = [
+            ('books', Book.objects.filter(user=user), BookSerializer, BookReadSerializer),
+            ('questionairres', Questionairre.objects.filter(user=user).select_related('book'),
+             QuestionairreSerializer, QuestionairreReadSerializer),
+        ]
+        for listing, queryset, model_serializer, read_serializer in listings:
+            serializers = [
+                ('model', lambda rows: model_serializer(rows, many=True).data),
+                ('read', lambda rows: read_serializer().serialize(rows)),
+            ]
+            for name, serialize in serializers:
+                seconds = []
+                for _ in range(runs):
+                    started = time.perf_counter()
+                    serialize(queryset.all())
+                    seconds.append(time.perf_counter() - started)
+                results.append(ListingResult(listing, name, rows, min(seconds)))
+        transaction.set_rollback(True)
+    return results
@@ -0,0 +1,288 @@
+import os
+import pickle
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+from cachetools import TTLCache
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.redis import RedisCache
+from django.core.files import locks
+
+MISSING = object()
+
+# Local tiers are shared by the cache instances of one alias in a process, as
+# LocMemCache does, since Django creates one cache instance per thread.
+local_tiers = {}
+local_tier_locks = {}
+local_tiers_lock = threading.Lock()
+
+
+class LockedFileBasedCache(FileBasedCache):
+    """
+    A file based cache whose add, incr and compare_and_set are atomic across processes.
+
+    Each of these holds an exclusive lock on one of 'lock_stripes' lock files, picked by
+    the key's file, while it reads and writes the key. Plain set and delete do not take
+    the lock, so keys updated concurrently should only be updated with these methods.
+
+    OPTIONS['MAX_ENTRIES'] set to None turns culling off: entries are only removed once
+    they expired and are read, or when they are deleted. State that must not be lost
+    while it is live, such as rate limit buckets, is kept in such a cache.
+    """
+
+    lock_stripes = 64
+
+    def __init__(self, dir, params):
+        super().__init__(dir, params)
+        self.culled = params.get('OPTIONS', {}).get('MAX_ENTRIES', 300) is not None
+
+    def _cull(self):
+        if self.culled:
+            super()._cull()
+
+    @contextmanager
+    def locked(self, key, version=None):
+        """
+        Holds the lock of a key.
+
+        Parameters:
+        key (str): The key.
+        version (int, optional): The key's version.
+        """
+
+        stripe = int(os.path.basename(self._key_to_file(key, version))[:8], 16) % self.lock_stripes
+        directory = os.path.join(self._dir, 'locks')
+        os.makedirs(directory, 0o700, exist_ok=True)
+        with open(os.path.join(directory, f'{stripe}.lock'), 'ab') as f:
+            locks.lock(f, locks.LOCK_EX)
+            try:
+                yield
+            finally:
+                locks.unlock(f)
+
+    def read(self, key, version=None):
+        """
+        Reads a key with the time it expires.
+
+        Returns:
+        tuple or None: The value and the expiry timestamp (None if it never expires), or None if the key is missing.
+        """
+
+        try:
+            with open(self._key_to_file(key, version), 'rb') as f:
+                try:
+                    expiry = pickle.load(f)
+                except EOFError:
+                    return None
+                if expiry is not None and expiry < time.time():
+                    return None
+                return pickle.loads(zlib.decompress(f.read())), expiry
+        except FileNotFoundError:
+            return None
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        with self.locked(key, version):
+            return super().add(key, value, timeout, version)
+
+    def incr(self, key, delta=1, version=None):
+        with self.locked(key, version):
+            stored = self.read(key, version)
+            if stored is None:
+                raise ValueError("Key '%s' not found" % key)
+            value, expiry = stored
+            # Unlike Django's incr, the key keeps the time it expires, so counters
+            # of a fixed window still end with the window.
+            timeout = None if expiry is None else max(expiry - time.time(), 0.001)
+            self.set(key, value + delta, timeout, version)
+            return value + delta
+
+    def compare_and_set(self, key, expected, value, timeout=DEFAULT_TIMEOUT, version=None):
+        """
+        Sets a key to 'value' if it holds 'expected'.
+
+        Parameters:
+        key (str): The key.
+        expected: The value the key must hold, None if it must be missing.
+        value: The new value.
+        timeout (int, optional): Seconds until the key expires.
+        version (int, optional): The key's version.
+
+        Returns:
+        bool: Whether the key was set.
+        """
+
+        with self.locked(key, version):
+            if self.get(key, version=version) != expected:
+                return False
+            self.set(key, value, timeout, version)
+            return True
+
+
+class AtomicRedisCache(RedisCache):
+    """
+    Django's RedisCache with an atomic compare_and_set, for sharing the cache between nodes.
+
+    compare_and_set WATCHes the key, compares its value and sets it in a MULTI
+    transaction, which Redis aborts if the key changed in between.
+    """
+
+    def compare_and_set(self, key, expected, value, timeout=DEFAULT_TIMEOUT, version=None):
+        """
+        Sets a key to 'value' if it holds 'expected'.
+
+        Parameters:
+        key (str): The key.
+        expected: The value the key must hold, None if it must be missing.
+        value: The new value.
+        timeout (int, optional): Seconds until the key expires.
+        version (int, optional): The key's version.
+
+        Returns:
+        bool: Whether the key was set; False also if the key changed while comparing.
+        """
+
+        key = self.make_and_validate_key(key, version=version)
+        timeout = self.get_backend_timeout(timeout)
+        serializer = self._cache._serializer
+        with self._cache.get_client(key, write=True).pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                current = pipe.get(key)
+                if (None if current is None else serializer.loads(current)) != expected:
+                    return False
+                pipe.multi()
+                if timeout == 0:
+                    pipe.delete(key)
+                else:
+                    pipe.set(key, serializer.dumps(value), ex=timeout)
+                pipe.execute()
+                return True
+            except self._cache._lib.WatchError:
+                return False
+
+
+def supports_compare_and_set(cache):
+    """
+    Returns whether a cache has an atomic compare_and_set.
+
+    Parameters:
+    cache (BaseCache): The cache.
+
+    Returns:
+    bool: True for LockedFileBasedCache, AtomicRedisCache and a TieredCache in front of either.
+    """
+
+    if isinstance(cache, TieredCache):
+        cache = cache.shared
+    return callable(getattr(cache, 'compare_and_set', None))
+
+
+class TieredCache(BaseCache):
+    """
+    A bounded in-process LRU/TTL tier in front of a shared cache.
+
+    Reads are served from the local tier for up to OPTIONS['LOCAL_TIMEOUT'] seconds
+    (default 5), so a value changed by another process may be seen that much later;
+    writes go to both tiers. incr and compare_and_set always run on the shared cache, so
+    they are atomic across processes when the shared cache's are: LockedFileBasedCache
+    and AtomicRedisCache have both, Django's RedisCache only incr.
+    LOCATION names the local tier and OPTIONS['SHARED'] is the alias of the shared cache
+    (default 'shared'). OPTIONS['LOCAL_MAX_ENTRIES'] bounds the local tier (default 1024).
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.shared_alias = options.get('SHARED', 'shared')
+        with local_tiers_lock:
+            self.local = local_tiers.setdefault(location, TTLCache(
+                maxsize=options.get('LOCAL_MAX_ENTRIES', 1024),
+                ttl=options.get('LOCAL_TIMEOUT', 5),
+            ))
+            self.local_lock = local_tier_locks.setdefault(location, threading.Lock())
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    def keep(self, key, value, version=None):
+        with self.local_lock:
+            self.local[self.make_and_validate_key(key, version)] = value
+
+    def forget(self, key, version=None):
+        with self.local_lock:
+            self.local.pop(self.make_and_validate_key(key, version), None)
+
+    def get(self, key, default=None, version=None):
+        with self.local_lock:
+            value = self.local.get(self.make_and_validate_key(key, version), MISSING)
+        if value is MISSING:
+            value = self.shared.get(key, MISSING, version=version)
+            if value is MISSING:
+                return default
+            self.keep(key, value, version)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version)
+        if timeout is not DEFAULT_TIMEOUT and timeout is not None and timeout <= 0:
+            self.forget(key, version)
+        else:
+            self.keep(key, value, version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        if self.shared.add(key, value, timeout, version):
+            self.keep(key, value, version)
+            return True
+        self.forget(key, version)
+        return False
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version)
+
+    def delete(self, key, version=None):
+        self.forget(key, version)
+        return self.shared.delete(key, version)
+
+    def incr(self, key, delta=1, version=None):
+        self.forget(key, version)
+        value = self.shared.incr(key, delta, version)
+        self.keep(key, value, version)
+        return value
+
+    def compare_and_set(self, key, expected, value, timeout=DEFAULT_TIMEOUT, version=None):
+        """
+        Sets a key to 'value' if it holds 'expected', atomically on the shared cache.
+
+        Parameters:
+        key (str): The key.
+        expected: The value the key must hold, None if it must be missing.
+        value: The new value.
+        timeout (int, optional): Seconds until the key expires.
+        version (int, optional): The key's version.
+
+        Returns:
+        bool: Whether the key was set.
+
+        Raises:
+        NotImplementedError: If the shared cache has no compare_and_set.
+        """
+
+        compare_and_set = getattr(self.shared, 'compare_and_set', None)
+        if compare_and_set is None:
+            raise NotImplementedError(f"The '{self.shared_alias}' cache does not support compare_and_set")
+        if compare_and_set(key, expected, value, timeout, version):
+            self.keep(key, value, version)
+            return True
+        # The local value is stale, the next get reads the shared one.
+        self.forget(key, version)
+        return False
+
+    def clear(self):
+        with self.local_lock:
+            self.local.clear()
+        self.shared.clear()
@@ -0,0 +1,132 @@
+from collections import namedtuple
+
+from study_space.tokens import CHARS_PER_TOKEN, estimate_tokens
+
+
+# A chunk of a book sent to the model in one call. Pages are 1-indexed and inclusive;
+# 'part' numbers the pieces of a page too large for one call and is 0 otherwise.
+Chunk = namedtuple('Chunk', ['start_page', 'end_page', 'part', 'text'])
+
+def split_text(text, budget):
+    """
+    Splits a text into pieces of at most 'budget' estimated tokens, between words.
+
+    Words too long for a piece of their own are cut every 'budget' tokens worth of characters.
+
+    Parameters:
+    text (str): The text to split.
+    budget (int): The maximum number of tokens per piece.
+
+    Returns:
+    list: The pieces, in order.
+    """
+
+    pieces = []
+    words = []
+    tokens = 0
+    max_chars = max(budget * CHARS_PER_TOKEN, 1)
+
+    for word in text.split():
+        word_tokens = estimate_tokens(word)
+        if words and tokens + word_tokens > budget:
+            pieces.append(" ".join(words))
+            words = []
+            tokens = 0
+        if word_tokens > budget:
+            pieces.extend(word[i:i + max_chars] for i in range(0, len(word), max_chars))
+            continue
+        words.append(word)
+        tokens += word_tokens
+    if words:
+        pieces.append(" ".join(words))
+    return pieces
+
+
+def iter_chunks(page_texts, budget):
+    """
+    Packs a stream of pages into chunks of about 'budget' estimated tokens.
+
+    Consecutive pages are added to a chunk until the next one would exceed the budget.
+    Pages without text are skipped and pages larger than the budget are split into parts
+    of their own. The plan only depends on the pages and the budget, so the same book
+    always gets the same chunks. Pages are consumed one at a time and each chunk's text
+    is joined once when it is complete, so the work is linear in the size of the book.
+
+    Parameters:
+    page_texts (iterable): The text of each page of the book, in page order.
+    budget (int): The target number of tokens per chunk.
+
+    Yields:
+    Chunk: The chunks, in page order.
+    """
+
+    numbers = []
+    texts = []
+    tokens = 0
+
+    for number, text in enumerate(page_texts, start=1):
+        if not text.strip():
+            continue
+        page_tokens = estimate_tokens(text)
+        if texts and (page_tokens > budget or tokens + page_tokens > budget):
+            yield Chunk(numbers[0], numbers[-1], 0, " ".join(texts))
+            numbers = []
+            texts = []
+            tokens = 0
+        if page_tokens > budget:
+            for part, piece in enumerate(split_text(text, budget), start=1):
+                yield Chunk(number, number, part, piece)
+            continue
+        numbers.append(number)
+        texts.append(text)
+        tokens += page_tokens
+
+    if texts:
+        yield Chunk(numbers[0], numbers[-1], 0, " ".join(texts))
+
+
+def plan_chunks(page_texts, budget):
+    """
+    Returns the chunk plan of a book, see iter_chunks.
+
+    Parameters:
+    page_texts (iterable): The text of each page of the book, in page order.
+    budget (int): The target number of tokens per chunk.
+
+    Returns:
+    list: The chunks, in page order.
+    """
+
+    return list(iter_chunks(page_texts, budget))
+
+
+def select_chunks(chunks, page_texts, start_page, end_page):
+    """
+    Returns the chunks of a plan covering a page range.
+
+    Chunks inside the range are kept as they are, so overlapping ranges of the same book
+    share them; chunks crossing an edge of the range are cut down to the pages inside it.
+
+    Parameters:
+    chunks (list): The book's chunk plan, from plan_chunks.
+    page_texts (list): The text of each page of the book, in page order.
+    start_page (int): First page of the range (1-indexed).
+    end_page (int): Last page of the range (1-indexed, inclusive).
+
+    Returns:
+    list: The chunks, in page order.
+    """
+
+    selected = []
+    for chunk in chunks:
+        if chunk.end_page < start_page or chunk.start_page > end_page:
+            continue
+        if chunk.start_page >= start_page and chunk.end_page <= end_page:
+            selected.append(chunk)
+            continue
+        first = max(chunk.start_page, start_page)
+        last = min(chunk.end_page, end_page)
+        text = " ".join(text for text in page_texts[first - 1:last] if text.strip())
+        if text:
+            selected.append(Chunk(first, last, 0, text))
+    return selected
@@ -0,0 +1,168 @@
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import FileResponse, HttpResponse, HttpResponseRedirect
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class FileRange:
+    """
+    Reads at most 'length' bytes of a file from its current position.
+
+    It keeps the file's fileno so servers with sendfile, such as gunicorn, still send the
+    range straight from the file: they start at the file's offset and send Content-Length
+    bytes.
+    """
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+        self.name = file.name
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def file_etag(modified, size):
+    """
+    Returns the ETag of a file, from its modification time and size.
+
+    Parameters:
+    modified (datetime): The file's modification time.
+    size (int): The file's size.
+
+    Returns:
+    str: The quoted ETag.
+    """
+
+    return quote_etag(f"{round(modified.timestamp() * 1000000):x}-{size:x}")
+
+
+def requested_range(request, etag, last_modified, size):
+    """
+    Returns the byte range a request asks for.
+
+    Only single ranges are served; a header with several ranges, or one that cannot be
+    parsed, is ignored and the whole file sent, as RFC 9110 allows. So is a range whose
+    If-Range does not match the file.
+
+    Parameters:
+    request (HttpRequest): The request.
+    etag (str): The file's ETag.
+    last_modified (int): The file's modification time, in seconds since the epoch.
+    size (int): The file's size.
+
+    Returns:
+    tuple or None: The first and last byte of the range, or None for the whole file.
+
+    Raises:
+    ValueError: If the range does not overlap the file.
+    """
+
+    match = RANGE_RE.match(request.META.get('HTTP_RANGE', '').replace(' ', ''))
+    if not match or match.groups() == ('', ''):
+        return None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range and if_range != etag and parse_http_date_safe(if_range) != last_modified:
+        return None
+
+    first, last = match.groups()
+    if not first:
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError("empty suffix range")
+        return max(size - length, 0), size - 1
+    first = int(first)
+    last = min(int(last), size - 1) if last else size - 1
+    if first >= size or first > last:
+        raise ValueError("range starts past the end of the file")
+    return first, last
+
+
+def file_download(request, file, content_type='text/plain'):
+    """
+    Returns a response downloading a stored file as an attachment.
+
+    Depending on QUESTIONAIRRE_DOWNLOADS['MODE'] the file is sent by the front proxy,
+    through an 'X-Accel-Redirect' (nginx) or 'X-Sendfile' header, the client is redirected
+    to the storage's URL for it ('redirect', for object stores and CDNs), or it is streamed
+    by Django with FileResponse. FileResponse hands the open file to the server's
+    wsgi.file_wrapper, which sends local files with sendfile where the server supports it.
+    It answers conditional requests (ETag, If-None-Match, If-Modified-Since) and single
+    byte ranges itself. 'x-sendfile' only works with storages on the local filesystem.
+
+    Blocking: it queries and opens the file in storage.
+
+    Parameters:
+    request (HttpRequest): The request.
+    file (FieldFile): The file to download.
+    content_type (str, optional): The Content-Type of the response.
+
+    Returns:
+    HttpResponse: The download (200), a range of it (206), a redirect to it (302), 304, 412 or 416.
+
+    Raises:
+    ImproperlyConfigured: If the download mode is unknown.
+    """
+
+    filename = os.path.basename(file.name)
+    mode = settings.QUESTIONAIRRE_DOWNLOADS['MODE']
+    if mode == 'redirect':
+        return HttpResponseRedirect(file.url)
+    if mode in ('x-accel-redirect', 'x-sendfile'):
+        response = HttpResponse(content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        if mode == 'x-accel-redirect':
+            prefix = settings.QUESTIONAIRRE_DOWNLOADS['ACCEL_REDIRECT_PREFIX'].rstrip('/')
+            response['X-Accel-Redirect'] = quote(f"{prefix}/{file.name}")
+        else:
+            response['X-Sendfile'] = file.path
+        return response
+    if mode != 'django':
+        raise ImproperlyConfigured(f"Unknown QUESTIONAIRRE_DOWNLOADS mode: {mode}")
+
+    size = file.storage.size(file.name)
+    modified = file.storage.get_modified_time(file.name)
+    etag = file_etag(modified, size)
+    last_modified = int(modified.timestamp())
+    conditional = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if conditional is not None:
+        return conditional
+
+    try:
+        byte_range = requested_range(request, etag, last_modified, size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f"bytes */{size}"
+        return response
+
+    f = file.storage.open(file.name, 'rb')
+    if byte_range is None:
+        response = FileResponse(f, as_attachment=True, filename=filename, content_type=content_type)
+    else:
+        first, last = byte_range
+        f.seek(first)
+        response = FileResponse(FileRange(f, last - first + 1), as_attachment=True, filename=filename, content_type=content_type)
+        response.status_code = 206
+        response['Content-Range'] = f"bytes {first}-{last}/{size}"
+        response['Content-Length'] = last - first + 1
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
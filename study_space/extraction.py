@@ -0,0 +1,98 @@
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from study_space.metrics import span
+from study_space.models import PageText
+from study_space.pdf_engine import iter_page_texts
+
+
+def pdf_source(file):
+    """
+    Returns something the extraction engine's worker processes can open.
+
+    Parameters:
+    file (File or str): The PDF file, or a path to it.
+
+    Returns:
+    str or bytes: The path of the file if it is on the local filesystem, otherwise its content.
+    """
+
+    if isinstance(file, str):
+        return file
+    try:
+        return file.path
+    except (AttributeError, NotImplementedError, ValueError):
+        file.seek(0)
+        return file.read()
+
+
+def iter_extracted_texts(file):
+    """
+    Yields the text of every page of a PDF, extracted in parallel by the PDF engine.
+
+    Parameters:
+    file (File or str): The PDF file, or a path to it.
+
+    Yields:
+    str: The text of each page, in page order.
+    """
+
+    options = settings.PDF_EXTRACTION
+    yield from iter_page_texts(
+        pdf_source(file),
+        workers=options['WORKERS'],
+        pages_per_task=options['PAGES_PER_TASK'],
+        page_timeout=options['PAGE_TIMEOUT'],
+        memory_limit_mb=options['MEMORY_LIMIT_MB'],
+        min_pages=options['MIN_PAGES'],
+    )
+
+
+def extract_page_texts(file):
+    """
+    Extracts the text of every page of a PDF.
+
+    Parameters:
+    file (File or str): The PDF file, or a path to it.
+
+    Returns:
+    list: The text of each page, in page order.
+    """
+
+    return list(iter_extracted_texts(file))
+
+
+def get_page_texts(file, content_hash=None):
+    """
+    Returns the text of every page of a PDF, using the per-page text index.
+
+    The first call for a given content hash extracts the text and stores it in PageText;
+    later calls read it back with a single query instead of parsing the PDF again.
+
+    Parameters:
+    file (File): The PDF file, or a path to it.
+    content_hash (str, optional): The SHA-256 of the PDF. Without it the index is bypassed.
+
+    Returns:
+    list: The text of each page, in page order.
+    """
+
+    if not content_hash:
+        return extract_page_texts(file)
+
+    with span('page_index'):
+        texts = list(PageText.objects.filter(content_hash=content_hash).order_by('page_number').values_list('text', flat=True))
+    if texts:
+        return texts
+
+    texts = extract_page_texts(file)
+    try:
+        with transaction.atomic():
+            PageText.objects.bulk_create([
+                PageText(content_hash=content_hash, page_number=number, text=text)
+                for number, text in enumerate(texts, start=1)
+            ])
+    except IntegrityError:
+        # Another worker indexed the same file first.
+        pass
+    return texts
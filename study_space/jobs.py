@@ -0,0 +1,398 @@
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import serializers
+
+from study_space.models import Questionairre, QuestionairreJob
+
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseLost(Exception):
+    """Raised when a job's outcome is about to be stored after another worker took it over."""
+
+    def __init__(self, job):
+        super().__init__(f"questionairre job {job.pk} was taken over by another worker")
+        self.job = job
+
+
+def enqueue_questionairre_job(user, book, detail_level='basic', start_page=None, end_page=None):
+    """
+    Queues a questionnaire generation job.
+
+    The job is stored in the database and picked up by a QuestionairreWorkerPool. When
+    QUESTIONAIRRE_JOBS_EAGER is enabled the job is run inline instead, which is useful
+    for local development without a running worker.
+
+    Parameters:
+    user (User): The owner of the questionnaire.
+    book (Book): The book to generate questions from.
+    detail_level (str, optional): The detail level ('basic', 'intermediate', 'detailed').
+    start_page (int, optional): Starting page for question generation.
+    end_page (int, optional): Ending page for question generation.
+
+    Returns:
+    QuestionairreJob: The queued (or, in eager mode, finished) job.
+    """
+
+    job = QuestionairreJob.objects.create(
+        user=user,
+        book=book,
+        detail_level=detail_level,
+        start_page=start_page,
+        end_page=end_page,
+    )
+    if settings.QUESTIONAIRRE_JOBS_EAGER:
+        claimed = claim_next_job(pk=job.pk)
+        if claimed is not None:
+            run_job(claimed)
+        job.refresh_from_db()
+    return job
+
+
+def requeue_expired_jobs():
+    """
+    Queues again the running jobs whose lease has expired.
+
+    A worker renews the lease of its job every third of QUESTIONAIRRE_JOB_LEASE, so a job
+    whose lease expired was left by a worker that crashed, was killed or hung. The job
+    keeps its partial questionnaire, so only the remaining chunks are generated again.
+
+    Returns:
+    int: The number of jobs queued again.
+    """
+
+    expired = timezone.now() - timedelta(seconds=settings.QUESTIONAIRRE_JOB_LEASE)
+    stale = QuestionairreJob.objects.filter(
+        Q(heartbeat_at__lt=expired) | Q(heartbeat_at__isnull=True, updated_at__lt=expired),
+        status='running',
+    )
+    # Every poll of every worker runs this, so the write is only made when there is one.
+    if not stale.exists():
+        return 0
+    requeued = stale.update(status='queued', claimed_at=None, heartbeat_at=None)
+    if requeued:
+        logger.warning("Queued %s questionairre job(s) again after their lease expired", requeued)
+    return requeued
+
+
+def claim_next_job(pk=None):
+    """
+    Claims the oldest queued job for the calling worker.
+
+    The claim is a conditional UPDATE on the job status, so two workers racing for the
+    same row cannot both win it, on any database backend. Running jobs whose lease has
+    expired are queued again first, so they can be claimed too.
+
+    Parameters:
+    pk (int, optional): Claim this specific job instead of the oldest one.
+
+    Returns:
+    QuestionairreJob or None: The claimed job, now marked as running, or None if the queue is empty.
+    """
+
+    requeue_expired_jobs()
+    queued = QuestionairreJob.objects.filter(status='queued')
+    if pk is not None:
+        queued = queued.filter(pk=pk)
+
+    for candidate in queued.order_by('created_at', 'pk').values_list('pk', flat=True)[:10]:
+        now = timezone.now()
+        claimed = QuestionairreJob.objects.filter(pk=candidate, status='queued').update(
+            status='running', claimed_at=now, heartbeat_at=now,
+        )
+        if claimed:
+            return QuestionairreJob.objects.select_related('book', 'user', 'questionairre').get(pk=candidate)
+    return None
+
+
+def leased(job):
+    """
+    Returns the running job, as long as it is still held under the caller's claim.
+
+    The claim time identifies the claim, so a worker whose job was taken over after its
+    lease expired no longer matches.
+
+    Parameters:
+    job (QuestionairreJob): A job returned by claim_next_job.
+
+    Returns:
+    QuerySet: The job, or nothing once the lease is lost.
+    """
+
+    return QuestionairreJob.objects.filter(pk=job.pk, status='running', claimed_at=job.claimed_at)
+
+
+def renew_lease(job):
+    """
+    Renews the lease of a running job.
+
+    Parameters:
+    job (QuestionairreJob): A job returned by claim_next_job.
+
+    Returns:
+    bool: True if the lease was renewed, False if the job was taken over or finished.
+    """
+
+    return bool(leased(job).update(heartbeat_at=timezone.now()))
+
+
+def complete_job(job):
+    """
+    Marks a running job complete, as long as it is still held under the caller's claim.
+
+    Called in the transaction that attaches the questionnaire's file, so a worker that
+    lost its lease cannot complete the questionnaire of the worker that took it over.
+
+    Parameters:
+    job (QuestionairreJob): A job returned by claim_next_job.
+
+    Returns:
+    bool: True if the job was marked complete, False if its lease was lost.
+    """
+
+    if not leased(job).update(status='complete', error='', updated_at=timezone.now()):
+        return False
+    job.status, job.error = 'complete', ''
+    return True
+
+
+class LeaseHeartbeat:
+    """
+    Renews the lease of a job from a background thread while the job runs.
+
+    Usage:
+        with LeaseHeartbeat(job):
+            ...
+    """
+
+    def __init__(self, job, interval=None):
+        self.job = job
+        self.interval = interval if interval is not None else settings.QUESTIONAIRRE_JOB_LEASE / 3
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.beat, name=f"questionairre-job-{job.pk}-heartbeat", daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop_event.set()
+        self.thread.join()
+
+    def beat(self):
+        try:
+            while not self.stop_event.wait(self.interval):
+                try:
+                    if not renew_lease(self.job):
+                        logger.warning("Questionairre job %s lost its lease", self.job.pk)
+                        return
+                except Exception:
+                    logger.exception("Unable to renew the lease of questionairre job %s", self.job.pk)
+        finally:
+            connection.close()
+
+
+def error_message(error):
+    """
+    Flattens an exception raised during generation into a message stored on the job.
+
+    Parameters:
+    error (Exception): The exception raised by the generation.
+
+    Returns:
+    str: A human readable error message.
+    """
+
+    if isinstance(error, serializers.ValidationError):
+        detail = error.detail
+        if isinstance(detail, dict):
+            detail = [message for messages in detail.values() for message in messages]
+        if isinstance(detail, list):
+            return ' '.join(str(message) for message in detail)
+        return str(detail)
+    return str(error)
+
+
+def run_job(job):
+    """
+    Runs a claimed job to completion.
+
+    Generates the questionnaire through QuestionairreSerializer and records the outcome
+    on the job. The questionnaire is created as partial and linked to the job before
+    generation starts, so the chunks generated so far survive a failure and a retried
+    job only generates the rest. Failures are stored on the job instead of being raised
+    so a worker thread can carry on with the next job. The job's lease is renewed while
+    it runs, and its outcome is only stored if the job was not taken over meanwhile: the
+    serializer completes the job with the questionnaire, see complete_job.
+
+    Parameters:
+    job (QuestionairreJob): A job previously returned by claim_next_job.
+
+    Returns:
+    QuestionairreJob: The finished job.
+    """
+
+    from study_space.serializers import QuestionairreSerializer
+
+    if job.questionairre is None:
+        with transaction.atomic():
+            job.questionairre = Questionairre.objects.create(
+                user=job.user,
+                book=job.book,
+                detail_level=job.detail_level,
+                status='partial',
+            )
+            job.save(update_fields=['questionairre', 'updated_at'])
+
+    serializer = QuestionairreSerializer(context={'job': job, 'questionairre': job.questionairre})
+    try:
+        with LeaseHeartbeat(job):
+            serializer.create({
+                'user': job.user,
+                'book': job.book,
+                'detail_level': job.detail_level,
+                'start_page': job.start_page,
+                'end_page': job.end_page,
+            })
+    except LeaseLost:
+        logger.warning("Questionairre job %s was taken over by another worker, dropping its complete outcome", job.pk)
+        job.refresh_from_db()
+    except Exception as e:
+        logger.exception("Questionairre job %s failed", job.pk)
+        if not leased(job).update(status='failed', error=error_message(e), updated_at=timezone.now()):
+            logger.warning("Questionairre job %s was taken over by another worker, dropping its failed outcome", job.pk)
+        job.refresh_from_db()
+    return job
+
+
+def retry_job(job):
+    """
+    Queues a failed job again.
+
+    The job keeps its partial questionnaire, so only the chunks that were not generated
+    before the failure are generated on the next run.
+
+    Parameters:
+    job (QuestionairreJob): The failed job.
+
+    Returns:
+    bool: True if the job was queued again, False if it had not failed.
+    """
+
+    retried = QuestionairreJob.objects.filter(pk=job.pk, status='failed').update(status='queued', error='')
+    if retried and settings.QUESTIONAIRRE_JOBS_EAGER:
+        claimed = claim_next_job(pk=job.pk)
+        if claimed is not None:
+            run_job(claimed)
+    job.refresh_from_db()
+    return bool(retried)
+
+
+def run_pending_jobs(limit=None):
+    """
+    Runs queued jobs in the calling thread until the queue is empty.
+
+    Parameters:
+    limit (int, optional): Maximum number of jobs to run.
+
+    Returns:
+    int: The number of jobs that were run.
+    """
+
+    count = 0
+    while limit is None or count < limit:
+        job = claim_next_job()
+        if job is None:
+            break
+        run_job(job)
+        count += 1
+    return count
+
+
+class QuestionairreWorkerPool:
+    """
+    A pool of worker threads that drain the questionnaire job queue.
+
+    Each worker polls the database for queued jobs, so any number of pools (in one or
+    many processes) can share the same queue without an external broker.
+    """
+
+    def __init__(self, workers=None, poll_interval=None):
+        self.workers = workers or settings.QUESTIONAIRRE_JOB_WORKERS
+        self.poll_interval = poll_interval if poll_interval is not None else settings.QUESTIONAIRRE_JOB_POLL_INTERVAL
+        self.stop_event = threading.Event()
+        self.threads = []
+        self.running = {}
+        self.running_lock = threading.Lock()
+
+    def start(self):
+        """Starts the worker threads."""
+
+        self.stop_event.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self.work, name=f"questionairre-worker-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self, timeout=None):
+        """
+        Signals the workers to stop and waits for their current job to finish.
+
+        Jobs still running after the timeout are queued again, for another worker to
+        resume; their outcome is dropped if they finish later.
+
+        Parameters:
+        timeout (float, optional): Seconds to wait for the running jobs, in total.
+
+        Returns:
+        int: The number of running jobs queued again.
+        """
+
+        self.stop_event.set()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in self.threads:
+            thread.join(None if deadline is None else max(0, deadline - time.monotonic()))
+        self.threads = [thread for thread in self.threads if thread.is_alive()]
+
+        with self.running_lock:
+            unfinished = list(self.running.values())
+        requeued = 0
+        for job in unfinished:
+            requeued += leased(job).update(status='queued', claimed_at=None, heartbeat_at=None, updated_at=timezone.now())
+        if requeued:
+            logger.warning("Queued %s unfinished questionairre job(s) again", requeued)
+        return requeued
+
+    def work(self):
+        """Claims and runs jobs until the pool is stopped."""
+
+        while not self.stop_event.is_set():
+            close_old_connections()
+            try:
+                job = claim_next_job()
+            except Exception:
+                logger.exception("Unable to claim a questionairre job")
+                job = None
+
+            if job is None:
+                self.stop_event.wait(self.poll_interval)
+                continue
+            with self.running_lock:
+                self.running[job.pk] = job
+            try:
+                run_job(job)
+            except Exception:
+                # The job's lease expires and another worker takes it over.
+                logger.exception("Questionairre job %s could not be run", job.pk)
+            finally:
+                with self.running_lock:
+                    del self.running[job.pk]
+        close_old_connections()
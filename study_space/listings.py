@@ -0,0 +1,154 @@
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from rest_framework.pagination import CursorPagination
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from study_space.models import Book, Questionairre
+
+
+class LinkHeaderCursorPagination(CursorPagination):
+    """
+    Cursor pagination that keeps the body a plain list, as it was before listings were
+    paginated, and gives the next and previous pages in a Link header (RFC 8288).
+
+    Pages hold LISTINGS['PAGE_SIZE'] rows unless '?page_size=' asks for another size, up
+    to LISTINGS['MAX_PAGE_SIZE']. Rows are in the order they were created.
+    """
+
+    ordering = 'id'
+    page_size_query_param = 'page_size'
+
+    def __init__(self):
+        self.page_size = settings.LISTINGS['PAGE_SIZE']
+        self.max_page_size = settings.LISTINGS['MAX_PAGE_SIZE']
+
+    def get_link_header(self):
+        """
+        Returns:
+        str: The Link header, empty if the listing has a single page.
+        """
+
+        links = (('next', self.get_next_link()), ('prev', self.get_previous_link()))
+        return ', '.join(f'<{url}>; rel="{rel}"' for rel, url in links if url)
+
+
+def requested_fields(request):
+    """
+    Returns the fields asked for with '?fields=', comma separated.
+
+    Returns:
+    list or None: The field names, or None for all fields.
+    """
+
+    fields = request.query_params.get('fields')
+    if fields is None:
+        return None
+    return [name.strip() for name in fields.split(',') if name.strip()]
+
+
+def listing_version(user_pk):
+    """
+    Returns the version of a user's listings, which changes whenever one of them does.
+
+    Versions are random, so a version lost with the cache is never reused with other rows.
+
+    Parameters:
+    user_pk (int): The user's primary key.
+
+    Returns:
+    str: The version.
+    """
+
+    versions = caches[settings.LISTINGS['VERSION_CACHE']]
+    key = f'listings:{user_pk}'
+    version = versions.get(key)
+    if version is None:
+        versions.add(key, uuid.uuid4().hex, None)
+        version = versions.get(key)
+    return version
+
+
+def invalidate_listings(user_pk):
+    """
+    Drops the cached listings of a user, by giving them a new version.
+
+    Parameters:
+    user_pk (int): The user's primary key.
+    """
+
+    caches[settings.LISTINGS['VERSION_CACHE']].set(f'listings:{user_pk}', uuid.uuid4().hex, None)
+
+
+def listing_response(request, name, queryset, serializer_class):
+    """
+    Returns a page of one of the current user's listings.
+
+    Pages are cached under the listing's version and the request's path and query,
+    in LISTINGS['CACHE'] for LISTINGS['TIMEOUT'] seconds, so an entry never changes and
+    may be kept in each process; the versions are kept in LISTINGS['VERSION_CACHE'],
+    shared by every process, and changed when a book or questionnaire of the user is
+    saved or deleted. Each page has an ETag, and a request whose If-None-Match matches
+    it gets a 304.
+
+    Blocking: it queries the cache and, on a miss, the database.
+
+    Parameters:
+    request (Request): The request, with optional 'cursor', 'page_size' and 'fields' parameters.
+    name (str): The name of the listing.
+    queryset (QuerySet): The user's rows.
+    serializer_class (type): The ReadSerializer of a row.
+
+    Returns:
+    HttpResponse: The page (200) with a Link header to the next and previous pages, or 304.
+
+    Raises:
+    ValidationError: If 'fields' names an unknown field.
+    NotFound: If the cursor is invalid.
+    """
+
+    cache = caches[settings.LISTINGS['CACHE']]
+    path = hashlib.md5(request.get_full_path().encode(), usedforsecurity=False).hexdigest()
+    key = f'listing:{name}:{request.user.pk}:{listing_version(request.user.pk)}:{path}'
+    page = cache.get(key)
+    if page is None:
+        serializer = serializer_class(fields=requested_fields(request))
+        paginator = LinkHeaderCursorPagination()
+        data = serializer.serialize_rows(paginator.paginate_queryset(serializer.values(queryset), request))
+        etag = quote_etag(hashlib.md5(JSONRenderer().render(data), usedforsecurity=False).hexdigest())
+        page = {'data': data, 'link': paginator.get_link_header(), 'etag': etag}
+        cache.set(key, page, settings.LISTINGS['TIMEOUT'])
+
+    conditional = get_conditional_response(request, etag=page['etag'])
+    if conditional is not None:
+        return conditional
+    response = Response(page['data'])
+    response['ETag'] = page['etag']
+    if page['link']:
+        response['Link'] = page['link']
+    return response
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=Questionairre)
+@receiver(post_delete, sender=Questionairre)
+def invalidate_owner_listings(sender, instance, **kwargs):
+    # Questionnaires are listed with their book's title, so a book change also
+    # changes the questionnaire listing; both share the user's version.
+    invalidate_listings(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def invalidate_new_user_listings(sender, instance, created, **kwargs):
+    # Databases may give a new user the id of a deleted one.
+    if created:
+        invalidate_listings(instance.pk)
@@ -0,0 +1,586 @@
+import asyncio
+import logging
+import math
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from study_space import metrics
+from study_space.rate_limit import MonotonicClock, get_gemini_rate_limiter
+from study_space.tokens import estimate_tokens
+
+
+class LLMError(Exception):
+    """
+    Raised when a model backend returns an error.
+
+    'status_code' is the HTTP status of the failed call, if any, and 'retry_after' the
+    number of seconds the backend asked the caller to wait before trying again, if any.
+    """
+
+    def __init__(self, message, status_code=None, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(LLMError):
+    """Raised instead of calling the model while the circuit breaker is open."""
+
+
+class EmptyResponseError(LLMError):
+    """
+    Raised when the model answers without content, e.g. because safety filters blocked
+    the prompt. The same prompt gets the same answer, so it is not retried, and the
+    model did answer, so it does not count against the circuit breaker.
+    """
+
+
+# Statuses worth retrying: rate limited, or the upstream is overloaded or unavailable.
+# Errors without a status (connection failures, timeouts) are retried too, unless the
+# model answered without content.
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+logger = logging.getLogger(__name__)
+
+# Clock the retry and circuit breaker waits run on; tests replace it with a FakeClock.
+llm_clock = MonotonicClock()
+
+
+def is_retryable(error):
+    """
+    Returns whether a failed model call may succeed if tried again.
+
+    Parameters:
+    error (LLMError): The error the call failed with.
+
+    Returns:
+    bool: True for rate limiting, upstream unavailability and network errors.
+    """
+
+    return not isinstance(error, (CircuitOpenError, EmptyResponseError)) and (
+        error.status_code is None or error.status_code in RETRYABLE_STATUS_CODES
+    )
+
+
+def parse_retry_after(header, details=()):
+    """
+    Returns how long a backend asked the caller to wait before trying again.
+
+    Parameters:
+    header (str or None): The Retry-After header, in seconds or as an HTTP date.
+    details (list, optional): The 'details' of a Google API error, whose RetryInfo gives
+    a 'retryDelay' such as '37s' or '1.5s'.
+
+    Returns:
+    float or None: Seconds to wait, or None if neither gives a valid wait.
+    """
+
+    if header:
+        try:
+            seconds = float(header)
+        except ValueError:
+            try:
+                seconds = (parsedate_to_datetime(header) - datetime.now(timezone.utc)).total_seconds()
+            except (TypeError, ValueError):
+                seconds = None
+        if seconds is not None and math.isfinite(seconds):
+            return max(seconds, 0.0)
+    for detail in details if isinstance(details, list) else ():
+        if isinstance(detail, dict) and str(detail.get('@type', '')).endswith('google.rpc.RetryInfo'):
+            delay = str(detail.get('retryDelay', ''))
+            try:
+                seconds = float(delay[:-1]) if delay.endswith('s') else None
+            except ValueError:
+                seconds = None
+            if seconds is not None and math.isfinite(seconds):
+                return max(seconds, 0.0)
+    return None
+
+
+def retry_delay(attempt, error, base_delay, max_delay):
+    """
+    Returns how long to wait before retrying a failed model call.
+
+    Uses exponential backoff with full jitter, so callers that failed together do not
+    retry together; a Retry-After sent by the backend is always honoured.
+
+    Parameters:
+    attempt (int): Number of attempts made so far, from 1.
+    error (LLMError): The error the last attempt failed with.
+    base_delay (float): Upper bound of the first wait, in seconds.
+    max_delay (float): Upper bound of any wait, in seconds.
+
+    Returns:
+    float: Seconds to wait.
+    """
+
+    delay = random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+    if error.retry_after is not None:
+        delay = max(delay, error.retry_after)
+    return delay
+
+
+class CircuitBreaker:
+    """
+    Stops calling a degraded upstream.
+
+    After 'failure_threshold' consecutive retryable failures the circuit opens and every
+    call fails immediately with CircuitOpenError for 'reset_timeout' seconds, instead of
+    tying up workers on calls that are likely to fail. The first call after that is let
+    through as a trial: its success closes the circuit and its failure opens it again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=None):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock or MonotonicClock()
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+
+    @property
+    def state(self):
+        with self.lock:
+            if self.opened_at is None:
+                return 'closed'
+            if self.clock.now() - self.opened_at >= self.reset_timeout:
+                return 'half_open'
+            return 'open'
+
+    def before_call(self):
+        """
+        Lets a call through or fails it fast.
+
+        A call let through as the trial must call end_trial when it is over, whatever
+        its outcome, so the trial is not held forever by a call that raised.
+
+        Returns:
+        bool: True if the call is the trial of a half open circuit.
+
+        Raises:
+        CircuitOpenError: If the circuit is open, or half open with a trial call already running.
+        """
+
+        with self.lock:
+            if self.opened_at is None:
+                return False
+            remaining = self.opened_at + self.reset_timeout - self.clock.now()
+            if remaining <= 0 and not self.trial_running:
+                self.trial_running = True
+                return True
+            raise CircuitOpenError(
+                "The model is unavailable, calls are suspended after repeated failures",
+                retry_after=max(remaining, 0.0),
+            )
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial_running or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.warning("Opening the LLM circuit breaker after %s failures", self.failures)
+                self.opened_at = self.clock.now()
+            self.trial_running = False
+
+    def end_trial(self):
+        """Lets the next call through as the trial, if the trial ended without an outcome."""
+
+        with self.lock:
+            self.trial_running = False
+
+
+class LLMBackend:
+    """
+    Interface of the model backends questions are generated with.
+
+    A backend is built once per process, see get_llm_backend, and shared by every
+    thread, so implementations must be thread safe.
+    """
+
+    def __init__(self, model, timeout=None):
+        self.model = model
+        self.timeout = timeout
+
+    def generate(self, prompt, model=None):
+        """
+        Generates a completion for a prompt.
+
+        Parameters:
+        prompt (str): The prompt.
+        model (str, optional): The model to use instead of the backend's default.
+
+        Returns:
+        str: The generated text.
+
+        Raises:
+        LLMError: If the backend returns an error.
+        """
+
+        raise NotImplementedError
+
+    async def agenerate(self, prompt, model=None):
+        """Async counterpart of generate; runs generate in a thread unless overridden."""
+
+        return await asyncio.to_thread(self.generate, prompt, model)
+
+    def count_tokens(self, text, model=None):
+        """
+        Counts the tokens in a text with the model's tokenizer.
+
+        Parameters:
+        text (str): The text.
+        model (str, optional): The model to use instead of the backend's default.
+
+        Returns:
+        int: The number of tokens.
+        """
+
+        raise NotImplementedError
+
+    def close(self):
+        """Releases the backend's connections."""
+
+
+class GeminiBackend(LLMBackend):
+    """
+    Calls the Gemini REST API over a pooled, keep-alive HTTP session.
+
+    The google-genai client opens a new HTTP session, and so a new TLS connection, for
+    every call; this backend keeps up to 'pool_size' connections open for the whole
+    process instead.
+    """
+
+    API_URL = 'https://generativelanguage.googleapis.com/v1beta'
+
+    def __init__(self, model, timeout=None, api_key=None, base_url=None, pool_size=10):
+        super().__init__(model, timeout)
+        self.base_url = (base_url or self.API_URL).rstrip('/')
+        self.session = requests.Session()
+        self.session.headers['x-goog-api-key'] = api_key or os.environ.get('GEMINI_API_KEY') or ''
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def call(self, model, method, body):
+        """
+        Calls a method of a Gemini model.
+
+        Parameters:
+        model (str, optional): The model, or None for the backend's default.
+        method (str): The API method, e.g. 'generateContent'.
+        body (dict): The JSON request body.
+
+        Returns:
+        dict: The JSON response body.
+
+        Raises:
+        LLMError: If the request fails, Gemini returns an error status or the body is not JSON.
+        """
+
+        url = f"{self.base_url}/models/{model or self.model}:{method}"
+        try:
+            response = self.session.post(url, json=body, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise LLMError(f"Gemini request failed: {e}") from e
+
+        if response.status_code >= 400:
+            try:
+                error = response.json()['error']
+                message, details = error['message'], error.get('details', ())
+            except (ValueError, KeyError, TypeError, AttributeError):
+                message, details = response.text, ()
+            raise LLMError(
+                f"Gemini returned {response.status_code}: {message}",
+                status_code=response.status_code,
+                retry_after=parse_retry_after(response.headers.get('Retry-After'), details),
+            )
+        try:
+            return response.json()
+        except ValueError as e:
+            raise LLMError(f"Gemini returned an invalid response: {e}", status_code=response.status_code) from e
+
+    def generate(self, prompt, model=None):
+        data = self.call(model, 'generateContent', {'contents': [{'parts': [{'text': prompt}]}]})
+        try:
+            parts = data['candidates'][0]['content']['parts']
+            text = "".join(part.get('text', '') for part in parts)
+        except (KeyError, IndexError, TypeError, AttributeError):
+            text = ''
+        # A candidate cut short by safety filters may have no text parts at all.
+        if text.strip():
+            return text
+        try:
+            reason = data.get('promptFeedback', {}).get('blockReason') or data['candidates'][0].get('finishReason')
+        except (KeyError, IndexError, TypeError, AttributeError):
+            reason = None
+        raise EmptyResponseError(f"Gemini returned no content ({reason})" if reason else "Gemini returned no content")
+
+    def count_tokens(self, text, model=None):
+        data = self.call(model, 'countTokens', {'contents': [{'parts': [{'text': text}]}]})
+        try:
+            return int(data['totalTokens'])
+        except (KeyError, TypeError, ValueError) as e:
+            raise LLMError("Gemini returned no token count") from e
+
+    def close(self):
+        self.session.close()
+
+
+class StubBackend(LLMBackend):
+    """
+    Answers locally, without network, for tests and benchmarks.
+
+    Every prompt gets 'response' after 'latency' seconds; async calls wait without
+    blocking the event loop. Prompts are kept in 'prompts'.
+
+    Faults can be injected to exercise retries: 'faults' is a sequence of HTTP statuses
+    (None for a successful call) the next calls fail with, in order; after it runs out,
+    calls fail with 'fault_status' at 'failure_rate'. Failures carry 'retry_after'.
+    """
+
+    def __init__(self, model='stub', timeout=None, latency=0.0, response='question;answer\n',
+                 faults=(), failure_rate=0.0, fault_status=503, retry_after=None):
+        super().__init__(model, timeout)
+        self.latency = latency
+        self.response = response
+        self.faults = list(faults)
+        self.failure_rate = failure_rate
+        self.fault_status = fault_status
+        self.retry_after = retry_after
+        self.prompts = []
+        self.lock = threading.Lock()
+
+    def record(self, prompt):
+        """Records a call and raises the fault injected for it, if any."""
+
+        with self.lock:
+            self.prompts.append(prompt)
+            if self.faults:
+                status_code = self.faults.pop(0)
+            elif self.failure_rate and random.random() < self.failure_rate:
+                status_code = self.fault_status
+            else:
+                status_code = None
+        if status_code is not None:
+            raise LLMError(f"Injected fault {status_code}", status_code=status_code, retry_after=self.retry_after)
+
+    def generate(self, prompt, model=None):
+        if self.latency:
+            time.sleep(self.latency)
+        self.record(prompt)
+        return self.response
+
+    async def agenerate(self, prompt, model=None):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.record(prompt)
+        return self.response
+
+    def count_tokens(self, text, model=None):
+        return estimate_tokens(text)
+
+
+llm_backend = None
+llm_backend_lock = threading.Lock()
+
+
+def get_llm_backend():
+    """
+    Returns the process wide model backend every generation call goes through.
+
+    The backend is built from settings.LLM_BACKEND the first time it is used and
+    rebuilt when the setting changes.
+
+    Returns:
+    LLMBackend: The shared backend.
+    """
+
+    global llm_backend
+    with llm_backend_lock:
+        if llm_backend is None:
+            config = settings.LLM_BACKEND
+            backend_class = import_string(config['BACKEND'])
+            llm_backend = backend_class(model=config['MODEL'], **config.get('OPTIONS', {}))
+        return llm_backend
+
+
+circuit_breaker = None
+
+
+def get_circuit_breaker():
+    """
+    Returns the process wide circuit breaker guarding the model backend.
+
+    Built from settings.LLM_CIRCUIT_BREAKER the first time it is used.
+
+    Returns:
+    CircuitBreaker: The shared circuit breaker.
+    """
+
+    global circuit_breaker
+    with llm_backend_lock:
+        if circuit_breaker is None:
+            config = settings.LLM_CIRCUIT_BREAKER
+            circuit_breaker = CircuitBreaker(
+                failure_threshold=config['FAILURE_THRESHOLD'],
+                reset_timeout=config['RESET_TIMEOUT'],
+                clock=llm_clock,
+            )
+        return circuit_breaker
+
+
+@receiver(setting_changed)
+def reset_llm_backend(setting=None, **kwargs):
+    global llm_backend, circuit_breaker
+    if setting == 'LLM_BACKEND':
+        # The breaker tracks the failures of the backend being replaced.
+        with llm_backend_lock:
+            if llm_backend is not None:
+                llm_backend.close()
+            llm_backend = None
+            circuit_breaker = None
+    elif setting == 'LLM_CIRCUIT_BREAKER':
+        with llm_backend_lock:
+            circuit_breaker = None
+
+
+def attempts():
+    """
+    Yields the attempt numbers of a model call with the retry settings, from 1.
+
+    Yields:
+    tuple: (attempt, last), where last is True on the final attempt.
+    """
+
+    total = max(settings.LLM_RETRY['ATTEMPTS'], 1)
+    for attempt in range(1, total + 1):
+        yield attempt, attempt == total
+
+
+def failed_attempt(error, attempt, last):
+    """
+    Records a failed attempt on the circuit breaker and returns how long to wait before the next.
+
+    Parameters:
+    error (LLMError): The error the attempt failed with.
+    attempt (int): The attempt number, from 1.
+    last (bool): Whether it was the final attempt.
+
+    Returns:
+    float: Seconds to wait before retrying.
+
+    Raises:
+    LLMError: The error itself, when it should not be retried.
+    """
+
+    if not is_retryable(error):
+        # The upstream answered, so it is not degraded; the request itself was bad.
+        get_circuit_breaker().record_success()
+        raise error
+    get_circuit_breaker().record_failure()
+    if last:
+        raise error
+    delay = retry_delay(attempt, error, settings.LLM_RETRY['BASE_DELAY'], settings.LLM_RETRY['MAX_DELAY'])
+    logger.info("LLM call failed (%s), retrying in %.1f seconds", error, delay)
+    return delay
+
+
+def generate(prompt, tokens=0, user=None):
+    """
+    Generates a completion, within the shared rate limit.
+
+    Rate limited, unavailable and network errors are retried with jittered exponential
+    backoff up to LLM_RETRY['ATTEMPTS'] times; every attempt is charged to the rate
+    limiter. Calls fail fast while the circuit breaker is open. The rate limiter wait,
+    the model call and the backoff are recorded as stages, see study_space/metrics.py.
+
+    Parameters:
+    prompt (str): The prompt.
+    tokens (int, optional): Number of input tokens in the prompt, charged against the token budget.
+    user (User, optional): The user the call is made for, charged against their budget.
+
+    Returns:
+    str: The generated text.
+
+    Raises:
+    LLMError: If the backend returns an error that is not retried or the attempts run out.
+    CircuitOpenError: If the circuit breaker is open.
+    """
+
+    breaker = get_circuit_breaker()
+    for attempt, last in attempts():
+        trial = breaker.before_call()
+        try:
+            metrics.record('rate_limit_wait', get_gemini_rate_limiter().acquire(tokens=tokens, user=user))
+            metrics.count('llm_calls')
+            try:
+                with metrics.span('llm_call'):
+                    text = get_llm_backend().generate(prompt)
+            except LLMError as e:
+                metrics.count('llm_errors')
+                delay = failed_attempt(e, attempt, last)
+            else:
+                breaker.record_success()
+                return text
+        finally:
+            if trial:
+                breaker.end_trial()
+        metrics.record('retry_backoff', delay)
+        llm_clock.sleep(delay)
+
+
+async def agenerate(prompt, tokens=0, user=None):
+    """
+    Async counterpart of generate.
+
+    Parameters:
+    prompt (str): The prompt.
+    tokens (int, optional): Number of input tokens in the prompt, charged against the token budget.
+    user (User, optional): The user the call is made for, charged against their budget.
+
+    Returns:
+    str: The generated text.
+
+    Raises:
+    LLMError: If the backend returns an error that is not retried or the attempts run out.
+    CircuitOpenError: If the circuit breaker is open.
+    """
+
+    breaker = get_circuit_breaker()
+    for attempt, last in attempts():
+        trial = breaker.before_call()
+        try:
+            metrics.record('rate_limit_wait', await get_gemini_rate_limiter().acquire_async(tokens=tokens, user=user))
+            metrics.count('llm_calls')
+            try:
+                with metrics.span('llm_call'):
+                    text = await get_llm_backend().agenerate(prompt)
+            except LLMError as e:
+                metrics.count('llm_errors')
+                delay = failed_attempt(e, attempt, last)
+            else:
+                breaker.record_success()
+                return text
+        finally:
+            if trial:
+                breaker.end_trial()
+        metrics.record('retry_backoff', delay)
+        await llm_clock.sleep_async(delay)
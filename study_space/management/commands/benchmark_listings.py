@@ -0,0 +1,35 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from study_space.benchmark import run_listing_benchmark
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks serializing book and questionnaire listings with ModelSerializers and ReadSerializers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='Number of books, and of questionnaires.')
+        parser.add_argument('--runs', type=int, default=3, help='Number of times each listing is serialized.')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON.')
+
+    def handle(self, *args, **options):
+        results = run_listing_benchmark(options['rows'], runs=options['runs'])
+        summaries = {}
+        for result in results:
+            summaries.setdefault(result.listing, {})[result.serializer] = {
+                'seconds': result.seconds,
+                'objects_per_second': result.rows / result.seconds if result.seconds else 0.0,
+            }
+        for summary in summaries.values():
+            summary['speedup'] = summary['model']['seconds'] / summary['read']['seconds'] if summary['read']['seconds'] else 0.0
+        if options['json']:
+            self.stdout.write(json.dumps(summaries, indent=2))
+            return
+
+        self.stdout.write(f"{'listing':>15} {'model obj/s':>12} {'read obj/s':>12} {'speedup':>8}")
+        for listing, summary in summaries.items():
+            self.stdout.write(
+                f"{listing:>15} {summary['model']['objects_per_second']:>12.0f} "
+                f"{summary['read']['objects_per_second']:>12.0f} {summary['speedup']:>7.1f}x"
+            )
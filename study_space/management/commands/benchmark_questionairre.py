@@ -0,0 +1,46 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from study_space.benchmark import run_benchmark, summarize
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks questionnaire generation end to end on synthetic books, against a fake LLM.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, nargs='+', default=[1, 10, 50, 100],
+                            help='Book sizes to benchmark, in pages.')
+        parser.add_argument('--runs', type=int, default=3, help='Number of books of each size.')
+        parser.add_argument('--detail-level', default='basic', choices=['basic', 'intermediate', 'detailed'])
+        parser.add_argument('--latency', type=float, default=0.5, help='Seconds the fake LLM takes per call.')
+        parser.add_argument('--words-per-page', type=int, default=300)
+        parser.add_argument('--concurrency', type=int, default=None,
+                            help='Chunk concurrency, defaults to QUESTIONAIRRE_CHUNK_CONCURRENCY.')
+        parser.add_argument('--json', action='store_true', help='Print the summaries as JSON.')
+
+    def handle(self, *args, **options):
+        results = run_benchmark(
+            options['pages'],
+            runs=options['runs'],
+            detail_level=options['detail_level'],
+            latency=options['latency'],
+            words_per_page=options['words_per_page'],
+            concurrency=options['concurrency'],
+        )
+
+        summaries = {str(pages): summarize([r for r in results if r.pages == pages]) for pages in options['pages']}
+        summaries['all'] = summarize(results)
+        if options['json']:
+            self.stdout.write(json.dumps(summaries, indent=2))
+            return
+
+        self.stdout.write(f"{'pages':>6} {'books':>6} {'p50 s':>8} {'p95 s':>8} {'pages/s':>9} {'calls/book':>11}")
+        for label, summary in summaries.items():
+            self.stdout.write(
+                f"{label:>6} {summary['books']:>6} {summary['p50_seconds']:>8.3f} {summary['p95_seconds']:>8.3f} "
+                f"{summary['pages_per_second']:>9.1f} {summary['calls_per_book']:>11.1f}"
+            )
+        overall = summaries['all']
+        if overall['peak_rss_mb'] is not None:
+            self.stdout.write(f"peak RSS {overall['peak_rss_mb']:.1f} MB")
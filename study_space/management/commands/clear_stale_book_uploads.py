@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from study_space.uploads import clear_stale_uploads
+
+
+class Command(BaseCommand):
+    help = 'Removes chunked book uploads that were abandoned, and the chunks they received.'
+
+    def handle(self, *args, **options):
+        removed = clear_stale_uploads()
+        self.stdout.write(f"Removed {removed} stale upload(s)")
@@ -0,0 +1,55 @@
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from study_space.jobs import QuestionairreWorkerPool
+from study_space.metrics import start_metrics_server
+
+
+class Command(BaseCommand):
+    help = 'Runs a pool of workers that generate queued questionnaires.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.QUESTIONAIRRE_JOB_WORKERS,
+                            help='Number of worker threads.')
+        parser.add_argument('--poll-interval', type=float, default=settings.QUESTIONAIRRE_JOB_POLL_INTERVAL,
+                            help='Seconds an idle worker waits before polling the queue again.')
+        parser.add_argument('--metrics-host', default=settings.QUESTIONAIRRE_WORKER_METRICS_HOST,
+                            help='Address the generation metrics are served on.')
+        parser.add_argument('--metrics-port', type=int, default=settings.QUESTIONAIRRE_WORKER_METRICS_PORT,
+                            help='Port the generation metrics are served on at /metrics, 0 to not serve them.')
+        parser.add_argument('--drain-timeout', type=float, default=25.0,
+                            help='Seconds to let running jobs finish on shutdown before queueing them again.')
+
+    def handle(self, *args, **options):
+        # SIGTERM (sent on redeploys) stops the workers like Ctrl+C does, instead of
+        # killing them mid-job.
+        stopping = threading.Event()
+        previous_handler = signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+
+        # Generation runs here, not in the web process, so its metrics are served from here.
+        metrics_server = None
+        if options['metrics_port']:
+            metrics_server = start_metrics_server(options['metrics_host'], options['metrics_port'])
+            host, port = metrics_server.server_address[:2]
+            self.stdout.write(f"Serving metrics at http://{host}:{port}/metrics")
+
+        pool = QuestionairreWorkerPool(workers=options['workers'], poll_interval=options['poll_interval'])
+        pool.start()
+        self.stdout.write(f"Started {pool.workers} questionairre worker(s)")
+        try:
+            while not stopping.wait(1):
+                pass
+        except KeyboardInterrupt:
+            pass
+        finally:
+            signal.signal(signal.SIGTERM, previous_handler)
+
+        self.stdout.write(f"Stopping workers, waiting up to {options['drain_timeout']:g}s for running jobs to finish")
+        requeued = pool.stop(timeout=options['drain_timeout'])
+        if requeued:
+            self.stdout.write(f"Queued {requeued} unfinished job(s) again")
+        if metrics_server is not None:
+            metrics_server.shutdown()
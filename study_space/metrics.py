@@ -0,0 +1,212 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# This module must not import Django: the PDF engine, which runs in worker processes,
+# records its spans here too.
+
+
+class Timings:
+    """
+    Per-stage timings and counters of one questionnaire generation.
+
+    Stages that run concurrently, such as model calls on the chunk thread pool, add up
+    their own time, so the sum of the stages can exceed the total wall time.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.counters = {}
+
+    def add(self, stage, seconds):
+        with self.lock:
+            entry = self.stages.setdefault(stage, {'seconds': 0.0, 'count': 0})
+            entry['seconds'] += seconds
+            entry['count'] += 1
+
+    def incr(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def as_dict(self):
+        """
+        Returns the timings in the form stored on Questionairre.timings.
+
+        Returns:
+        dict: 'total_seconds', 'stages' mapping each stage to its 'seconds' and 'count',
+        and the counters.
+        """
+
+        with self.lock:
+            return {
+                'total_seconds': round(time.perf_counter() - self.started, 6),
+                'stages': {
+                    stage: {'seconds': round(entry['seconds'], 6), 'count': entry['count']}
+                    for stage, entry in sorted(self.stages.items())
+                },
+                **dict(sorted(self.counters.items())),
+            }
+
+
+class MetricsRegistry:
+    """
+    Process wide totals of every stage and counter, exported in the Prometheus text format.
+
+    Each process keeps its own totals; Prometheus sums them across processes.
+    """
+
+    def __init__(self, namespace='study_space'):
+        self.namespace = namespace
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.counters = {}
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            entry = self.stages.setdefault(stage, [0.0, 0])
+            entry[0] += seconds
+            entry[1] += 1
+
+    def incr(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def render(self):
+        """
+        Renders the metrics in the Prometheus text exposition format.
+
+        Returns:
+        str: The metrics.
+        """
+
+        with self.lock:
+            stages = sorted(self.stages.items())
+            counters = sorted(self.counters.items())
+
+        name = f"{self.namespace}_stage_seconds"
+        lines = [
+            f"# HELP {name} Time spent in each stage of questionnaire generation.",
+            f"# TYPE {name} summary",
+        ]
+        for stage, (seconds, count) in stages:
+            lines.append(f'{name}_sum{{stage="{stage}"}} {seconds:.6f}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {count}')
+        for counter, value in counters:
+            lines.append(f"# TYPE {self.namespace}_{counter}_total counter")
+            lines.append(f"{self.namespace}_{counter}_total {value}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self.lock:
+            self.stages.clear()
+            self.counters.clear()
+
+
+registry = MetricsRegistry()
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """Serves the registry at /metrics."""
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(host, port):
+    """
+    Serves the metrics of this process at http://host:port/metrics, from a background thread.
+
+    For processes without a web server, such as the questionnaire workers, where the
+    generation metrics are recorded.
+
+    Parameters:
+    host (str): The address to listen on.
+    port (int): The port to listen on, 0 for any free port.
+
+    Returns:
+    ThreadingHTTPServer: The server; call shutdown() to stop it.
+    """
+
+    server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    return server
+
+
+current_timings = contextvars.ContextVar('current_timings', default=None)
+
+
+def record(stage, seconds):
+    """
+    Records time spent in a stage, on the registry and on the current generation's timings.
+
+    Parameters:
+    stage (str): The stage name.
+    seconds (float): The time spent.
+    """
+
+    registry.observe(stage, seconds)
+    timings = current_timings.get()
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+def count(name, amount=1):
+    """
+    Increments a counter, on the registry and on the current generation's timings.
+
+    Parameters:
+    name (str): The counter name.
+    amount (int, optional): The increment.
+    """
+
+    registry.incr(name, amount)
+    timings = current_timings.get()
+    if timings is not None:
+        timings.incr(name, amount)
+
+
+@contextmanager
+def span(stage):
+    """Records the time spent in the block as a stage."""
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - started)
+
+
+@contextmanager
+def collect_timings():
+    """
+    Collects the stages and counters recorded in the block, and in the threads and tasks it
+    starts with its context, into a new Timings.
+
+    Yields:
+    Timings: The timings of the block.
+    """
+
+    timings = Timings()
+    token = current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        current_timings.reset(token)
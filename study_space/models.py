@@ -1,17 +1,170 @@
-from django.db import models
+import hashlib
+import logging
+import uuid
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, models, transaction
 from django.contrib.auth.models import User
 from . import validators as validate
 
+logger = logging.getLogger(__name__)
+
+
+def file_content_hash(file):
+    """
+    Returns the SHA-256 hex digest of a file's content.
+
+    Parameters:
+    file (File): The file to hash. It is read in chunks and rewound afterwards.
+
+    Returns:
+    str: The hex digest.
+    """
+
+    digest = hashlib.sha256()
+    file.seek(0)
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def normalize_title(title):
+    """
+    Returns the form of a book title that books are looked up by, ignoring case.
+
+    Parameters:
+    title (str): The title.
+
+    Returns:
+    str: The lower-cased title.
+    """
+
+    return title.lower()
+
+
 class Book(models.Model):
     title = models.CharField(max_length=50)
     user = models.ForeignKey(User, related_name='book_user', on_delete=models.CASCADE)
     file = models.FileField(upload_to='files/', validators=[validate.validate_fIle_size_and_type])
+    content_hash = models.CharField(max_length=64, blank=True, default='', editable=False, db_index=True)
+    # normalize_title(title), so case-insensitive lookups use the (user, normalized_title) index.
+    # Lower-casing can lengthen a title, hence the larger max_length. Null until books saved
+    # before it existed are backfilled, see backfill_normalized_titles.
+    normalized_title = models.CharField(max_length=100, null=True, editable=False)
 
     class Meta:
         constraints = [
-            models.UniqueConstraint(fields=['title','user'], name='unique_book_title_user')
+            models.UniqueConstraint(fields=['title','user'], name='unique_book_title_user'),
+            models.UniqueConstraint(fields=['user', 'normalized_title'], name='unique_book_normalized_title_user'),
         ]
 
+    def save(self, *args, **kwargs):
+        if self.file and not self.file._committed:
+            self.content_hash = file_content_hash(self.file)
+        self.normalized_title = normalize_title(self.title)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'title' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'normalized_title'}
+        super().save(*args, **kwargs)
+
+
+def book_by_title(user, title):
+    """
+    Returns a user's book with the given title, ignoring case.
+
+    Books whose normalized title could not be backfilled are looked up by title when
+    no other book matches.
+
+    Parameters:
+    user (User): The owner of the book.
+    title (str): The title.
+
+    Returns:
+    Book or None: The book, or None if the user has no book with this title.
+    """
+
+    book = Book.objects.filter(user=user, normalized_title=normalize_title(title)).first()
+    if book is None:
+        book = Book.objects.filter(user=user, normalized_title__isnull=True, title__iexact=title).first()
+    return book
+
+
+def book_title_taken(user, title, exclude=None):
+    """
+    Returns whether a user already has a book with a title, ignoring case.
+
+    Parameters:
+    user (User): The owner of the books.
+    title (str): The title.
+    exclude (Book, optional): A book not to compare with, such as the one being renamed.
+
+    Returns:
+    bool: Whether the title is taken.
+    """
+
+    books = Book.objects.filter(models.Q(normalized_title=normalize_title(title)) | models.Q(title=title), user=user)
+    if exclude is not None:
+        books = books.exclude(pk=exclude.pk)
+    return books.exists()
+
+
+def backfill_normalized_titles(using=DEFAULT_DB_ALIAS, batch_size=1000, **kwargs):
+    """
+    Stores the normalized title of books saved before it was recorded.
+
+    Connected to post_migrate, so it runs after every migrate and does nothing once all
+    books have one. A book whose title only differs in case from another book of the
+    same user keeps none and is logged; it is still found by book_by_title.
+
+    Parameters:
+    using (str, optional): The database alias.
+    batch_size (int, optional): Number of books updated per query.
+
+    Returns:
+    int: The number of books updated.
+    """
+
+    books = Book.objects.using(using).filter(normalized_title__isnull=True).only('pk', 'title', 'user')
+    updated = 0
+    last_pk = 0
+    while True:
+        batch = list(books.filter(pk__gt=last_pk).order_by('pk')[:batch_size])
+        if not batch:
+            return updated
+        last_pk = batch[-1].pk
+        for book in batch:
+            book.normalized_title = normalize_title(book.title)
+        try:
+            with transaction.atomic(using=using):
+                Book.objects.using(using).bulk_update(batch, ['normalized_title'])
+            updated += len(batch)
+        except IntegrityError:
+            for book in batch:
+                try:
+                    with transaction.atomic(using=using):
+                        Book.objects.using(using).filter(pk=book.pk).update(normalized_title=book.normalized_title)
+                    updated += 1
+                except IntegrityError:
+                    logger.warning("Book %s has the title of another book of its user, ignoring case", book.pk)
+
+class BookUpload(models.Model):
+    """
+    A book being uploaded in chunks, see study_space/uploads.py.
+
+    Each chunk is saved to storage as a part as it arrives; 'parts' lists their names in
+    order and 'received' how many bytes they hold, so an interrupted upload resumes from
+    there. The upload is removed once the book is created.
+    """
+
+    upload_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    user = models.ForeignKey(User, related_name='book_upload_user', on_delete=models.CASCADE)
+    title = models.CharField(max_length=50)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    received = models.PositiveBigIntegerField(default=0)
+    parts = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
 class Questionairre(models.Model):
 
     DETAIL_CHOICE = [
@@ -20,9 +173,111 @@ class Questionairre(models.Model):
         ('detailed', 'DETAILED'),
     ]
 
+    STATUS_CHOICE = [
+        ('partial', 'PARTIAL'),
+        ('complete', 'COMPLETE'),
+    ]
+
     book = models.ForeignKey(Book, related_name='questionairre_book', on_delete=models.CASCADE)
     user = models.ForeignKey(User, related_name='questionairre_user', on_delete=models.CASCADE)
     question_answers_file = models.FileField(upload_to='questions/', blank=True, null=True)  
     detail_level = models.CharField(max_length=20, choices=DETAIL_CHOICE, default='basic')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICE, default='complete')
+    # Seconds spent in each stage of the last generation, see study_space/metrics.py
+    timings = models.JSONField(default=dict, blank=True)
+
+class QuestionairreChunk(models.Model):
+    """
+    Question-answer pairs of one chunk of a questionnaire that is still being generated.
+
+    Chunks are saved as soon as they are generated, so a failed generation can resume
+    from the chunks already paid for and progress streams can send them to clients as
+    they arrive.
+    """
+
+    questionairre = models.ForeignKey(Questionairre, related_name='questionairre_chunk', on_delete=models.CASCADE)
+    start_page = models.PositiveIntegerField()
+    end_page = models.PositiveIntegerField()
+    part = models.PositiveIntegerField(default=0)
+    question_answers = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['questionairre', 'start_page', 'end_page', 'part'], name='unique_questionairre_chunk')
+        ]
+
+class QuestionairreJob(models.Model):
 
+    STATUS_CHOICE = [
+        ('queued', 'QUEUED'),
+        ('running', 'RUNNING'),
+        ('complete', 'COMPLETE'),
+        ('failed', 'FAILED'),
+    ]
+
+    book = models.ForeignKey(Book, related_name='questionairre_job_book', on_delete=models.CASCADE)
+    user = models.ForeignKey(User, related_name='questionairre_job_user', on_delete=models.CASCADE)
+    questionairre = models.ForeignKey(Questionairre, related_name='questionairre_job', on_delete=models.SET_NULL, blank=True, null=True)
+    detail_level = models.CharField(max_length=20, choices=Questionairre.DETAIL_CHOICE, default='basic')
+    start_page = models.PositiveIntegerField(blank=True, null=True)
+    end_page = models.PositiveIntegerField(blank=True, null=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICE, default='queued')
+    total_chunks = models.PositiveIntegerField(default=0)
+    completed_chunks = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+    # The lease of the worker running the job: when it claimed the job, and when it last
+    # renewed the claim. A running job whose lease has expired is queued again.
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='questionairre_job_queue_idx'),
+            models.Index(fields=['status', 'heartbeat_at'], name='questionairre_job_lease_idx'),
+        ]
+
+class GeneratedChunk(models.Model):
+    """
+    Generated question-answer pairs for one chunk of pages of a PDF.
+
+    Chunks are keyed on the PDF content rather than on a Book, so identical books
+    uploaded by different users share the same generated questions.
+    """
+
+    content_hash = models.CharField(max_length=64)
+    start_page = models.PositiveIntegerField()
+    end_page = models.PositiveIntegerField()
+    part = models.PositiveIntegerField(default=0)
+    detail_level = models.CharField(max_length=20, choices=Questionairre.DETAIL_CHOICE)
+    prompt_version = models.CharField(max_length=20)
+    # The chunk token budget the pages were planned with, and the model that generated the
+    # questions; the same span planned with another budget covers other text.
+    chunk_tokens = models.PositiveIntegerField(default=0)
+    model = models.CharField(max_length=100, default='')
+    question_answers = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['content_hash', 'detail_level', 'prompt_version', 'chunk_tokens', 'model', 'start_page', 'end_page', 'part'], name='unique_generated_chunk')
+        ]
+
+class PageText(models.Model):
+    """
+    Extracted text of one page of a PDF.
+
+    Pages are keyed on the PDF content so text is extracted once per distinct file,
+    however many users upload it.
+    """
+
+    content_hash = models.CharField(max_length=64)
+    page_number = models.PositiveIntegerField()
+    text = models.TextField(blank=True, default='')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['content_hash', 'page_number'], name='unique_page_text')
+        ]
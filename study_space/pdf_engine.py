@@ -0,0 +1,237 @@
+import io
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from pypdf import PdfReader
+
+from study_space.metrics import span
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Worker processes are started fresh (never forked from a threaded Django process) and
+# run the functions below, so this module must not import Django.
+START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+class ExtractionError(Exception):
+    """Raised when a page cannot be extracted within the engine's limits."""
+
+
+def open_reader(source):
+    """
+    Opens a PdfReader on a path, raw bytes or a file-like object.
+
+    Parameters:
+    source (str, bytes or file): The PDF.
+
+    Returns:
+    PdfReader: The reader.
+    """
+
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    elif hasattr(source, 'seek'):
+        source.seek(0)
+    return PdfReader(source)
+
+
+def count_pages(source):
+    """
+    Returns the number of pages of a PDF.
+
+    Parameters:
+    source (str, bytes or file): The PDF.
+
+    Returns:
+    int: The number of pages.
+    """
+
+    return len(open_reader(source).pages)
+
+
+def declared_page_count(source):
+    """
+    Returns the number of pages a PDF declares, without loading its pages.
+
+    Only the cross-reference table, the catalog and the root of the page tree are read,
+    so the cost does not grow with the number or size of the pages. The count is what
+    the page tree says; count_pages walks the tree.
+
+    Parameters:
+    source (str, bytes or file): The PDF. Pass an open file rather than a path, which
+    pypdf reads into memory whole.
+
+    Returns:
+    int: The number of pages.
+    """
+
+    return int(open_reader(source).trailer['/Root']['/Pages']['/Count'])
+
+
+def extract_range(source, first, last):
+    """
+    Extracts the text of pages [first, last) of a PDF.
+
+    Parameters:
+    source (str or bytes): The PDF.
+    first (int): Index of the first page, 0-indexed.
+    last (int): Index after the last page.
+
+    Returns:
+    list: The text of each page in the range.
+    """
+
+    reader = open_reader(source)
+    return [reader.pages[page].extract_text() for page in range(first, last)]
+
+
+def limit_memory(memory_limit_mb):
+    """Caps the address space of a worker process, where the platform supports it."""
+
+    if memory_limit_mb and resource is not None:
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def available_cpus():
+    """Returns the number of CPUs the process may run on."""
+
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+# Starting worker processes costs far more than extracting a page, so pools are kept for
+# the life of the process, one per worker count and memory limit, and shared by threads.
+pools = {}
+pools_pid = None
+pools_lock = threading.Lock()
+
+
+def get_pool(workers, memory_limit_mb):
+    """
+    Returns the process pool for a worker count and memory limit, starting it on first use.
+
+    Parameters:
+    workers (int): Number of worker processes.
+    memory_limit_mb (int, optional): Address space limit of each worker process.
+
+    Returns:
+    ProcessPoolExecutor: The pool.
+    """
+
+    global pools_pid
+    with pools_lock:
+        if pools_pid != os.getpid():
+            # A forked process cannot use its parent's pools.
+            pools.clear()
+            pools_pid = os.getpid()
+        key = (workers, memory_limit_mb)
+        if key not in pools:
+            pools[key] = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context(START_METHOD),
+                initializer=limit_memory,
+                initargs=(memory_limit_mb,),
+            )
+        return pools[key]
+
+
+def discard_pool(pool):
+    """
+    Stops a pool's workers and forgets it, so the next extraction starts a new one.
+
+    A page stuck in pypdf never returns, so its worker has to be stopped; the pool's
+    other extractions fail too.
+
+    Parameters:
+    pool (ProcessPoolExecutor): The pool.
+    """
+
+    with pools_lock:
+        for key, known in list(pools.items()):
+            if known is pool:
+                del pools[key]
+    for process in list((pool._processes or {}).values()):
+        process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_page_texts(source, workers=1, pages_per_task=8, page_timeout=None, memory_limit_mb=None, min_pages=0):
+    """
+    Yields the text of every page of a PDF, in page order.
+
+    The pages are extracted by a process pool when the PDF has at least 'min_pages'
+    pages and more than one worker and CPU are available. Each worker then parses the
+    PDF once and extracts one contiguous range of at least 'pages_per_task' pages, and
+    each range is yielded as soon as it and every range before it are done. A range that
+    takes longer than 'page_timeout' seconds per page, or whose worker exceeds
+    'memory_limit_mb', fails the extraction. Limits only apply to the process pool.
+    Opening the PDF is recorded as the 'pdf_parse' stage and the time spent extracting,
+    or waiting for the pool, as 'extract_text'.
+
+    Parameters:
+    source (str or bytes): The PDF, as a path or its content.
+    workers (int, optional): Number of worker processes.
+    pages_per_task (int, optional): Minimum number of pages a worker extracts.
+    page_timeout (float, optional): Seconds allowed per page.
+    memory_limit_mb (int, optional): Address space limit of each worker process.
+    min_pages (int, optional): Minimum number of pages of a PDF extracted by the pool.
+
+    Yields:
+    str: The text of each page.
+
+    Raises:
+    ExtractionError: If a page range times out or its worker fails.
+    """
+
+    with span('pdf_parse'):
+        reader = open_reader(source)
+        num_of_pages = len(reader.pages)
+    workers = min(workers, available_cpus())
+    tasks = min(workers, math.ceil(num_of_pages / pages_per_task))
+    if tasks <= 1 or num_of_pages < min_pages:
+        for page in reader.pages:
+            with span('extract_text'):
+                text = page.extract_text()
+            yield text
+        return
+
+    pool = get_pool(workers, memory_limit_mb)
+    futures = []
+    try:
+        for task in range(tasks):
+            first = num_of_pages * task // tasks
+            last = num_of_pages * (task + 1) // tasks
+            futures.append((pool.submit(extract_range, source, first, last), last - first))
+
+        for future, pages in futures:
+            timeout = page_timeout * pages if page_timeout else None
+            try:
+                with span('extract_text'):
+                    texts = future.result(timeout=timeout)
+            except TimeoutError:
+                discard_pool(pool)
+                raise ExtractionError(f"Text extraction timed out after {timeout} seconds")
+            except MemoryError:
+                raise ExtractionError("Text extraction exceeded the memory limit")
+            except BrokenProcessPool as e:
+                discard_pool(pool)
+                raise ExtractionError(f"Text extraction failed: {e}") from e
+            except Exception as e:
+                raise ExtractionError(f"Text extraction failed: {e}") from e
+            yield from texts
+    except BrokenProcessPool as e:
+        # Raised by submit when a worker of the pool died during an earlier extraction.
+        discard_pool(pool)
+        raise ExtractionError(f"Text extraction failed: {e}") from e
+    finally:
+        for future, pages in futures:
+            future.cancel()
@@ -0,0 +1,92 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from study_space.listings import invalidate_listings
+from study_space.models import Book, GeneratedChunk, file_content_hash
+
+
+def book_content_hash(book):
+    """
+    Returns the content hash of a book's file, computing and storing it if missing.
+
+    Books uploaded before content hashes were recorded are hashed on first use.
+
+    Parameters:
+    book (Book): The book.
+
+    Returns:
+    str: The SHA-256 hex digest of the book's file.
+    """
+
+    if not book.content_hash:
+        with book.file.open('rb') as f:
+            book.content_hash = file_content_hash(f)
+        Book.objects.filter(pk=book.pk).update(content_hash=book.content_hash)
+        invalidate_listings(book.user_id)
+    return book.content_hash
+
+
+def get_cached_chunks(content_hash, detail_level, prompt_version, chunk_tokens, model, spans):
+    """
+    Looks up previously generated chunks.
+
+    Parameters:
+    content_hash (str): The content hash of the PDF.
+    detail_level (str): The detail level the chunks were generated at.
+    prompt_version (str): The version of the prompt template.
+    chunk_tokens (int): The token budget the chunks were planned with.
+    model (str): The model the chunks were generated with.
+    spans (list): (start_page, end_page, part) tuples, pages 1-indexed and inclusive.
+
+    Returns:
+    dict: The generated question-answer text keyed by (start_page, end_page, part), for the spans found.
+    """
+
+    if not spans:
+        return {}
+
+    span_filter = Q()
+    for start_page, end_page, part in spans:
+        span_filter |= Q(start_page=start_page, end_page=end_page, part=part)
+
+    chunks = GeneratedChunk.objects.filter(
+        span_filter,
+        content_hash=content_hash,
+        detail_level=detail_level,
+        prompt_version=prompt_version,
+        chunk_tokens=chunk_tokens,
+        model=model,
+    ).values_list('start_page', 'end_page', 'part', 'question_answers')
+    return {(start_page, end_page, part): question_answers for start_page, end_page, part, question_answers in chunks}
+
+
+def store_chunk(content_hash, detail_level, prompt_version, chunk_tokens, model, span, question_answers):
+    """
+    Stores a generated chunk, keeping the existing entry if another worker stored it first.
+
+    Parameters:
+    content_hash (str): The content hash of the PDF.
+    detail_level (str): The detail level the chunk was generated at.
+    prompt_version (str): The version of the prompt template.
+    chunk_tokens (int): The token budget the chunk was planned with.
+    model (str): The model the chunk was generated with.
+    span (tuple): (start_page, end_page, part), pages 1-indexed and inclusive.
+    question_answers (str): The generated question-answer text.
+    """
+
+    start_page, end_page, part = span
+    try:
+        with transaction.atomic():
+            GeneratedChunk.objects.get_or_create(
+                content_hash=content_hash,
+                detail_level=detail_level,
+                prompt_version=prompt_version,
+                chunk_tokens=chunk_tokens,
+                model=model,
+                start_page=start_page,
+                end_page=end_page,
+                part=part,
+                defaults={'question_answers': question_answers},
+            )
+    except IntegrityError:
+        pass
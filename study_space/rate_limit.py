@@ -0,0 +1,306 @@
+import asyncio
+import threading
+import time
+
+from cachetools import TTLCache
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from study_space.cache import supports_compare_and_set
+
+
+class MonotonicClock:
+    """Wall clock used by the rate limiter outside of tests."""
+
+    def now(self):
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    async def sleep_async(self, seconds):
+        await asyncio.sleep(seconds)
+
+
+class WallClock(MonotonicClock):
+    """
+    Clock used by rate limiters whose buckets are shared between processes.
+
+    Monotonic clocks of different processes do not agree, the system clock does.
+    """
+
+    def now(self):
+        return time.time()
+
+
+class FakeClock:
+    """
+    A manually driven clock for tests.
+
+    sleep() advances the clock instead of blocking and records how long each caller
+    would have waited.
+    """
+
+    def __init__(self, start=0.0):
+        self.current = start
+        self.sleeps = []
+
+    def now(self):
+        return self.current
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.current += seconds
+
+    async def sleep_async(self, seconds):
+        self.sleep(seconds)
+
+    def advance(self, seconds):
+        self.current += seconds
+
+
+class TokenBucket:
+    """
+    A token bucket that refills continuously at a fixed rate per minute.
+
+    Reservations may take the bucket into debt; the caller is told how long to wait
+    until the debt is repaid, so waiting callers are spaced out without polling.
+    """
+
+    def __init__(self, per_minute, capacity=None, now=0.0):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self.tokens = self.capacity
+        self.updated = now
+
+    def reserve(self, amount, now):
+        """
+        Takes 'amount' tokens from the bucket.
+
+        Parameters:
+        amount (float): Number of tokens to take.
+        now (float): The current time of the limiter's clock.
+
+        Returns:
+        float: Seconds the caller must wait before using the reserved tokens.
+        """
+
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= amount
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+
+def check_shared_cache(cache_alias):
+    """
+    Checks that rate limits can be shared through a cache.
+
+    Parameters:
+    cache_alias (str): The cache alias.
+
+    Raises:
+    ImproperlyConfigured: If the cache has no atomic compare_and_set.
+    """
+
+    if not supports_compare_and_set(caches[cache_alias]):
+        raise ImproperlyConfigured(
+            f"Rate limits cannot be shared through the '{cache_alias}' cache, which has no compare_and_set; "
+            "use study_space.cache.LockedFileBasedCache or study_space.cache.AtomicRedisCache."
+        )
+
+
+class CacheTokenBucket:
+    """
+    A TokenBucket whose state is kept in a cache shared by every process.
+
+    A reservation reads the state, takes the tokens and writes it back with
+    compare_and_set, starting over if another process changed it in between. An idle
+    bucket is full again after a minute, so its state may expire after two.
+    """
+
+    def __init__(self, cache_alias, key, per_minute, capacity=None):
+        check_shared_cache(cache_alias)
+        self.cache_alias = cache_alias
+        self.key = key
+        self.per_minute = per_minute
+        self.capacity = capacity
+
+    def reserve(self, amount, now):
+        """
+        Takes 'amount' tokens from the bucket.
+
+        Parameters:
+        amount (float): Number of tokens to take.
+        now (float): The current time of the limiter's clock, the same in every process.
+
+        Returns:
+        float: Seconds the caller must wait before using the reserved tokens.
+        """
+
+        cache = caches[self.cache_alias]
+        while True:
+            state = cache.get(self.key)
+            bucket = TokenBucket(self.per_minute, self.capacity, now=now)
+            if state is not None:
+                bucket.tokens, bucket.updated = state
+            # Clocks of different hosts may be slightly apart, never refill backwards.
+            wait = bucket.reserve(amount, max(now, bucket.updated))
+            if cache.compare_and_set(self.key, state, (bucket.tokens, bucket.updated), timeout=120):
+                return wait
+
+
+class RateLimiter:
+    """
+    Rate limiter for calls to a rate limited API such as Gemini.
+
+    Enforces a global requests per minute budget, an optional tokens per minute budget
+    and an optional per-user requests per minute budget so a single user generating a
+    large book cannot starve everyone else. A caller first waits for a slot of its user's
+    budget and only then takes one of the global budgets, so a user over their share
+    waits without holding global capacity others could use. Reservations are made
+    atomically under a lock and a caller sleeps at most once for each.
+
+    The budgets belong to the process unless 'cache' names a cache alias whose
+    compare_and_set is atomic across processes (see study_space/cache.py); then all
+    processes sharing that cache share the budgets, under keys starting with 'key_prefix'.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute=None, user_requests_per_minute=None, clock=None,
+                 cache=None, key_prefix='rate_limit'):
+        self.clock = clock or (WallClock() if cache else MonotonicClock())
+        self.cache = cache
+        self.key_prefix = key_prefix
+        self.lock = threading.Lock()
+        now = self.clock.now()
+        self.requests = self.bucket('requests', requests_per_minute, now)
+        self.tokens = self.bucket('tokens', tokens_per_minute, now) if tokens_per_minute else None
+        self.user_requests_per_minute = user_requests_per_minute
+        # An idle bucket is full again after a minute, so forgetting it changes nothing.
+        self.user_buckets = TTLCache(maxsize=10000, ttl=120, timer=self.clock.now)
+
+    def bucket(self, name, per_minute, now):
+        if self.cache:
+            return CacheTokenBucket(self.cache, f"{self.key_prefix}:{name}", per_minute)
+        return TokenBucket(per_minute, now=now)
+
+    def reserve_user(self, user=None):
+        """
+        Reserves one request of a user's budget without waiting.
+
+        Parameters:
+        user (User, optional): The user the request is made for.
+
+        Returns:
+        float: Seconds the caller must wait before reserving from the global budgets.
+        """
+
+        if not self.user_requests_per_minute or user is None:
+            return 0.0
+        with self.lock:
+            now = self.clock.now()
+            key = getattr(user, 'pk', user)
+            bucket = self.user_buckets.get(key)
+            if bucket is None:
+                bucket = self.bucket(f"user:{key}", self.user_requests_per_minute, now)
+            self.user_buckets[key] = bucket
+            return bucket.reserve(1, now)
+
+    def reserve(self, tokens=0):
+        """
+        Reserves one request (and 'tokens' tokens) of the global budgets without waiting.
+
+        Parameters:
+        tokens (int, optional): Number of tokens the request is expected to use.
+
+        Returns:
+        float: Seconds the caller must wait before making the request.
+        """
+
+        with self.lock:
+            now = self.clock.now()
+            wait = self.requests.reserve(1, now)
+            if self.tokens is not None and tokens:
+                wait = max(wait, self.tokens.reserve(tokens, now))
+            return wait
+
+    def acquire(self, tokens=0, user=None):
+        """
+        Blocks until a request (and 'tokens' tokens) may be made.
+
+        Parameters:
+        tokens (int, optional): Number of tokens the request is expected to use.
+        user (User, optional): The user the request is made for.
+
+        Returns:
+        float: Seconds spent waiting.
+        """
+
+        user_wait = self.reserve_user(user)
+        if user_wait > 0:
+            self.clock.sleep(user_wait)
+        wait = self.reserve(tokens=tokens)
+        if wait > 0:
+            self.clock.sleep(wait)
+        return user_wait + wait
+
+    async def acquire_async(self, tokens=0, user=None):
+        """
+        Waits, without blocking the event loop, until a request (and 'tokens' tokens) may be made.
+
+        Parameters:
+        tokens (int, optional): Number of tokens the request is expected to use.
+        user (User, optional): The user the request is made for.
+
+        Returns:
+        float: Seconds spent waiting.
+        """
+
+        user_wait = self.reserve_user(user)
+        if user_wait > 0:
+            await self.clock.sleep_async(user_wait)
+        wait = self.reserve(tokens=tokens)
+        if wait > 0:
+            await self.clock.sleep_async(wait)
+        return user_wait + wait
+
+
+gemini_rate_limiter = None
+gemini_rate_limiter_lock = threading.Lock()
+
+
+def get_gemini_rate_limiter():
+    """
+    Returns the process wide rate limiter shared by every Gemini call site.
+
+    Budgets are read from settings.GEMINI_RATE_LIMIT the first time it is used and
+    read again when the setting changes. They are kept in the cache named by its
+    'CACHE', so every process draws on the same budgets, or in the process if it is None.
+
+    Returns:
+    RateLimiter: The shared rate limiter.
+    """
+
+    global gemini_rate_limiter
+    with gemini_rate_limiter_lock:
+        if gemini_rate_limiter is None:
+            limits = settings.GEMINI_RATE_LIMIT
+            gemini_rate_limiter = RateLimiter(
+                requests_per_minute=limits['REQUESTS_PER_MINUTE'],
+                tokens_per_minute=limits.get('TOKENS_PER_MINUTE'),
+                user_requests_per_minute=limits.get('USER_REQUESTS_PER_MINUTE'),
+                cache=limits.get('CACHE'),
+            )
+        return gemini_rate_limiter
+
+
+@receiver(setting_changed)
+def reset_gemini_rate_limiter(setting=None, **kwargs):
+    global gemini_rate_limiter
+    if setting == 'GEMINI_RATE_LIMIT':
+        with gemini_rate_limiter_lock:
+            gemini_rate_limiter = None
@@ -1,14 +1,27 @@
-import time
+import asyncio
+import contextvars
 import uuid
 from rest_framework import serializers
-from study_space.models import Book, Questionairre
-from pypdf import PdfReader
-from google import genai
-import google.generativeai as generativeai
+from study_space.models import Book, BookUpload, Questionairre, QuestionairreChunk, QuestionairreJob, book_title_taken
+from study_space import jobs, llm, metrics
+from study_space.question_cache import book_content_hash, get_cached_chunks, store_chunk
+from study_space.extraction import get_page_texts
+from study_space.chunking import plan_chunks, select_chunks
+from study_space.tokens import count_tokens
 import os
+import posixpath
 from django.conf import settings
-from django.core.cache import cache
-import logging
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from django.db import IntegrityError, connections, transaction
+from asgiref.sync import async_to_sync, sync_to_async
+
+
+QUESTION_PROMPT = 'Generate well-thought-out question and answer pairs based solely on the text below. Format each pair as a single line with the question and answer separated by a semicolon (;). If a question or answer contains multiple lines, replace newline characters with <br> to preserve formatting for Anki. Do not add numbering, extra text, or any other content beyond the question and answer pairs. Ensure semicolons do not appear within the question or answer text by replacing any existing semicolons with commas.'
+
+# Bump whenever QUESTION_PROMPT changes so chunks generated with the old prompt are not reused.
+PROMPT_VERSION = '1'
 
 
 class BookSerializer(serializers.ModelSerializer):
@@ -16,15 +29,64 @@ class BookSerializer(serializers.ModelSerializer):
     Serializer for the Book model.
 
     This serializer handles the conversion of Book model instances to and from
-    JSON format. It includes all fields from the model but marks the 'user' field
-    as read-only to prevent modification through the API.
+    JSON format. It includes all fields from the model but normalized_title, and marks the 'user' field
+    as read-only to prevent modification through the API. A title taken by a book saved
+    concurrently is rejected like one taken before, rather than failing on the unique constraint.
     """
 
     class Meta:
         model = Book
-        fields = '__all__'
+        # normalized_title only serves lookups, see book_by_title.
+        exclude = ['normalized_title']
         read_only_fields = ['user']
 
+    def create(self, validated_data):
+        book = Book(**validated_data)
+        try:
+            with transaction.atomic():
+                book.save()
+        except IntegrityError:
+            book.file.delete(save=False)
+            raise serializers.ValidationError({'title': ["You already have a book with this title."]})
+        return book
+
+    def update(self, instance, validated_data):
+        try:
+            with transaction.atomic():
+                return super().update(instance, validated_data)
+        except IntegrityError:
+            if 'file' in validated_data:
+                instance.file.delete(save=False)
+            raise serializers.ValidationError({'title': ["You already have a book with this title."]})
+
+class BookUploadSerializer(serializers.ModelSerializer):
+    """
+    Serializer for starting a chunked upload of a book, see study_space/uploads.py.
+
+    The title is checked when the upload starts, so a client does not send a whole file
+    for a book it cannot create.
+    """
+
+    class Meta:
+        model = BookUpload
+        fields = ['upload_id', 'title', 'filename', 'size', 'received', 'created_at', 'updated_at']
+        read_only_fields = ['upload_id', 'received', 'created_at', 'updated_at']
+
+    def validate_size(self, value):
+        if value == 0:
+            raise serializers.ValidationError("The file is empty.")
+        if value > settings.BOOK_VALIDATION['MAX_SIZE']:
+            raise serializers.ValidationError(f"The file must not be larger than {settings.BOOK_VALIDATION['MAX_SIZE']} bytes.")
+        return value
+
+    def validate_filename(self, value):
+        return os.path.basename(value.replace('\\', '/')) or 'book.pdf'
+
+    def validate_title(self, value):
+        if book_title_taken(self.context['request'].user, value):
+            raise serializers.ValidationError("You already have a book with this title.")
+        return value
+
 class QuestionairreSerializer(serializers.ModelSerializer):
     
     book = serializers.SlugRelatedField(
@@ -36,8 +98,8 @@ class QuestionairreSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Questionairre
-        fields = ['id','book','user','question_answers_file','detail_level', 'start_page', 'end_page']
-        read_only_fields = ['user', 'question_answers_file']
+        fields = ['id','book','user','question_answers_file','detail_level', 'status', 'timings', 'start_page', 'end_page']
+        read_only_fields = ['user', 'question_answers_file', 'status', 'timings']
 
     def __init__(self, *args, **kwargs):
         """
@@ -110,7 +172,14 @@ class QuestionairreSerializer(serializers.ModelSerializer):
         Creates a new Questionairre instance.
 
         Generates a question-answer file using AI based on the book's PDF, detail level,
-        and optional page range. Associates the file with the new Questionairre instance.
+        and optional page range. The questionnaire is saved as partial before generation
+        starts and every generated chunk is recorded against it, so a failed generation
+        can be resumed by passing the partial questionnaire in the context as
+        'questionairre'. Once all chunks are generated the file is attached and the
+        questionnaire marked complete, together with the job driving the generation if
+        any; if that job was taken over meanwhile the file is deleted instead and LeaseLost
+        is raised. The time spent in each stage of the generation is stored in 'timings',
+        whether it succeeds or fails.
 
         Parameters:
         validated_data (dict): Validated data for creating the instance.
@@ -120,28 +189,46 @@ class QuestionairreSerializer(serializers.ModelSerializer):
         """
 
         request = self.context.get('request')  
-        user = request.user if request else None  
+        user = validated_data.pop('user', None) or (request.user if request else None)
         book = validated_data.get('book')
         detail_level = validated_data.get('detail_level')
         start_page = validated_data.pop('start_page', None)
         end_page = validated_data.pop('end_page', None)
-        question_file_path = self.generate_question_file(book, detail_level, start_page, end_page)
 
-        
-        return Questionairre.objects.create(
+        self.questionairre = self.context.get('questionairre') or Questionairre.objects.create(
             user=user,
             book=book,
             detail_level=detail_level,
-            question_answers_file=question_file_path
-
+            status='partial'
         )
+        with metrics.collect_timings() as timings:
+            try:
+                with metrics.span('generation'):
+                    question_file_path = self.generate_question_file(book, detail_level, start_page, end_page)
+            except Exception:
+                metrics.count('questionairres_failed')
+                self.questionairre.timings = timings.as_dict()
+                self.questionairre.save(update_fields=['timings'])
+                raise
+            metrics.count('questionairres_completed')
+
+        job = self.context.get('job')
+        with transaction.atomic():
+            if job is not None and not jobs.complete_job(job):
+                default_storage.delete(question_file_path)
+                raise jobs.LeaseLost(job)
+            self.questionairre.question_answers_file = question_file_path
+            self.questionairre.status = 'complete'
+            self.questionairre.timings = timings.as_dict()
+            self.questionairre.save(update_fields=['question_answers_file', 'status', 'timings'])
+        return self.questionairre
 
     def generate_question_file(self, book, detail_level, start_page, end_page):
         """
         Generates a file containing question-answer pairs.
 
         Calls the AI to generate questions and answers, then saves them to a text file
-        in the media directory.
+        in the default storage.
 
         Parameters:
         book (Book): The book instance from which to generate questions.
@@ -150,28 +237,25 @@ class QuestionairreSerializer(serializers.ModelSerializer):
         end_page (int, optional): Ending page for question generation.
 
         Returns:
-        str: The relative path to the generated file.
+        str: The storage name of the generated file.
         """
             
         questions = self.generate_question_answers(book, detail_level, start_page, end_page)
 
         filename = f"{book.title}_{uuid.uuid4().hex[:8]}.txt"
-        file_path = os.path.join("questions", filename)
-
-        full_path = os.path.join(settings.MEDIA_ROOT, "questions")
-        os.makedirs(full_path, exist_ok=True)
-
-        with open(os.path.join(settings.MEDIA_ROOT, file_path), "w", encoding="utf-8") as f:
-            f.write(questions)
+        file_path = posixpath.join("questions", filename)
 
-        return file_path
+        with metrics.span('write_file'):
+            return default_storage.save(file_path, ContentFile(questions.encode("utf-8")))
 
 
     def generate_question_answers(self, book, detail_level, start_page, end_page):
         """
         Generates question-answer pairs based on detail level.
 
-        Maps detail_level to a page chunk size and calls the detail level handler.
+        Maps detail_level to a per-call token budget and calls the detail level handler. The book's
+        content hash is passed along so the page text index and previously generated chunks
+        of the same PDF are reused.
 
         Parameters:
         book (Book): The book instance.
@@ -183,18 +267,17 @@ class QuestionairreSerializer(serializers.ModelSerializer):
         str: The generated question-answer text.
         """
 
-        if detail_level == 'basic':
-            return self.question_detail_level(book.file, 9, start_page, end_page)
-        elif detail_level == 'intermediate':
-            return self.question_detail_level(book.file, 5, start_page, end_page)
-        elif detail_level == 'detailed':
-            return self.question_detail_level(book.file, 3, start_page, end_page)
+        content_hash = book_content_hash(book)
+        chunk_tokens = settings.QUESTIONAIRRE_CHUNK_TOKENS.get(detail_level)
+        if chunk_tokens:
+            return self.question_detail_level(book.file, chunk_tokens, start_page, end_page, detail_level, content_hash)
 
     def under_token_limit(self, prompt, model_name="gemini-2.0-flash", max_tokens=1048000):
         """
         Checks if the prompt is under the token limit for the AI model.
 
-        Uses the Generative AI model to count tokens in the prompt.
+        Tokens are estimated locally; a sample of prompts is verified with the model's
+        tokenizer, see study_space/tokens.py.
 
         Parameters:
         prompt (str): The prompt to check.
@@ -203,70 +286,309 @@ class QuestionairreSerializer(serializers.ModelSerializer):
 
         Returns:
         tuple: (bool, int) - Whether under limit and the token count.
+        """
 
-        Raises:
-        Logs an error if token counting fails.
+        with metrics.span('token_count'):
+            input_tokens = count_tokens(prompt, model_name)
+        return input_tokens <= max_tokens, input_tokens
+
+    def question_generator(self, prompt, tokens=0):
         """
+        Generates content using the Google Gemini AI model.
 
-        try:
-            generativeai.configure(api_key=os.environ.get('GEMINI_API_KEY'))
-            
-            model = generativeai.GenerativeModel(model_name)
-            input_tokens = model.count_tokens(prompt).total_tokens
-            if input_tokens > max_tokens:
-                return False, input_tokens
-            else:
-                return True, input_tokens
+        Goes through the shared model backend, see study_space/llm.py, which waits for
+        the Gemini rate limiter so every process stays within the configured request,
+        token and per-user budgets.
+
+        Parameters:
+        prompt (str): The prompt for content generation.
+        tokens (int, optional): Number of input tokens in the prompt, charged against the token budget.
 
-        except Exception as e:
-            logging.error(f"An error occured during token limit check: {e}")
-            return False, 0
+        Returns:
+        str: The generated text from the AI model.
+        """
 
+        return llm.generate(prompt, tokens=tokens, user=self.generation_user())
 
-    def question_generator(self, prompt):
+    async def question_generator_async(self, prompt, tokens=0):
         """
-        Generates content using the Google Gemini AI model.
+        Async counterpart of question_generator.
 
-        Implements rate limiting using Django cache to avoid exceeding API limits.
+        The rate limiter wait and the model call both yield to the event loop, so one
+        thread can keep many chunks in flight.
 
         Parameters:
         prompt (str): The prompt for content generation.
+        tokens (int, optional): Number of input tokens in the prompt, charged against the token budget.
 
         Returns:
         str: The generated text from the AI model.
         """
 
-        client = genai.Client(api_key=os.environ.get('GEMINI_API_KEY'))
-       
-        while True:
+        return await llm.agenerate(prompt, tokens=tokens, user=self.generation_user())
+
+    def generation_user(self):
+        """
+        Returns the user questions are being generated for.
+
+        Returns:
+        User or None: The job's user, the request's user, or None.
+        """
+
+        job = self.context.get('job')
+        if job is not None:
+            return job.user
+        request = self.context.get('request')
+        return request.user if request else None
+
+    def report_progress(self, completed_chunks=None, total_chunks=None):
+        """
+        Records chunk progress on the job driving this serializer, if any.
+
+        Generation started from a QuestionairreJob passes the job through the serializer
+        context so the status endpoint can report how many chunks are finished.
 
-            last_request_time = cache.get('last_gemini_request_time', 0)
-            now = time.time()
-            delay = 4
+        Parameters:
+        completed_chunks (int, optional): Number of chunks generated so far.
+        total_chunks (int, optional): Number of chunks the generation was split into.
+        """
+
+        job = self.context.get('job')
+        if job is None:
+            return
+
+        progress = {}
+        if completed_chunks is not None:
+            progress['completed_chunks'] = completed_chunks
+        if total_chunks is not None:
+            progress['total_chunks'] = total_chunks
+        for attr, value in progress.items():
+            setattr(job, attr, value)
+        QuestionairreJob.objects.filter(pk=job.pk).update(**progress)
+
+    def recorded_chunks(self):
+        """
+        Returns the chunks already generated for the questionnaire being created.
+
+        Returns:
+        dict: The question-answer text keyed by (start_page, end_page, part).
+        """
+
+        questionairre = getattr(self, 'questionairre', None)
+        if questionairre is None:
+            return {}
+        chunks = questionairre.questionairre_chunk.values_list('start_page', 'end_page', 'part', 'question_answers')
+        return {(start_page, end_page, part): question_answers for start_page, end_page, part, question_answers in chunks}
+
+    def record_chunk(self, span, question_answers):
+        """
+        Saves a generated chunk against the questionnaire being created.
+
+        Parameters:
+        span (tuple): (start_page, end_page, part), pages 1-indexed and inclusive.
+        question_answers (str): The generated question-answer text.
+        """
 
-            if now - last_request_time >= delay:
-                 
-                response = client.models.generate_content(
-                    model="gemini-2.0-flash", contents=prompt
+        questionairre = getattr(self, 'questionairre', None)
+        if questionairre is None:
+            return
+        start_page, end_page, part = span
+        try:
+            with transaction.atomic():
+                QuestionairreChunk.objects.get_or_create(
+                    questionairre=questionairre,
+                    start_page=start_page,
+                    end_page=end_page,
+                    part=part,
+                    defaults={'question_answers': question_answers},
                 )
-                cache.set('last_gemini_request_time', time.time())
-                return response.text
-            else:
-                 time.sleep(delay - (now - last_request_time))
+        except IntegrityError:
+            pass
+
+    def generate_chunk(self, prompt):
+        """
+        Generates the question-answer pairs for a single chunk.
+
+        Parameters:
+        prompt (str): The prompt built from the chunk's pages.
+
+        Returns:
+        str: The generated text from the AI model.
+
+        Raises:
+        ValidationError: If the prompt exceeds the model's token limit.
+        """
+
+        within_limit, input_tokens = self.under_token_limit(prompt=prompt)
+        if within_limit == False:
+            raise serializers.ValidationError("Token limit exceeded")
+        metrics.count('input_tokens', input_tokens)
+        return self.question_generator(prompt=prompt, tokens=input_tokens)
+
+    async def generate_chunk_async(self, prompt):
+        """
+        Async counterpart of generate_chunk.
+
+        The token check can call the model's tokenizer, so it runs in a thread.
+
+        Parameters:
+        prompt (str): The prompt built from the chunk's pages.
+
+        Returns:
+        str: The generated text from the AI model.
+
+        Raises:
+        ValidationError: If the prompt exceeds the model's token limit.
+        """
+
+        within_limit, input_tokens = await sync_to_async(self.under_token_limit, thread_sensitive=False)(prompt=prompt)
+        if within_limit == False:
+            raise serializers.ValidationError("Token limit exceeded")
+        metrics.count('input_tokens', input_tokens)
+        return await self.question_generator_async(prompt=prompt, tokens=input_tokens)
+
+    def generate_chunk_in_thread(self, prompt):
+        """
+        Runs generate_chunk on a pool thread and releases the thread's database connections.
+
+        Parameters:
+        prompt (str): The prompt built from the chunk's pages.
 
+        Returns:
+        str: The generated text from the AI model.
+        """
+
+        try:
+            return self.generate_chunk(prompt)
+        finally:
+            connections.close_all()
 
-    def question_detail_level(self, path, page_count , start_page, end_page):
+    def generate_chunks(self, prompts, on_chunk_done=None):
+        """
+        Generates the question-answer pairs for every chunk.
+
+        Chunks are dispatched to a thread pool of at most QUESTIONAIRRE_CHUNK_CONCURRENCY
+        threads, or to an event loop when QUESTIONAIRRE_ASYNC_GENERATION is enabled, see
+        generate_chunks_async; question_generator keeps every call within the rate limit.
+        Results are returned in the order of the prompts regardless of the order they
+        complete in.
+
+        Parameters:
+        prompts (list): The prompts, one per chunk, in page order.
+        on_chunk_done (callable, optional): Called on the calling thread with the index and
+            text of each chunk as soon as it is generated, including chunks that finish
+            after another chunk failed.
+
+        Returns:
+        list: The generated text of each chunk, in page order.
+        """
+
+        if settings.QUESTIONAIRRE_ASYNC_GENERATION:
+            return async_to_sync(self.generate_chunks_async)(prompts, on_chunk_done)
+
+        concurrency = min(settings.QUESTIONAIRRE_CHUNK_CONCURRENCY, len(prompts))
+        if concurrency <= 1:
+            results = []
+            for index, prompt in enumerate(prompts):
+                results.append(self.generate_chunk(prompt))
+                if on_chunk_done:
+                    on_chunk_done(index, results[-1])
+            return results
+
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='questionairre-chunk') as executor:
+            # Each chunk runs in a copy of this context so its stages are recorded on this generation's timings.
+            futures = {
+                executor.submit(contextvars.copy_context().run, self.generate_chunk_in_thread, prompt): index
+                for index, prompt in enumerate(prompts)
+            }
+            reported = set()
+            try:
+                for future in as_completed(futures):
+                    questions = future.result()
+                    if on_chunk_done:
+                        on_chunk_done(futures[future], questions)
+                    reported.add(future)
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                if on_chunk_done:
+                    # Chunks already in flight are paid for, so keep the ones that succeed.
+                    for future in as_completed([future for future in futures if not future.cancelled()]):
+                        if future not in reported and future.exception() is None:
+                            on_chunk_done(futures[future], future.result())
+                raise
+            return [future.result() for future in futures]
+
+    async def generate_chunks_async(self, prompts, on_chunk_done=None):
+        """
+        Generates the question-answer pairs for every chunk on an event loop.
+
+        At most QUESTIONAIRRE_CHUNK_CONCURRENCY calls are in flight at once, all waiting
+        on the network from a single thread. After a chunk fails no new calls are started,
+        but calls already in flight are awaited and their chunks reported, since they are
+        paid for. on_chunk_done runs in the thread that called generate_chunks.
+
+        Parameters:
+        prompts (list): The prompts, one per chunk, in page order.
+        on_chunk_done (callable, optional): Called with the index and text of each chunk as
+            soon as it is generated.
+
+        Returns:
+        list: The generated text of each chunk, in page order.
+        """
+
+        semaphore = asyncio.Semaphore(max(settings.QUESTIONAIRRE_CHUNK_CONCURRENCY, 1))
+        failed = asyncio.Event()
+        results = [None] * len(prompts)
+
+        async def generate(index, prompt):
+            async with semaphore:
+                if failed.is_set():
+                    return index, None, False
+                try:
+                    return index, await self.generate_chunk_async(prompt), True
+                except Exception:
+                    failed.set()
+                    raise
+
+        # Tasks are created here so they start in page order.
+        tasks = [asyncio.ensure_future(generate(index, prompt)) for index, prompt in enumerate(prompts)]
+        error = None
+        for next_done in asyncio.as_completed(tasks):
+            try:
+                index, questions, generated = await next_done
+            except Exception as e:
+                error = error or e
+                continue
+            if generated:
+                results[index] = questions
+                if on_chunk_done:
+                    await sync_to_async(on_chunk_done)(index, questions)
+        if error is not None:
+            raise error
+        return results
+
+    def question_detail_level(self, path, chunk_tokens, start_page, end_page, detail_level=None, content_hash=None):
         """
         Generates question-answer pairs from PDF pages in chunks.
 
-        Reads the PDF, builds prompts in chunks of 'page_count' pages, checks token limits,
-        and generates Q&A using the AI. Handles optional page ranges.
+        Reads the page texts from the per-page text index (extracting them on first use)
+        and packs the pages into chunks of about 'chunk_tokens' tokens, skipping empty pages
+        and splitting oversized ones. The book is always planned from its first page, so
+        overlapping page ranges share chunks. Chunks already recorded for the questionnaire
+        being created are kept, and when a content hash and detail level are given, chunks
+        already generated for the same PDF, with the same chunk budget and model, are taken
+        from the result cache. Only the missing chunks are generated, concurrently, and each
+        one is recorded and cached as soon as it arrives. The chunks are joined in page
+        order. Handles optional page ranges.
 
         Parameters:
         path (FileField): The path to the PDF file.
-        page_count (int): The number of pages per chunk.
+        chunk_tokens (int): The target number of page text tokens per chunk.
         start_page (int, optional): Starting page (1-indexed).
-        end_page (int, optional): Ending page (1-indexed).
+        end_page (int, optional): Ending page (1-indexed, inclusive).
+        detail_level (str, optional): The detail level, part of the result cache key.
+        content_hash (str, optional): The SHA-256 of the PDF, key of the page text index and part of the result cache key.
 
         Returns:
         str: Concatenated question-answer pairs.
@@ -275,102 +597,59 @@ class QuestionairreSerializer(serializers.ModelSerializer):
         ValidationError: If invalid page numbers, token limit exceeded, or unable to generate questions.
         """
 
-        reader = PdfReader(path)
-        num_of_pages = len(reader.pages)
-        question = 'Generate well-thought-out question and answer pairs based solely on the text below. Format each pair as a single line with the question and answer separated by a semicolon (;). If a question or answer contains multiple lines, replace newline characters with <br> to preserve formatting for Anki. Do not add numbering, extra text, or any other content beyond the question and answer pairs. Ensure semicolons do not appear within the question or answer text by replacing any existing semicolons with commas.'
-        prompt = question 
-        question_answer = ""
-        count = page_count - 1
+        page_texts = get_page_texts(path, content_hash)
+        num_of_pages = len(page_texts)
 
+        with metrics.span('plan_chunks'):
+            chunks = plan_chunks(page_texts, chunk_tokens)
         if start_page != None and end_page != None:
-            
-            end_page = end_page + 1
-            
-            if start_page<1 or end_page>num_of_pages:
+            if start_page < 1 or end_page > num_of_pages:
                 raise serializers.ValidationError("Error: Please enter valid page number")
-            
-            start_page = start_page - 1
-            if start_page == end_page:
-                 page = reader.pages[start_page]
-                 text = page.extract_text()
-                 prompt = prompt + " " + text
-                 if prompt.strip() == question.strip():
-                      return "sorry i was unable to generate questions"
-                 question_answer = question_answer + self.question_generator(prompt=prompt)
-                 return question_answer
-
-            if (end_page-start_page) <= count: 
-                for i in range(start_page, end_page):
-                     page = reader.pages[i]
-                     text = page.extract_text()
-                     prompt = prompt + " " + text
-                if prompt.strip() == question.strip():
-                     return "sorry i was unable to generate questions"
-                question_answer = question_answer + self.question_generator(prompt=prompt)
-                return question_answer  
-            
-            for i in range(start_page, end_page):
-
-                page = reader.pages[i]
-                text = page.extract_text()
-                prompt = prompt + " " + text
-
-                if i == count:
-                     if self.under_token_limit(prompt=prompt)[0] == False:
-                          raise serializers.ValidationError("Token limit exceeded")
-                          break
-                     question_answer = question_answer + self.question_generator(prompt=prompt)
-                     prompt = question
-                     count += page_count
-
-                     
-                elif end_page-1 == i and i < count:
-                     if self.under_token_limit(prompt=prompt)[0] == False:
-                          raise serializers.ValidationError("Token limit exceeded")
-
-                          break
-                     question_answer = question_answer + self.question_generator(prompt=prompt)
-                     prompt = question
-
-            return question_answer
-                 
-        else:
-            if num_of_pages <= count:
-                for i in range(num_of_pages):
-                    page = reader.pages[i]
-                    text = page.extract_text()
-                    prompt = prompt + " " + text
-
-                if prompt.strip() == question.strip():
-                    return "sorry i was unable to generate questions"
-
-                question_answer = question_answer + self.question_generator(prompt=prompt)
-                return question_answer
-
-            for i in range(num_of_pages):
-                
-                page = reader.pages[i]
-                text = page.extract_text()
-                prompt = prompt + " " + text
-
-                if i == count:
-                    if self.under_token_limit(prompt=prompt)[0] == False:
-                            raise serializers.ValidationError("Token limit exceeded")
-                            break
-                    question_answer = question_answer + self.question_generator(prompt=prompt)
-                    prompt = question
-                    
-                    count += page_count
-
-                elif num_of_pages-1 == i and i < count:
-                    if self.under_token_limit(prompt=prompt)[0] == False:
-                            raise serializers.ValidationError("Token limit exceeded")
-                            break
-                    
-                    question_answer = question_answer + self.question_generator(prompt=prompt)
-                    prompt = question
-
-                    
-            return question_answer
+            chunks = select_chunks(chunks, page_texts, start_page, end_page)
+
+        if not chunks:
+            return "sorry i was unable to generate questions"
+
+        spans = [(chunk.start_page, chunk.end_page, chunk.part) for chunk in chunks]
+        recorded = self.recorded_chunks()
+        results = {span: recorded[span] for span in spans if span in recorded}
+        use_cache = bool(detail_level and content_hash) and settings.QUESTIONAIRRE_RESULT_CACHE
+        if use_cache:
+            cache_key = (content_hash, detail_level, PROMPT_VERSION, chunk_tokens, llm.get_llm_backend().model)
+            uncached = [span for span in spans if span not in results]
+            with metrics.span('result_cache'):
+                cached = get_cached_chunks(*cache_key, uncached)
+            for span, questions in cached.items():
+                results[span] = questions
+                self.record_chunk(span, questions)
+        missing = [chunk for chunk in chunks if chunk[:3] not in results]
+
+        self.report_progress(completed_chunks=len(results), total_chunks=len(chunks))
+
+        def chunk_done(index, questions):
+            span = missing[index][:3]
+            results[span] = questions
+            self.record_chunk(span, questions)
+            if use_cache:
+                store_chunk(*cache_key, span, questions)
+            self.report_progress(completed_chunks=len(results))
+
+        self.generate_chunks([QUESTION_PROMPT + " " + chunk.text for chunk in missing], chunk_done)
+        return "".join(results[span] for span in spans)
+
+
+class QuestionairreJobSerializer(serializers.ModelSerializer):
+    """
+    Read-only serializer for QuestionairreJob.
 
+    Exposes the job status and chunk progress so clients can poll a questionnaire
+    generation started through POST /questionairre/.
+    """
+
+    book = serializers.SlugRelatedField(read_only=True, slug_field='title')
 
+    class Meta:
+        model = QuestionairreJob
+        fields = ['id', 'book', 'user', 'questionairre', 'detail_level', 'start_page', 'end_page',
+                  'status', 'total_chunks', 'completed_chunks', 'error', 'created_at', 'updated_at']
+        read_only_fields = fields
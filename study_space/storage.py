@@ -0,0 +1,147 @@
+import hashlib
+import posixpath
+import shutil
+import tempfile
+from urllib.parse import quote
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, Storage
+from django.utils.deconstruct import deconstructible
+
+try:
+    import boto3
+except ImportError:
+    boto3 = None
+
+# Files read from S3 are kept in memory up to this size, then spooled to a temporary file.
+SPOOL_SIZE = 4 * 1024 * 1024
+
+
+@deconstructible(path='study_space.storage.ShardedFileSystemStorage')
+class ShardedFileSystemStorage(FileSystemStorage):
+    """
+    Local storage that spreads the files of each directory over 256 * 256 subdirectories.
+
+    'questions/biology.txt' is stored as 'questions/3f/a2/biology.txt', the shards taken from
+    a hash of the file name, so no directory grows large enough to slow down the filesystem
+    or backups.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        directory, filename = posixpath.split(name)
+        digest = hashlib.sha1(filename.encode()).hexdigest()
+        return super().get_available_name(posixpath.join(directory, digest[:2], digest[2:4], filename), max_length)
+
+
+def error_code(error):
+    """Returns the S3 error code of a client exception, such as 'NoSuchKey' or '404'."""
+
+    return getattr(error, 'response', {}).get('Error', {}).get('Code')
+
+
+@deconstructible(path='study_space.storage.S3Storage')
+class S3Storage(Storage):
+    """
+    Storage on an S3-compatible object store (AWS S3, MinIO, Ceph...), shared by every API node.
+
+    It needs boto3, or a client with the same interface passed as 'client'. Files are
+    served from 'custom_domain', such as a CDN in front of the bucket, or else through
+    presigned URLs.
+
+    Parameters:
+    bucket_name (str): The bucket.
+    endpoint_url (str, optional): The endpoint of an S3-compatible store, None for AWS.
+    access_key (str, optional): The access key, None for boto3's default credentials.
+    secret_key (str, optional): The secret key.
+    region_name (str, optional): The region.
+    location (str, optional): A prefix for every key.
+    custom_domain (str, optional): The domain files are served from.
+    querystring_expire (int, optional): Seconds presigned URLs are valid for.
+    client (optional): The S3 client, created with boto3 when None.
+    """
+
+    def __init__(self, bucket_name=None, endpoint_url=None, access_key=None, secret_key=None, region_name=None,
+                 location='', custom_domain=None, querystring_expire=3600, client=None):
+        if not bucket_name:
+            raise ImproperlyConfigured("S3Storage needs a bucket_name")
+        self.bucket_name = bucket_name
+        self.endpoint_url = endpoint_url
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region_name = region_name
+        self.location = location.strip('/')
+        self.custom_domain = custom_domain
+        self.querystring_expire = querystring_expire
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            if boto3 is None:
+                raise ImproperlyConfigured("S3Storage needs boto3, install it with 'pip install boto3'")
+            self._client = boto3.client(
+                's3',
+                endpoint_url=self.endpoint_url,
+                aws_access_key_id=self.access_key,
+                aws_secret_access_key=self.secret_key,
+                region_name=self.region_name,
+            )
+        return self._client
+
+    def key(self, name):
+        return posixpath.join(self.location, name) if self.location else name
+
+    def head(self, name):
+        return self.client.head_object(Bucket=self.bucket_name, Key=self.key(name))
+
+    def _open(self, name, mode='rb'):
+        if 'w' in mode or 'a' in mode:
+            raise ValueError("S3Storage files can only be opened for reading")
+        body = self.client.get_object(Bucket=self.bucket_name, Key=self.key(name))['Body']
+        spooled = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+        shutil.copyfileobj(body, spooled)
+        spooled.seek(0)
+        return File(spooled, name)
+
+    def _save(self, name, content):
+        content.seek(0)
+        extra = {'ContentType': content.content_type} if getattr(content, 'content_type', None) else {}
+        self.client.upload_fileobj(content, self.bucket_name, self.key(name), ExtraArgs=extra)
+        return name
+
+    def delete(self, name):
+        self.client.delete_object(Bucket=self.bucket_name, Key=self.key(name))
+
+    def exists(self, name):
+        try:
+            self.head(name)
+        except Exception as e:
+            if error_code(e) in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+        return True
+
+    def listdir(self, path):
+        prefix = self.key(path).rstrip('/') + '/' if path or self.location else ''
+        directories, files = [], []
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix, Delimiter='/'):
+            directories.extend(entry['Prefix'][len(prefix):].rstrip('/') for entry in page.get('CommonPrefixes', []))
+            files.extend(entry['Key'][len(prefix):] for entry in page.get('Contents', []))
+        return directories, files
+
+    def size(self, name):
+        return self.head(name)['ContentLength']
+
+    def get_modified_time(self, name):
+        return self.head(name)['LastModified']
+
+    def url(self, name):
+        if self.custom_domain:
+            return f"https://{self.custom_domain}/{quote(self.key(name))}"
+        return self.client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': self.bucket_name, 'Key': self.key(name)},
+            ExpiresIn=self.querystring_expire,
+        )
@@ -0,0 +1,149 @@
+import asyncio
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework.renderers import BaseRenderer
+
+from study_space.models import QuestionairreChunk, QuestionairreJob
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Lets clients ask for 'text/event-stream' on views that stream Server-Sent Events.
+
+    Only error responses go through the renderer; streams are written directly.
+    """
+
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return format_event('error', data)
+
+
+def format_event(event, data, event_id=None):
+    """
+    Formats a Server-Sent Event.
+
+    Parameters:
+    event (str): The event name.
+    data: JSON serializable event data.
+    event_id (int, optional): The event id clients send back in Last-Event-ID when reconnecting.
+
+    Returns:
+    str: The event, terminated by a blank line.
+    """
+
+    lines = [] if event_id is None else [f"id: {event_id}"]
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data)}")
+    return "\n".join(lines) + "\n\n"
+
+
+class JobEventStream:
+    """
+    Streams the progress of a questionnaire generation job as Server-Sent Events.
+
+    The job's chunks are sent as 'chunk' events as soon as the worker records them,
+    in the order they are generated; each carries its page span so clients can put
+    them in page order. 'progress' events follow the job's chunk counts and the stream
+    ends with a 'complete' or 'failed' event. Chunk events have the chunk's id as event
+    id, so a client reconnecting with Last-Event-ID only receives the chunks it missed.
+
+    The stream can be consumed synchronously under WSGI or asynchronously under ASGI.
+    """
+
+    def __init__(self, job_id, last_event_id=0, poll_interval=None, keepalive=None):
+        self.job_id = job_id
+        self.last_chunk_id = last_event_id
+        self.poll_interval = settings.QUESTIONAIRRE_STREAM_POLL_INTERVAL if poll_interval is None else poll_interval
+        self.keepalive = settings.QUESTIONAIRRE_STREAM_KEEPALIVE if keepalive is None else keepalive
+        self.progress = None
+        self.finished = False
+
+    def poll(self):
+        """
+        Reads the job once and returns the events that happened since the last poll.
+
+        The job is read before its chunks: a worker records every chunk before marking
+        the job finished, so once a finished job is seen all of its chunks are sent.
+
+        Returns:
+        list: The formatted events.
+        """
+
+        job = QuestionairreJob.objects.filter(pk=self.job_id).values(
+            'status', 'error', 'questionairre_id', 'completed_chunks', 'total_chunks'
+        ).first()
+        if job is None:
+            self.finished = True
+            return [format_event('failed', {'error': 'job not found'})]
+
+        events = []
+        if job['questionairre_id'] is not None:
+            chunks = QuestionairreChunk.objects.filter(
+                questionairre_id=job['questionairre_id'], pk__gt=self.last_chunk_id
+            ).order_by('pk').values('pk', 'start_page', 'end_page', 'part', 'question_answers')
+            for chunk in chunks:
+                self.last_chunk_id = chunk.pop('pk')
+                events.append(format_event('chunk', chunk, event_id=self.last_chunk_id))
+
+        progress = (job['status'], job['completed_chunks'], job['total_chunks'])
+        if progress != self.progress:
+            self.progress = progress
+            events.append(format_event('progress', {
+                'status': job['status'],
+                'completed_chunks': job['completed_chunks'],
+                'total_chunks': job['total_chunks'],
+            }))
+
+        if job['status'] == 'complete':
+            self.finished = True
+            events.append(format_event('complete', {'questionairre': job['questionairre_id']}))
+        elif job['status'] == 'failed':
+            self.finished = True
+            events.append(format_event('failed', {'error': job['error']}))
+        return events
+
+    def next_message(self, events, quiet_since):
+        """
+        Returns the text to send after a poll, or None, and when the stream last sent something.
+
+        A comment is sent when nothing happened for 'keepalive' seconds, so proxies and
+        clients do not drop a connection that is waiting on a slow chunk.
+
+        Parameters:
+        events (list): The events returned by poll.
+        quiet_since (float): When the stream last sent something, on the monotonic clock.
+
+        Returns:
+        tuple: The text to send or None, and the updated quiet_since.
+        """
+
+        now = time.monotonic()
+        if events:
+            return "".join(events), now
+        if now - quiet_since >= self.keepalive:
+            return ": keep-alive\n\n", now
+        return None, quiet_since
+
+    def __iter__(self):
+        quiet_since = time.monotonic()
+        while not self.finished:
+            message, quiet_since = self.next_message(self.poll(), quiet_since)
+            if message:
+                yield message
+            if not self.finished:
+                time.sleep(self.poll_interval)
+
+    async def __aiter__(self):
+        quiet_since = time.monotonic()
+        while not self.finished:
+            message, quiet_since = self.next_message(await sync_to_async(self.poll)(), quiet_since)
+            if message:
+                yield message
+            if not self.finished:
+                await asyncio.sleep(self.poll_interval)
@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+
+
+class QueryCountAssertionsMixin:
+    """Assertions on the number of queries an endpoint makes, for API test cases."""
+
+    def captureQueries(self, request):
+        """
+        Sends a request and returns the queries it made.
+
+        Listings are not cached meanwhile, so every request reaches the database.
+
+        Parameters:
+        request (callable): Sends the request, returns the response.
+
+        Returns:
+        list: The SQL of the queries.
+        """
+
+        with override_settings(LISTINGS={**settings.LISTINGS, 'TIMEOUT': 0}), CaptureQueriesContext(connection) as queries:
+            response = request()
+        self.assertLess(response.status_code, 400, getattr(response, 'data', None))
+        return [query['sql'] for query in queries.captured_queries]
+
+    def assertQueriesDoNotGrow(self, request, add_row, sizes=(1, 5)):
+        """
+        Fails if an endpoint makes more queries as its result grows.
+
+        Parameters:
+        request (callable): Sends the request, returns the response.
+        add_row (callable): Adds one row to the result, called with the number of rows added so far.
+        sizes (tuple, optional): The result sizes to compare.
+        """
+
+        queries = {}
+        added = 0
+        for size in sizes:
+            while added < size:
+                add_row(added)
+                added += 1
+            queries[size] = self.captureQueries(request)
+        self.assertSameQueryCounts(queries)
+
+    def assertSameQueryCounts(self, queries):
+        """
+        Fails unless every request made as many queries.
+
+        Parameters:
+        queries (dict): The queries of each request, by result size.
+        """
+
+        counts = {size: len(sql) for size, sql in queries.items()}
+        self.assertEqual(len(set(counts.values())), 1, f"queries by result size: {counts}\n" + "\n".join(queries[max(queries)]))
@@ -0,0 +1,85 @@
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from study_space.benchmark import BookResult, percentile, run_benchmark, run_listing_benchmark, summarize, synthetic_pdf
+from study_space.models import Book, Questionairre
+from study_space.pdf_engine import count_pages, extract_range
+from io import StringIO
+import json
+
+
+class SyntheticPdfTest(SimpleTestCase):
+
+    def test_pages_and_words(self):
+        pdf = synthetic_pdf(3, words_per_page=48)
+        self.assertEqual(count_pages(pdf), 3)
+        texts = extract_range(pdf, 0, 3)
+        self.assertTrue(all(len(text.split()) == 48 for text in texts))
+
+    def test_seed_controls_content(self):
+        self.assertEqual(synthetic_pdf(2, seed=1), synthetic_pdf(2, seed=1))
+        self.assertNotEqual(synthetic_pdf(2, seed=1), synthetic_pdf(2, seed=2))
+
+    def test_percentile(self):
+        values = [5, 1, 4, 2, 3]
+        self.assertEqual(percentile(values, 50), 3)
+        self.assertEqual(percentile(values, 95), 5)
+        self.assertEqual(percentile([], 50), 0.0)
+
+    def test_summarize(self):
+        summary = summarize([BookResult(10, 1.0, 2, 2), BookResult(30, 3.0, 4, 4)])
+        self.assertEqual(summary['books'], 2)
+        self.assertEqual(summary['pages_per_second'], 10.0)
+        self.assertEqual(summary['calls_per_book'], 3.0)
+
+
+@override_settings(PDF_EXTRACTION={'WORKERS': 1, 'PAGES_PER_TASK': 8, 'PAGE_TIMEOUT': 10, 'MEMORY_LIMIT_MB': None, 'MIN_PAGES': 0})
+class QuestionairrePipelineBenchmark(TestCase):
+
+    def test_full_pipeline(self):
+        results = run_benchmark([1, 12], runs=2, detail_level='detailed')
+        self.assertEqual([result.pages for result in results], [1, 1, 12, 12])
+        for result in results:
+            self.assertGreater(result.llm_calls, 0)
+            self.assertEqual(result.llm_calls, result.chunks)
+        self.assertGreater(results[-1].llm_calls, results[0].llm_calls)
+
+        self.assertFalse(Book.objects.exists())
+        self.assertFalse(Questionairre.objects.exists())
+        self.assertFalse(User.objects.exists())
+
+    def test_chunks_generated_concurrently(self):
+        latency = 0.2
+        sequential = run_benchmark([12], runs=1, detail_level='detailed', latency=latency, concurrency=1)[0]
+        concurrent = run_benchmark([12], runs=1, detail_level='detailed', latency=latency, concurrency=4)[0]
+        self.assertGreaterEqual(sequential.llm_calls, 4)
+        self.assertGreaterEqual(sequential.seconds, sequential.llm_calls * latency)
+        self.assertLess(concurrent.seconds, sequential.seconds / 2)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('benchmark_questionairre', '--pages', '1', '3', '--runs', '1', '--latency', '0', '--json', stdout=out)
+        summaries = json.loads(out.getvalue())
+        self.assertEqual(set(summaries), {'1', '3', 'all'})
+        self.assertEqual(summaries['all']['books'], 2)
+        self.assertIn('p95_seconds', summaries['all'])
+
+
+class ListingBenchmark(TestCase):
+
+    def test_listing_benchmark(self):
+        results = run_listing_benchmark(rows=300, runs=1)
+        self.assertEqual([(result.listing, result.serializer) for result in results], [
+            ('books', 'model'), ('books', 'read'), ('questionairres', 'model'), ('questionairres', 'read'),
+        ])
+        self.assertTrue(all(result.rows == 300 and result.seconds > 0 for result in results))
+        self.assertFalse(Book.objects.exists())
+        self.assertFalse(User.objects.exists())
+
+    def test_command(self):
+        out = StringIO()
+        call_command('benchmark_listings', '--rows', '50', '--runs', '1', '--json', stdout=out)
+        summaries = json.loads(out.getvalue())
+        self.assertEqual(set(summaries), {'books', 'questionairres'})
+        self.assertIn('objects_per_second', summaries['books']['read'])
+        self.assertIn('speedup', summaries['questionairres'])
@@ -4,6 +4,9 @@ from rest_framework.authtoken.models import Token
 from django.contrib.auth.models import User
 from study_space.models import Book
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from unittest.mock import patch
 import os
 
 class BookAPITests(APITestCase):
@@ -80,6 +83,10 @@ class BookAPITests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['title'], 'Test Book')
     
+    def test_get_book_detail_hides_normalized_title(self):
+        response = self.client.get('/book/Test%20Book/')
+        self.assertNotIn('normalized_title', response.data)
+
     def test_get_book_detail_case_insensitive(self):
         response = self.client.get('/book/test%20book/')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
@@ -147,4 +154,70 @@ class BookAPITests(APITestCase):
         }
         response = self.client.put('/book/Test%20Book/', data, format='multipart')
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
-        
\ No newline at end of file
+        
+    def test_post_book_too_large_rejected_while_received(self):
+        with self.settings(BOOK_VALIDATION={'MAX_SIZE': 1024 * 1024, 'MAX_PAGES': 100}):
+            data = {
+                'title': 'Huge Book',
+                'file': SimpleUploadedFile('huge.pdf', b'%PDF-1.4\n' + b'0' * (2 * 1024 * 1024), content_type='application/pdf')
+            }
+            response = self.client.post('/book/', data, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {'file': ['File must not be larger than 1 MB']})
+        self.assertFalse(Book.objects.filter(title='Huge Book').exists())
+
+    def test_post_book_not_pdf_rejected_while_received(self):
+        data = {
+            'title': 'Text Book',
+            'file': SimpleUploadedFile('notes.pdf', b'plain text ' * 1000, content_type='application/pdf')
+        }
+        response = self.client.post('/book/', data, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {'file': ['File type not Known']})
+
+    def test_post_book_title_taken_ignoring_case(self):
+        with open(self.valid_pdf_path, 'rb') as f:
+            response = self.client.post('/book/', {'title': 'TEST book', 'file': f}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {'title': ['You already have a book with this title.']})
+        self.assertEqual(Book.objects.filter(user=self.user).count(), 1)
+
+    def test_put_book_title_taken_ignoring_case(self):
+        Book.objects.create(title='Other Book', user=self.user, file=SimpleUploadedFile('other.pdf', b'file_content'))
+        self.files_to_clean.append(Book.objects.get(title='Other Book').file.path)
+        response = self.client.put('/book/Test%20Book/', {'title': 'other BOOK'}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.put('/book/Test%20Book/', {'title': 'TEST BOOK'}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.title, self.book.normalized_title), ('TEST BOOK', 'test book'))
+
+    def test_post_book_title_taken_concurrently(self):
+        # Another request saved the title after this one checked it.
+        files = os.listdir(os.path.dirname(self.book.file.path))
+        with patch('study_space.views.book_title_taken', return_value=False):
+            with open(self.valid_pdf_path, 'rb') as f:
+                response = self.client.post('/book/', {'title': 'TEST book', 'file': f}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {'title': ['You already have a book with this title.']})
+        self.assertEqual(Book.objects.filter(user=self.user).count(), 1)
+        self.assertCountEqual(os.listdir(os.path.dirname(self.book.file.path)), files)
+
+    def test_put_book_title_taken_concurrently(self):
+        Book.objects.create(title='Other Book', user=self.user, file=SimpleUploadedFile('other.pdf', b'file_content'))
+        self.files_to_clean.append(Book.objects.get(title='Other Book').file.path)
+        with patch('study_space.views.book_title_taken', return_value=False):
+            response = self.client.put('/book/Test%20Book/', {'title': 'other BOOK'}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {'title': ['You already have a book with this title.']})
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.title, 'Test Book')
+
+    def test_get_book_detail_uses_normalized_title(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/book/TEST%20book/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        book_query = [query['sql'] for query in queries.captured_queries if 'study_space_book' in query['sql']][0]
+        self.assertRegex(book_query, r'normalized_title\W? = ')
+        self.assertNotIn('LIKE', book_query)
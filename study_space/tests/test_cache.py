@@ -0,0 +1,194 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, override_settings
+from study_space.cache import AtomicRedisCache, LockedFileBasedCache, TieredCache, supports_compare_and_set
+from study_space.rate_limit import FakeClock, RateLimiter
+from concurrent.futures import ThreadPoolExecutor
+from unittest import skipUnless
+from unittest.mock import patch
+import os
+import shutil
+import tempfile
+import time
+
+
+class CacheTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.rate_limit_location = tempfile.mkdtemp()
+        self.settings_override = override_settings(CACHES={
+            'default': {
+                'BACKEND': 'study_space.cache.TieredCache',
+                'LOCATION': self.id(),
+                'OPTIONS': {'SHARED': 'shared', 'LOCAL_MAX_ENTRIES': 16, 'LOCAL_TIMEOUT': 60},
+            },
+            'shared': {'BACKEND': 'study_space.cache.LockedFileBasedCache', 'LOCATION': self.location},
+            'rate_limit': {
+                'BACKEND': 'study_space.cache.LockedFileBasedCache',
+                'LOCATION': self.rate_limit_location,
+                'OPTIONS': {'MAX_ENTRIES': None},
+            },
+            'locmem': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': self.id()},
+        })
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.location, ignore_errors=True)
+        shutil.rmtree(self.rate_limit_location, ignore_errors=True)
+
+
+class LockedFileBasedCacheTest(CacheTestCase):
+
+    def test_add_is_atomic(self):
+        shared = caches['shared']
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            added = list(pool.map(lambda i: LockedFileBasedCache(self.location, {}).add('key', i), range(32)))
+        self.assertEqual(added.count(True), 1)
+        self.assertEqual(shared.get('key'), added.index(True))
+
+    def test_incr_is_atomic_and_keeps_expiry(self):
+        shared = caches['shared']
+        shared.set('counter', 0, timeout=2)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(lambda i: LockedFileBasedCache(self.location, {}).incr('counter'), range(50)))
+        self.assertEqual(shared.get('counter'), 50)
+        self.assertLessEqual(shared.read('counter')[1], time.time() + 2)
+        with self.assertRaises(ValueError):
+            shared.incr('missing')
+
+    def test_compare_and_set(self):
+        shared = caches['shared']
+        self.assertTrue(shared.compare_and_set('key', None, 1))
+        self.assertFalse(shared.compare_and_set('key', None, 2))
+        self.assertTrue(shared.compare_and_set('key', 1, 3))
+        self.assertEqual(shared.get('key'), 3)
+
+
+class TieredCacheTest(CacheTestCase):
+
+    def test_reads_are_served_locally(self):
+        cache = caches['default']
+        cache.set('key', 'value')
+        with patch.object(LockedFileBasedCache, 'get') as shared_get:
+            self.assertEqual(cache.get('key'), 'value')
+        shared_get.assert_not_called()
+        self.assertEqual(caches['shared'].get('key'), 'value')
+
+    def test_misses_read_the_shared_cache(self):
+        caches['shared'].set('key', 'value')
+        self.assertEqual(caches['default'].get('key'), 'value')
+        self.assertIsNone(caches['default'].get('other'))
+        caches['default'].delete('key')
+        self.assertIsNone(caches['shared'].get('key'))
+        self.assertIsNone(caches['default'].get('key'))
+
+    def test_local_entries_expire(self):
+        cache = caches['default']
+        cache.set('key', 'value')
+        caches['shared'].set('key', 'changed')
+        self.assertEqual(cache.get('key'), 'value')
+        cache.local.expire(time.monotonic() + 61)
+        self.assertEqual(cache.get('key'), 'changed')
+
+    def test_incr_and_compare_and_set_run_on_the_shared_cache(self):
+        cache = caches['default']
+        cache.set('counter', 1)
+        self.assertEqual(cache.incr('counter', 2), 3)
+        self.assertEqual(caches['shared'].get('counter'), 3)
+
+        self.assertTrue(cache.compare_and_set('key', None, 'mine'))
+        caches['shared'].set('key', 'theirs')
+        self.assertFalse(cache.compare_and_set('key', 'mine', 'again'))
+        self.assertEqual(cache.get('key'), 'theirs')
+
+    def test_compare_and_set_needs_shared_support(self):
+        cache = TieredCache(f'{self.id()}-locmem', {'OPTIONS': {'SHARED': 'locmem'}})
+        self.assertTrue(cache.add('counter', 0))
+        self.assertEqual(cache.incr('counter'), 1)
+        with self.assertRaises(NotImplementedError):
+            cache.compare_and_set('key', None, 1)
+
+
+@skipUnless(os.environ.get('TEST_REDIS_URL'), "set TEST_REDIS_URL to test against Redis")
+class AtomicRedisCacheTest(SimpleTestCase):
+
+    def setUp(self):
+        self.cache = AtomicRedisCache(os.environ.get('TEST_REDIS_URL', ''), {'KEY_PREFIX': self.id()})
+
+    def tearDown(self):
+        self.cache.delete('key')
+
+    def test_compare_and_set(self):
+        self.assertTrue(self.cache.compare_and_set('key', None, 1))
+        self.assertFalse(self.cache.compare_and_set('key', None, 2))
+        self.assertTrue(self.cache.compare_and_set('key', 1, 3))
+        self.assertEqual(self.cache.get('key'), 3)
+
+    def test_compare_and_set_is_atomic(self):
+        self.cache.set('key', 0)
+
+        def increment(i):
+            while True:
+                value = self.cache.get('key')
+                if self.cache.compare_and_set('key', value, value + 1):
+                    return
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(increment, range(50)))
+        self.assertEqual(self.cache.get('key'), 50)
+
+
+class SharedCacheSupportTest(CacheTestCase):
+
+    def test_supports_compare_and_set(self):
+        self.assertTrue(supports_compare_and_set(caches['default']))
+        self.assertTrue(supports_compare_and_set(caches['shared']))
+        self.assertFalse(supports_compare_and_set(caches['locmem']))
+        self.assertFalse(supports_compare_and_set(TieredCache(f'{self.id()}-locmem', {'OPTIONS': {'SHARED': 'locmem'}})))
+
+    def test_rate_limiter_needs_compare_and_set(self):
+        with self.assertRaises(ImproperlyConfigured):
+            RateLimiter(requests_per_minute=4, cache='locmem')
+
+    def test_tests_use_temporary_file_based_caches(self):
+        self.settings_override.disable()
+        try:
+            for alias in ('shared', 'rate_limit'):
+                self.assertNotIn(str(settings.BASE_DIR), settings.CACHES[alias]['LOCATION'])
+        finally:
+            self.settings_override.enable()
+
+
+class SharedRateLimiterTest(CacheTestCase):
+
+    def test_processes_share_budgets(self):
+        clock = FakeClock(start=1000.0)
+        workers = [RateLimiter(requests_per_minute=4, user_requests_per_minute=2, clock=clock, cache='default', key_prefix=self.id()) for _ in range(2)]
+        waits = [workers[i % 2].reserve() for i in range(5)]
+        self.assertEqual(waits[:4], [0.0] * 4)
+        self.assertAlmostEqual(waits[4], 15.0)
+
+        clock.advance(120)
+        self.assertEqual(workers[0].reserve_user(7), 0.0)
+        self.assertEqual(workers[1].reserve_user(7), 0.0)
+        self.assertAlmostEqual(workers[0].reserve_user(7), 30.0)
+
+    def test_page_cache_does_not_evict_budgets(self):
+        limiter = RateLimiter(requests_per_minute=2, clock=FakeClock(start=1000.0), cache='rate_limit', key_prefix=self.id())
+        self.assertEqual([limiter.reserve(), limiter.reserve()], [0.0, 0.0])
+        # More pages than the shared cache's 300 entries, so it is culled.
+        for i in range(400):
+            caches['default'].set(f'listing:books:{i}', {'data': [], 'link': '', 'etag': str(i)})
+        self.assertLess(len(os.listdir(self.location)), 400)
+
+        self.assertIsNotNone(caches['rate_limit'].get(f'{self.id()}:requests'))
+        self.assertAlmostEqual(limiter.reserve(), 30.0)
+
+    def test_cull_can_be_turned_off(self):
+        cache = caches['rate_limit']
+        for i in range(400):
+            cache.set(f'key:{i}', i)
+        self.assertEqual([cache.get(f'key:{i}') for i in range(400)], list(range(400)))
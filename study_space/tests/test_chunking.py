@@ -0,0 +1,76 @@
+from django.test import SimpleTestCase
+from study_space.chunking import Chunk, estimate_tokens, iter_chunks, plan_chunks, select_chunks, split_text
+from study_space.extraction import extract_page_texts
+from study_space.serializers import QUESTION_PROMPT
+import time
+
+
+class ChunkPlannerTest(SimpleTestCase):
+
+    def page(self, tokens, word='word'):
+        return ' '.join([word] * tokens)
+
+    def test_packs_pages_up_to_budget(self):
+        pages = [self.page(40), self.page(40), self.page(40), self.page(10)]
+        chunks = plan_chunks(pages, 100)
+        self.assertEqual([(chunk.start_page, chunk.end_page) for chunk in chunks], [(1, 2), (3, 4)])
+        self.assertTrue(all(estimate_tokens(chunk.text) <= 100 for chunk in chunks))
+
+    def test_skips_empty_pages(self):
+        pages = ['', self.page(20), '   \n', '', self.page(20), '']
+        chunks = plan_chunks(pages, 100)
+        self.assertEqual(len(chunks), 1)
+        self.assertEqual((chunks[0].start_page, chunks[0].end_page), (2, 5))
+        self.assertEqual(plan_chunks(['', ' '], 100), [])
+
+    def test_splits_oversized_pages(self):
+        pages = [self.page(10), self.page(250), self.page(10)]
+        chunks = plan_chunks(pages, 100)
+        self.assertEqual([(chunk.start_page, chunk.part) for chunk in chunks], [(1, 0), (2, 1), (2, 2), (2, 3), (3, 0)])
+        self.assertEqual(' '.join(chunk.text for chunk in chunks[1:4]), pages[1])
+
+    def test_split_text_without_whitespace(self):
+        pieces = split_text('x' * 10, 1)
+        self.assertEqual(pieces, ['xxxx', 'xxxx', 'xx'])
+
+    def test_select_keeps_inner_chunks_and_cuts_edges(self):
+        pages = [self.page(30, f'p{number}') for number in range(1, 10)]
+        plan = plan_chunks(pages, 100)
+        self.assertEqual([(chunk.start_page, chunk.end_page) for chunk in plan], [(1, 3), (4, 6), (7, 9)])
+        selected = select_chunks(plan, pages, 2, 7)
+        self.assertEqual(selected[1], plan[1])
+        self.assertEqual(selected[0], Chunk(2, 3, 0, pages[1] + ' ' + pages[2]))
+        self.assertEqual(selected[2], Chunk(7, 7, 0, pages[6]))
+
+
+class PromptAssemblyScalingTest(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.page_texts = extract_page_texts('study_space/tests/files/Chapter_7.pdf')
+
+    def assemble(self, copies):
+        pages = (text for _ in range(copies) for text in self.page_texts)
+        prompts = [QUESTION_PROMPT + " " + chunk.text for chunk in iter_chunks(pages, 2000)]
+        return "".join(prompts)
+
+    def best_time(self, copies, repeat=3):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            self.assemble(copies)
+            timings.append(time.perf_counter() - started)
+        return min(timings)
+
+    def test_chunks_stream_from_generator(self):
+        pages = (text for text in self.page_texts)
+        self.assertEqual(list(iter_chunks(pages, 2000)), plan_chunks(self.page_texts, 2000))
+
+    def test_assembly_scales_linearly_with_page_count(self):
+        self.assemble(5)
+        small = self.best_time(50)
+        large = self.best_time(400)
+        # 8x the pages: linear assembly takes about 8x as long, quadratic about 64x.
+        self.assertLess(large / small, 20, f"{small:.4f}s for 50 copies, {large:.4f}s for 400 copies")
+
@@ -0,0 +1,47 @@
+from rest_framework.test import APITestCase
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from study_space.models import Book, PageText
+from study_space.extraction import extract_page_texts, get_page_texts
+from study_space.serializers import QuestionairreSerializer
+from unittest.mock import patch
+import os
+
+
+class PageTextIndexTest(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        with open('study_space/tests/files/Chapter_7.pdf', 'rb') as f:
+            self.valid_pdf = SimpleUploadedFile('test.pdf', f.read(), content_type='application/pdf')
+        self.book = Book.objects.create(title='Test Book', user=self.user, file=self.valid_pdf)
+
+    def tearDown(self):
+        for book in Book.objects.all():
+            if os.path.isfile(book.file.path):
+                os.remove(book.file.path)
+
+    def test_index_built_on_first_use(self):
+        expected = extract_page_texts(self.book.file)
+        self.assertFalse(PageText.objects.exists())
+        self.assertEqual(get_page_texts(self.book.file, self.book.content_hash), expected)
+        self.assertEqual(PageText.objects.filter(content_hash=self.book.content_hash).count(), len(expected))
+
+    def test_index_reused(self):
+        expected = get_page_texts(self.book.file, self.book.content_hash)
+        with patch('study_space.extraction.iter_page_texts') as mock_extract:
+            self.assertEqual(get_page_texts(self.book.file, self.book.content_hash), expected)
+            mock_extract.assert_not_called()
+
+    def test_no_content_hash_bypasses_index(self):
+        get_page_texts(self.book.file)
+        self.assertFalse(PageText.objects.exists())
+
+    @patch('study_space.serializers.QuestionairreSerializer.under_token_limit', return_value=(True, 100))
+    @patch('study_space.serializers.QuestionairreSerializer.question_generator', return_value='question;answer\n')
+    def test_generation_reads_from_index(self, mock_generator, mock_token_limit):
+        serializer = QuestionairreSerializer()
+        serializer.generate_question_answers(self.book, 'basic', None, None)
+        with patch('study_space.extraction.iter_page_texts') as mock_extract:
+            serializer.generate_question_answers(self.book, 'detailed', None, None)
+            mock_extract.assert_not_called()
@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from rest_framework.exceptions import ValidationError
+from study_space.fast_serializers import BookReadSerializer, QuestionairreReadSerializer
+from study_space.models import Book, Questionairre
+from study_space.serializers import BookSerializer, QuestionairreSerializer
+
+
+@override_settings(STORAGES={**settings.STORAGES, 'default': {'BACKEND': 'django.core.files.storage.InMemoryStorage'}})
+class ReadSerializerTest(TestCase):
+    """ReadSerializers return exactly what the ModelSerializers they replace return."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        books = [Book.objects.create(title=f'Book {i}', user=self.user, file=ContentFile(b'%PDF-1.4', name='book one.pdf')) for i in range(2)]
+        generated = Questionairre.objects.create(book=books[0], user=self.user, timings={'generation': 1.5})
+        generated.question_answers_file.save('questions.txt', ContentFile(b'question;answer\n'))
+        Questionairre.objects.create(book=books[1], user=self.user, detail_level='detailed', status='partial')
+
+    def test_books(self):
+        books = Book.objects.filter(user=self.user)
+        expected = BookSerializer(books, many=True).data
+        self.assertEqual(BookReadSerializer().serialize(books), expected)
+        self.assertEqual([BookReadSerializer().serialize_instance(book) for book in books], expected)
+
+    def test_questionairres(self):
+        questionairres = Questionairre.objects.filter(user=self.user).select_related('book')
+        expected = QuestionairreSerializer(questionairres, many=True).data
+        self.assertEqual(QuestionairreReadSerializer().serialize(questionairres), expected)
+        self.assertEqual([QuestionairreReadSerializer().serialize_instance(q) for q in questionairres], expected)
+        self.assertIsNone(expected[1]['question_answers_file'])
+
+    def test_fields(self):
+        serializer = QuestionairreReadSerializer(fields=['status', 'book'])
+        self.assertEqual(serializer.serialize(Questionairre.objects.order_by('pk')), [
+            {'book': 'Book 0', 'status': 'complete'},
+            {'book': 'Book 1', 'status': 'partial'},
+        ])
+        with self.assertRaises(ValidationError):
+            BookReadSerializer(fields=['title', 'normalized_title'])
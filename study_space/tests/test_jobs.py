@@ -0,0 +1,251 @@
+from rest_framework.test import APITestCase
+from django.core.management import call_command
+from django.test import TransactionTestCase, override_settings
+from django.utils import timezone
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from rest_framework import serializers
+from study_space.models import Book, Questionairre, QuestionairreChunk, QuestionairreJob
+from study_space.serializers import QuestionairreSerializer
+from study_space.jobs import (
+    QuestionairreWorkerPool, claim_next_job, enqueue_questionairre_job, renew_lease, retry_job, run_job, run_pending_jobs
+)
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+import os
+import signal
+import threading
+import time
+
+
+def remove_generated_files():
+    for obj in Book.objects.all():
+        if obj.file and obj.file.name and os.path.isfile(obj.file.path):
+            os.remove(obj.file.path)
+    for obj in Questionairre.objects.all():
+        if obj.question_answers_file and obj.question_answers_file.name and os.path.isfile(obj.question_answers_file.path):
+            os.remove(obj.question_answers_file.path)
+
+
+class QuestionairreJobTest(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        with open('study_space/tests/files/Chapter_7.pdf', 'rb') as f:
+            self.valid_pdf = SimpleUploadedFile(name='test.pdf', content=f.read(), content_type='application/pdf')
+        self.book = Book.objects.create(title='Test Book', user=self.user, file=self.valid_pdf)
+
+    def tearDown(self):
+        remove_generated_files()
+
+    def test_claim_is_exclusive(self):
+        job = enqueue_questionairre_job(self.user, self.book)
+        claimed = claim_next_job()
+        self.assertEqual(claimed.pk, job.pk)
+        self.assertEqual(claimed.status, 'running')
+        self.assertIsNone(claim_next_job())
+
+    def test_claim_oldest_first(self):
+        first = enqueue_questionairre_job(self.user, self.book, 'basic')
+        enqueue_questionairre_job(self.user, self.book, 'detailed')
+        self.assertEqual(claim_next_job().pk, first.pk)
+
+    def expire_lease(self, job):
+        QuestionairreJob.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - timedelta(seconds=301))
+
+    def test_expired_lease_is_reclaimed(self):
+        job = enqueue_questionairre_job(self.user, self.book)
+        first = claim_next_job()
+        self.assertIsNotNone(first.claimed_at)
+        self.assertIsNone(claim_next_job())
+
+        self.expire_lease(first)
+        second = claim_next_job()
+        self.assertEqual(second.pk, job.pk)
+        self.assertEqual(second.status, 'running')
+        self.assertGreater(second.claimed_at, first.claimed_at)
+
+    def test_renewed_lease_is_kept(self):
+        enqueue_questionairre_job(self.user, self.book)
+        job = claim_next_job()
+        self.expire_lease(job)
+        self.assertTrue(renew_lease(job))
+        self.assertIsNone(claim_next_job())
+
+    @patch('study_space.serializers.QuestionairreSerializer.generate_question_answers')
+    def test_taken_over_job_keeps_the_new_outcome(self, mock_generate):
+        mock_generate.return_value = 'question;answer'
+        enqueue_questionairre_job(self.user, self.book)
+        stale = claim_next_job()
+        self.expire_lease(stale)
+        current = claim_next_job()
+
+        self.assertFalse(renew_lease(stale))
+        written = []
+        generate_question_file = QuestionairreSerializer.generate_question_file
+
+        def record(serializer, *args):
+            written.append(generate_question_file(serializer, *args))
+            return written[-1]
+
+        with patch.object(QuestionairreSerializer, 'generate_question_file', autospec=True, side_effect=record):
+            run_job(stale)
+        current.refresh_from_db()
+        self.assertEqual(current.status, 'running')
+        self.assertEqual(current.questionairre.status, 'partial')
+        self.assertFalse(current.questionairre.question_answers_file)
+        self.assertFalse(default_storage.exists(written[0]))
+        self.assertEqual(run_job(current).status, 'complete')
+        current.questionairre.refresh_from_db()
+        self.assertEqual(current.questionairre.status, 'complete')
+
+    @patch('study_space.serializers.QuestionairreSerializer.under_token_limit')
+    @patch('study_space.serializers.QuestionairreSerializer.question_generator')
+    def test_run_job_reports_chunk_progress(self, mock_generator, mock_token_limit):
+        mock_token_limit.return_value = (True, 100)
+        mock_generator.return_value = 'question;answer\n'
+        job = enqueue_questionairre_job(self.user, self.book, 'basic')
+        run_job(claim_next_job())
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'complete')
+        self.assertGreater(job.total_chunks, 0)
+        self.assertEqual(job.total_chunks, mock_generator.call_count)
+        self.assertEqual(job.completed_chunks, job.total_chunks)
+        self.assertEqual(job.questionairre.user, self.user)
+        self.assertEqual(job.questionairre.detail_level, 'basic')
+
+    @patch('study_space.serializers.QuestionairreSerializer.generate_question_answers')
+    def test_run_job_records_failure(self, mock_generate):
+        mock_generate.side_effect = serializers.ValidationError("Error: Please enter valid page number")
+        job = enqueue_questionairre_job(self.user, self.book, 'basic', 1, 500)
+        run_job(claim_next_job())
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.error, 'Error: Please enter valid page number')
+        self.assertEqual(job.questionairre.status, 'partial')
+        self.assertFalse(job.questionairre.question_answers_file)
+        self.assertEqual(Questionairre.objects.count(), 1)
+
+    @patch('study_space.serializers.QuestionairreSerializer.under_token_limit', return_value=(True, 100))
+    @patch('study_space.serializers.QuestionairreSerializer.question_generator')
+    def test_failed_job_resumes_from_recorded_chunks(self, mock_generator, mock_token_limit):
+        calls = []
+
+        def generate(prompt, tokens=0):
+            calls.append(prompt)
+            if len(calls) == 2:
+                raise RuntimeError("quota exceeded")
+            return f"question {len(calls)};answer\n"
+
+        mock_generator.side_effect = generate
+        with self.settings(QUESTIONAIRRE_CHUNK_CONCURRENCY=1,
+                           QUESTIONAIRRE_CHUNK_TOKENS={'detailed': 100}):
+            job = enqueue_questionairre_job(self.user, self.book, 'detailed')
+            run_job(claim_next_job())
+            job.refresh_from_db()
+            self.assertEqual(job.status, 'failed')
+            self.assertEqual(job.questionairre.status, 'partial')
+            self.assertEqual(QuestionairreChunk.objects.filter(questionairre=job.questionairre).count(), 1)
+
+            self.assertTrue(retry_job(job))
+            self.assertFalse(retry_job(job))
+            run_job(claim_next_job())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'complete')
+        self.assertEqual(job.questionairre.status, 'complete')
+        self.assertEqual(len(calls), job.total_chunks + 1)
+        self.assertEqual(Questionairre.objects.count(), 1)
+        self.assertEqual(QuestionairreChunk.objects.count(), job.total_chunks)
+        with job.questionairre.question_answers_file.open('r') as f:
+            self.assertTrue(f.read().startswith("question 1;answer\n"))
+
+    @patch('study_space.serializers.QuestionairreSerializer.generate_question_answers')
+    def test_run_pending_jobs_drains_queue(self, mock_generate):
+        mock_generate.return_value = 'question;answer'
+        for detail_level in ['basic', 'intermediate', 'detailed']:
+            enqueue_questionairre_job(self.user, self.book, detail_level)
+        self.assertEqual(run_pending_jobs(limit=2), 2)
+        self.assertEqual(run_pending_jobs(), 1)
+        self.assertEqual(QuestionairreJob.objects.filter(status='complete').count(), 3)
+
+    @override_settings(QUESTIONAIRRE_JOBS_EAGER=True)
+    @patch('study_space.serializers.QuestionairreSerializer.generate_question_answers')
+    def test_eager_mode_runs_inline(self, mock_generate):
+        mock_generate.return_value = 'question;answer'
+        job = enqueue_questionairre_job(self.user, self.book)
+        self.assertEqual(job.status, 'complete')
+        self.assertIsNotNone(job.questionairre)
+
+
+class QuestionairreWorkerPoolTest(TransactionTestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.book = Book.objects.create(
+            title='Test Book',
+            user=self.user,
+            file=SimpleUploadedFile('book.pdf', b'book_content', content_type='application/pdf')
+        )
+
+    def tearDown(self):
+        remove_generated_files()
+
+    # The test database's SQLite may report a table as locked to a worker; the job it
+    # drops is taken over once its lease expires, so keep the lease short.
+    @override_settings(QUESTIONAIRRE_JOB_LEASE=1)
+    @patch('study_space.serializers.QuestionairreSerializer.generate_question_answers')
+    def test_pool_processes_queued_jobs(self, mock_generate):
+        mock_generate.return_value = 'question;answer'
+        jobs = [enqueue_questionairre_job(self.user, self.book) for _ in range(3)]
+        pool = QuestionairreWorkerPool(workers=2, poll_interval=0.2)
+        pool.start()
+        try:
+            deadline = time.time() + 10
+            while QuestionairreJob.objects.exclude(status='complete').exists() and time.time() < deadline:
+                time.sleep(0.5)
+        finally:
+            pool.stop(timeout=10)
+
+        for job in jobs:
+            job.refresh_from_db()
+            self.assertEqual(job.status, 'complete')
+        self.assertEqual(Questionairre.objects.count(), 3)
+
+    @patch('study_space.serializers.QuestionairreSerializer.generate_question_answers')
+    def test_stop_requeues_unfinished_jobs(self, mock_generate):
+        started, release = threading.Event(), threading.Event()
+
+        def generate(*args, **kwargs):
+            started.set()
+            release.wait(10)
+            return 'question;answer'
+
+        mock_generate.side_effect = generate
+        job = enqueue_questionairre_job(self.user, self.book)
+        pool = QuestionairreWorkerPool(workers=1, poll_interval=0.1)
+        pool.start()
+        self.assertTrue(started.wait(10))
+        self.assertEqual(pool.stop(timeout=0.2), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'queued')
+        self.assertIsNone(job.claimed_at)
+
+        release.set()
+        pool.stop(timeout=10)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'queued')
+        self.assertEqual(job.questionairre.status, 'partial')
+        self.assertFalse(job.questionairre.question_answers_file)
+
+    def test_command_stops_on_sigterm(self):
+        handler = signal.getsignal(signal.SIGTERM)
+        timer = threading.Timer(0.5, os.kill, (os.getpid(), signal.SIGTERM))
+        timer.start()
+        out = StringIO()
+        call_command('run_questionairre_workers', workers=1, poll_interval=0.1, metrics_port=0, stdout=out)
+        timer.join()
+        self.assertIn('Stopping workers', out.getvalue())
+        self.assertEqual(signal.getsignal(signal.SIGTERM), handler)
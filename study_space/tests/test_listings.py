@@ -0,0 +1,90 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.test import override_settings
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APITestCase
+from study_space.models import Book, Questionairre
+import re
+
+
+@override_settings(STORAGES={**settings.STORAGES, 'default': {'BACKEND': 'django.core.files.storage.InMemoryStorage'}})
+class ListingTests(APITestCase):
+
+    def setUp(self):
+        self.settings_override = override_settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': f'{self.id()}-default'},
+            'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': f'{self.id()}-shared'},
+        })
+        self.settings_override.enable()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.user).key)
+        self.books = [self.create_book(f'Book {i}') for i in range(5)]
+
+    def tearDown(self):
+        self.settings_override.disable()
+
+    def create_book(self, title, user=None):
+        return Book.objects.create(title=title, user=user or self.user, file=ContentFile(b'%PDF-1.4', name='book.pdf'))
+
+    def next_link(self, response):
+        match = re.search(r'<([^>]+)>; rel="next"', response.get('Link', ''))
+        return match.group(1) if match else None
+
+    def test_books_are_paginated_with_link_header(self):
+        titles = []
+        url = '/book/?page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data), 2)
+            titles += [book['title'] for book in response.data]
+            url = self.next_link(response)
+        self.assertEqual(titles, [f'Book {i}' for i in range(5)])
+
+        response = self.client.get('/book/')
+        self.assertEqual(len(response.data), 5)
+        self.assertNotIn('Link', response)
+
+    def test_sparse_fieldsets(self):
+        response = self.client.get('/book/?fields=id,title')
+        self.assertEqual(response.data[0], {'id': self.books[0].pk, 'title': 'Book 0'})
+        response = self.client.get('/book/?fields=title,secret')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {'fields': ['Unknown field: secret']})
+
+    def test_etag_and_not_modified(self):
+        response = self.client.get('/book/')
+        etag = response['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get('/book/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.create_book('Book 5')
+        response = self.client.get('/book/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 6)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_cache_is_dropped_on_change(self):
+        self.assertEqual(len(self.client.get('/book/').data), 5)
+        self.create_book('Other', user=User.objects.create_user(username='otheruser', password='otherpass'))
+        with self.assertNumQueries(1):
+            self.assertEqual(len(self.client.get('/book/').data), 5)
+
+        self.assertEqual(self.client.delete('/book/Book 0/').status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual([book['title'] for book in self.client.get('/book/').data], [f'Book {i}' for i in range(1, 5)])
+
+    def test_questionairres_follow_book_changes(self):
+        Questionairre.objects.create(book=self.books[1], user=self.user)
+        Questionairre.objects.create(book=self.books[2], user=self.user, detail_level='detailed')
+        response = self.client.get('/questionairre/?fields=book,detail_level&page_size=1')
+        self.assertEqual(response.data, [{'book': 'Book 1', 'detail_level': 'basic'}])
+        self.assertEqual(self.client.get(self.next_link(response)).data, [{'book': 'Book 2', 'detail_level': 'detailed'}])
+
+        self.books[1].title = 'Renamed'
+        self.books[1].save()
+        response = self.client.get('/questionairre/?fields=book,detail_level&page_size=1')
+        self.assertEqual(response.data, [{'book': 'Renamed', 'detail_level': 'basic'}])
@@ -0,0 +1,275 @@
+from django.test import SimpleTestCase, override_settings
+from study_space import llm
+from study_space.llm import (
+    CircuitBreaker, CircuitOpenError, EmptyResponseError, GeminiBackend, LLMError, StubBackend, get_llm_backend,
+    parse_retry_after, reset_llm_backend, retry_delay
+)
+from study_space.rate_limit import FakeClock
+from study_space.tokens import count_tokens_remote
+from unittest.mock import MagicMock, patch
+import asyncio
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+
+STUB_BACKEND = {'BACKEND': 'study_space.llm.StubBackend', 'MODEL': 'stub', 'OPTIONS': {'response': 'q;a\n'}}
+
+
+def gemini_response(status_code=200, data=None, headers=None):
+    response = MagicMock(status_code=status_code, headers=headers or {}, text='')
+    response.json.return_value = data or {}
+    return response
+
+
+@override_settings(LLM_BACKEND=STUB_BACKEND)
+class LLMBackendProviderTest(SimpleTestCase):
+
+    def setUp(self):
+        reset_llm_backend(setting='LLM_CIRCUIT_BREAKER')
+
+    def test_backend_shared_across_calls(self):
+        backend = get_llm_backend()
+        self.assertIsInstance(backend, StubBackend)
+        self.assertIs(get_llm_backend(), backend)
+
+    def test_backend_rebuilt_when_setting_changes(self):
+        backend = get_llm_backend()
+        with self.settings(LLM_BACKEND={**STUB_BACKEND, 'OPTIONS': {'response': 'other;answer\n'}}):
+            self.assertIsNot(get_llm_backend(), backend)
+            self.assertEqual(get_llm_backend().response, 'other;answer\n')
+
+    @patch('study_space.llm.get_gemini_rate_limiter')
+    def test_generate_goes_through_rate_limiter(self, mock_limiter):
+        mock_limiter.return_value.acquire.return_value = 0.0
+        self.assertEqual(llm.generate('prompt', tokens=12, user='user'), 'q;a\n')
+        mock_limiter.return_value.acquire.assert_called_once_with(tokens=12, user='user')
+        self.assertEqual(get_llm_backend().prompts, ['prompt'])
+
+    @patch('study_space.llm.get_gemini_rate_limiter')
+    def test_agenerate_goes_through_rate_limiter(self, mock_limiter):
+        async def acquire_async(tokens=0, user=None):
+            return 0.0
+
+        mock_limiter.return_value.acquire_async.side_effect = acquire_async
+        self.assertEqual(asyncio.run(llm.agenerate('prompt', tokens=3)), 'q;a\n')
+        mock_limiter.return_value.acquire_async.assert_called_once_with(tokens=3, user=None)
+
+    def test_count_tokens_remote_uses_backend(self):
+        self.assertEqual(count_tokens_remote('The cell divides.'), 5)
+
+
+class GeminiBackendTest(SimpleTestCase):
+
+    def setUp(self):
+        self.backend = GeminiBackend('gemini-2.0-flash', timeout=30, api_key='key')
+        self.post = patch.object(self.backend.session, 'post').start()
+        self.addCleanup(patch.stopall)
+
+    def test_generate(self):
+        self.post.return_value = gemini_response(data={
+            'candidates': [{'content': {'parts': [{'text': 'q;'}, {'text': 'a\n'}]}}]
+        })
+        self.assertEqual(self.backend.generate('prompt'), 'q;a\n')
+        url = self.post.call_args.args[0]
+        self.assertTrue(url.endswith('/models/gemini-2.0-flash:generateContent'))
+        self.assertEqual(self.post.call_args.kwargs['timeout'], 30)
+        self.assertEqual(self.backend.session.headers['x-goog-api-key'], 'key')
+
+    def test_connection_pool_reused(self):
+        self.post.return_value = gemini_response(data={'totalTokens': 4})
+        self.backend.count_tokens('a')
+        self.backend.count_tokens('b')
+        self.assertEqual(self.post.call_count, 2)
+        self.assertEqual(self.backend.session.get_adapter('https://x').poolmanager.connection_pool_kw['maxsize'], 10)
+
+    def test_error_carries_status_and_retry_after(self):
+        self.post.return_value = gemini_response(
+            status_code=429,
+            data={'error': {'message': 'Resource exhausted'}},
+            headers={'Retry-After': '7'},
+        )
+        with self.assertRaises(LLMError) as error:
+            self.backend.generate('prompt')
+        self.assertEqual(error.exception.status_code, 429)
+        self.assertEqual(error.exception.retry_after, 7.0)
+        self.assertIn('Resource exhausted', str(error.exception))
+
+    def test_empty_response(self):
+        self.post.return_value = gemini_response(data={'candidates': []})
+        with self.assertRaises(EmptyResponseError):
+            self.backend.generate('prompt')
+
+        self.post.return_value = gemini_response(data={'promptFeedback': {'blockReason': 'SAFETY'}})
+        with self.assertRaises(EmptyResponseError) as error:
+            self.backend.generate('prompt')
+        self.assertIn('SAFETY', str(error.exception))
+
+        self.post.return_value = gemini_response(data={
+            'candidates': [{'content': {'parts': [{'inlineData': {}}]}, 'finishReason': 'RECITATION'}]
+        })
+        with self.assertRaises(EmptyResponseError) as error:
+            self.backend.generate('prompt')
+        self.assertIn('RECITATION', str(error.exception))
+
+    def test_error_carries_retry_info(self):
+        self.post.return_value = gemini_response(status_code=429, data={'error': {
+            'message': 'Resource exhausted',
+            'details': [{'@type': 'type.googleapis.com/google.rpc.RetryInfo', 'retryDelay': '37s'}],
+        }})
+        with self.assertRaises(LLMError) as error:
+            self.backend.generate('prompt')
+        self.assertEqual(error.exception.retry_after, 37.0)
+
+    def test_malformed_response(self):
+        self.post.return_value = gemini_response()
+        self.post.return_value.json.side_effect = ValueError('Expecting value')
+        with self.assertRaises(LLMError) as error:
+            self.backend.generate('prompt')
+        self.assertEqual(error.exception.status_code, 200)
+
+        self.post.return_value = gemini_response(data={'candidates': [{'content': None}]})
+        with self.assertRaises(LLMError):
+            self.backend.generate('prompt')
+        self.post.return_value = gemini_response(data={'error': 'none'})
+        with self.assertRaises(LLMError):
+            self.backend.count_tokens('text')
+
+
+def faulty_backend(faults=(), **options):
+    return {'BACKEND': 'study_space.llm.StubBackend', 'MODEL': 'stub', 'OPTIONS': {'faults': faults, **options}}
+
+
+@override_settings(
+    LLM_RETRY={'ATTEMPTS': 3, 'BASE_DELAY': 1.0, 'MAX_DELAY': 8.0},
+    LLM_CIRCUIT_BREAKER={'FAILURE_THRESHOLD': 3, 'RESET_TIMEOUT': 30.0},
+)
+class LLMRetryTest(SimpleTestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patch('study_space.llm.llm_clock', self.clock).start()
+        self.limiter = patch('study_space.llm.get_gemini_rate_limiter').start().return_value
+        self.limiter.acquire.return_value = 0.0
+        self.addCleanup(patch.stopall)
+        reset_llm_backend(setting='LLM_CIRCUIT_BREAKER')
+
+    def test_transient_faults_retried(self):
+        with self.settings(LLM_BACKEND=faulty_backend([503, 429])):
+            self.assertEqual(llm.generate('prompt'), 'question;answer\n')
+            self.assertEqual(len(get_llm_backend().prompts), 3)
+        self.assertEqual(len(self.clock.sleeps), 2)
+        self.assertEqual(self.limiter.acquire.call_count, 3)
+
+    def test_retry_after_honoured(self):
+        with self.settings(LLM_BACKEND=faulty_backend([429], retry_after=20)):
+            llm.generate('prompt')
+        self.assertEqual(self.clock.sleeps, [20])
+
+    def test_client_error_not_retried(self):
+        with self.settings(LLM_BACKEND=faulty_backend([400])):
+            with self.assertRaises(LLMError):
+                llm.generate('prompt')
+            self.assertEqual(len(get_llm_backend().prompts), 1)
+
+    def test_gives_up_after_attempts(self):
+        with self.settings(LLM_BACKEND=faulty_backend([503, 503, 503])):
+            with self.assertRaises(LLMError) as error:
+                llm.generate('prompt')
+            self.assertEqual(error.exception.status_code, 503)
+            self.assertEqual(len(get_llm_backend().prompts), 3)
+
+    def test_circuit_opens_and_recovers(self):
+        with self.settings(LLM_BACKEND=faulty_backend([503, 503, 503])):
+            with self.assertRaises(LLMError):
+                llm.generate('prompt')
+            with self.assertRaises(CircuitOpenError):
+                llm.generate('prompt')
+            self.assertEqual(len(get_llm_backend().prompts), 3)
+
+            self.clock.advance(30)
+            self.assertEqual(llm.generate('prompt'), 'question;answer\n')
+            self.assertEqual(llm.get_circuit_breaker().state, 'closed')
+
+    def test_empty_response_not_retried_or_counted(self):
+        with self.settings(LLM_BACKEND=faulty_backend()):
+            with patch.object(get_llm_backend(), 'generate', side_effect=EmptyResponseError('blocked')) as mock_generate:
+                for _ in range(5):
+                    with self.assertRaises(EmptyResponseError):
+                        llm.generate('prompt')
+            self.assertEqual(mock_generate.call_count, 5)
+            self.assertEqual(self.clock.sleeps, [])
+            self.assertEqual(llm.get_circuit_breaker().state, 'closed')
+
+    def test_trial_released_after_unexpected_error(self):
+        with self.settings(LLM_BACKEND=faulty_backend([503, 503, 503])):
+            with self.assertRaises(LLMError):
+                llm.generate('prompt')
+            self.clock.advance(30)
+            with patch.object(get_llm_backend(), 'generate', side_effect=ValueError('bad payload')):
+                with self.assertRaises(ValueError):
+                    llm.generate('prompt')
+            self.assertEqual(llm.generate('prompt'), 'question;answer\n')
+            self.assertEqual(llm.get_circuit_breaker().state, 'closed')
+
+    def test_async_trial_released_after_unexpected_error(self):
+        async def acquire_async(tokens=0, user=None):
+            return 0.0
+
+        self.limiter.acquire_async.side_effect = acquire_async
+        with self.settings(LLM_BACKEND=faulty_backend([503, 503, 503])):
+            with self.assertRaises(LLMError):
+                llm.generate('prompt')
+            self.clock.advance(30)
+            with patch.object(get_llm_backend(), 'agenerate', side_effect=KeyError('candidates')):
+                with self.assertRaises(KeyError):
+                    asyncio.run(llm.agenerate('prompt'))
+            self.assertEqual(asyncio.run(llm.agenerate('prompt')), 'question;answer\n')
+
+    def test_async_retry(self):
+        async def acquire_async(tokens=0, user=None):
+            return 0.0
+
+        self.limiter.acquire_async.side_effect = acquire_async
+        with self.settings(LLM_BACKEND=faulty_backend([503])):
+            self.assertEqual(asyncio.run(llm.agenerate('prompt')), 'question;answer\n')
+        self.assertEqual(len(self.clock.sleeps), 1)
+
+
+class RetryPolicyTest(SimpleTestCase):
+
+    def test_parse_retry_after(self):
+        self.assertEqual(parse_retry_after('7'), 7.0)
+        self.assertEqual(parse_retry_after('1.5'), 1.5)
+        self.assertEqual(parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT'), 0.0)
+        future = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=60), usegmt=True)
+        self.assertAlmostEqual(parse_retry_after(future), 60, delta=2)
+        retry_info = [{'@type': 'type.googleapis.com/google.rpc.RetryInfo', 'retryDelay': '2.5s'}]
+        self.assertEqual(parse_retry_after(None, retry_info), 2.5)
+        self.assertEqual(parse_retry_after('soon', retry_info), 2.5)
+        self.assertIsNone(parse_retry_after('soon'))
+        self.assertIsNone(parse_retry_after('inf'))
+        self.assertIsNone(parse_retry_after(None, [{'@type': 'type.googleapis.com/google.rpc.RetryInfo', 'retryDelay': 'x'}]))
+
+    def test_backoff_is_jittered_and_capped(self):
+        error = LLMError('unavailable', status_code=503)
+        for attempt in range(1, 8):
+            delays = {retry_delay(attempt, error, 1.0, 8.0) for _ in range(20)}
+            self.assertTrue(all(0 <= delay <= min(8.0, 2 ** (attempt - 1)) for delay in delays))
+            self.assertGreater(len(delays), 1)
+
+    def test_half_open_allows_one_trial(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, 'open')
+        with self.assertRaises(CircuitOpenError) as error:
+            breaker.before_call()
+        self.assertEqual(error.exception.retry_after, 10)
+
+        clock.advance(10)
+        self.assertEqual(breaker.state, 'half_open')
+        breaker.before_call()
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, 'open')
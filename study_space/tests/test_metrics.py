@@ -0,0 +1,149 @@
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+from study_space import metrics
+from study_space.benchmark import synthetic_pdf
+from study_space.models import Questionairre
+from study_space.serializers import BookSerializer, QuestionairreSerializer
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+import contextvars
+import urllib.error
+import urllib.request
+
+
+class TimingsTest(SimpleTestCase):
+
+    def setUp(self):
+        metrics.registry.reset()
+
+    def test_collects_spans_and_counters(self):
+        with metrics.collect_timings() as timings:
+            with metrics.span('extract_text'):
+                pass
+            metrics.record('extract_text', 0.5)
+            metrics.count('input_tokens', 120)
+            metrics.count('input_tokens', 30)
+
+        data = timings.as_dict()
+        self.assertEqual(data['stages']['extract_text']['count'], 2)
+        self.assertGreaterEqual(data['stages']['extract_text']['seconds'], 0.5)
+        self.assertEqual(data['input_tokens'], 150)
+        self.assertGreaterEqual(data['total_seconds'], 0)
+
+    def test_nothing_collected_outside_a_generation(self):
+        metrics.record('llm_call', 1.0)
+        self.assertIsNone(metrics.current_timings.get())
+        self.assertIn('study_space_stage_seconds_count{stage="llm_call"} 1', metrics.registry.render())
+
+    def test_threads_started_with_the_context_record_into_it(self):
+        with metrics.collect_timings() as timings:
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                for _ in range(4):
+                    executor.submit(contextvars.copy_context().run, metrics.record, 'llm_call', 0.25)
+        self.assertEqual(timings.as_dict()['stages']['llm_call'], {'seconds': 1.0, 'count': 4})
+
+    def test_render(self):
+        metrics.record('rate_limit_wait', 1.5)
+        metrics.record('rate_limit_wait', 0.5)
+        metrics.count('llm_calls', 3)
+        self.assertEqual(metrics.registry.render(), (
+            "# HELP study_space_stage_seconds Time spent in each stage of questionnaire generation.\n"
+            "# TYPE study_space_stage_seconds summary\n"
+            'study_space_stage_seconds_sum{stage="rate_limit_wait"} 2.000000\n'
+            'study_space_stage_seconds_count{stage="rate_limit_wait"} 2\n'
+            "# TYPE study_space_llm_calls_total counter\n"
+            "study_space_llm_calls_total 3\n"
+        ))
+
+
+@override_settings(
+    LLM_BACKEND={'BACKEND': 'study_space.llm.StubBackend', 'MODEL': 'stub', 'OPTIONS': {}},
+    GEMINI_RATE_LIMIT={'REQUESTS_PER_MINUTE': 10 ** 6},
+    QUESTIONAIRRE_RESULT_CACHE=False,
+    PDF_EXTRACTION={'WORKERS': 1, 'PAGES_PER_TASK': 8, 'PAGE_TIMEOUT': 10, 'MEMORY_LIMIT_MB': None, 'MIN_PAGES': 0},
+)
+class QuestionairreTimingsTest(APITestCase):
+
+    def setUp(self):
+        metrics.registry.reset()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        serializer = BookSerializer(data={
+            'title': 'timed book',
+            'file': SimpleUploadedFile('timed.pdf', synthetic_pdf(6), content_type='application/pdf'),
+        })
+        serializer.is_valid(raise_exception=True)
+        self.book = serializer.save(user=self.user)
+
+    def tearDown(self):
+        for questionairre in Questionairre.objects.all():
+            if questionairre.question_answers_file:
+                questionairre.question_answers_file.delete(save=False)
+        self.book.file.delete(save=False)
+
+    @patch('study_space.serializers.count_tokens', side_effect=lambda text, model_name: len(text) // 4)
+    def test_timings_persisted_on_questionairre(self, mock_count_tokens):
+        questionairre = QuestionairreSerializer().create({'user': self.user, 'book': self.book, 'detail_level': 'detailed'})
+
+        timings = Questionairre.objects.get(pk=questionairre.pk).timings
+        for stage in ['pdf_parse', 'extract_text', 'plan_chunks', 'token_count', 'rate_limit_wait', 'llm_call', 'write_file', 'generation']:
+            self.assertIn(stage, timings['stages'])
+        self.assertEqual(timings['stages']['llm_call']['count'], timings['llm_calls'])
+        self.assertEqual(timings['stages']['token_count']['count'], timings['llm_calls'])
+        self.assertGreater(timings['input_tokens'], 0)
+        self.assertGreaterEqual(timings['total_seconds'], timings['stages']['generation']['seconds'])
+        self.assertEqual(QuestionairreSerializer(questionairre).data['timings'], timings)
+
+    @patch('study_space.serializers.count_tokens', return_value=10)
+    @patch('study_space.serializers.QuestionairreSerializer.question_generator', side_effect=RuntimeError('model down'))
+    def test_timings_saved_when_generation_fails(self, mock_generator, mock_count_tokens):
+        serializer = QuestionairreSerializer()
+        with self.assertRaises(RuntimeError):
+            serializer.create({'user': self.user, 'book': self.book, 'detail_level': 'basic'})
+
+        questionairre = Questionairre.objects.get(pk=serializer.questionairre.pk)
+        self.assertEqual(questionairre.status, 'partial')
+        self.assertIn('generation', questionairre.timings['stages'])
+        self.assertEqual(questionairre.timings['questionairres_failed'], 1)
+
+
+class MetricsServerTest(SimpleTestCase):
+
+    def setUp(self):
+        metrics.registry.reset()
+        self.server = metrics.start_metrics_server('127.0.0.1', 0)
+        self.addCleanup(self.server.shutdown)
+        self.url = 'http://127.0.0.1:%s' % self.server.server_address[1]
+
+    def test_serves_the_registry(self):
+        metrics.record('llm_call', 0.75)
+        with urllib.request.urlopen(self.url + '/metrics') as response:
+            self.assertTrue(response.headers['Content-Type'].startswith('text/plain; version=0.0.4'))
+            self.assertIn('study_space_stage_seconds_sum{stage="llm_call"} 0.750000', response.read().decode())
+        with self.assertRaises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(self.url + '/other')
+        self.assertEqual(error.exception.code, 404)
+
+
+class MetricsEndpointTest(APITestCase):
+
+    def setUp(self):
+        metrics.registry.reset()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.admin = User.objects.create_user(username='admin', password='adminpass', is_staff=True)
+
+    def test_staff_reads_metrics(self):
+        metrics.record('llm_call', 0.75)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.admin).key)
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn('study_space_stage_seconds_sum{stage="llm_call"} 0.750000', response.content.decode())
+
+    def test_other_users_forbidden(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.user).key)
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.client.credentials()
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
@@ -2,7 +2,8 @@ from rest_framework.test import APITestCase
 from django.contrib.auth.models import User
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.exceptions import ValidationError
-from study_space.models import Book, Questionairre
+from django.db import IntegrityError, transaction
+from study_space.models import Book, Questionairre, backfill_normalized_titles, book_by_title
 import os
 
 class BookModelTest(APITestCase):
@@ -127,6 +128,40 @@ class BookModelTest(APITestCase):
         with self.assertRaises(ValidationError):
             duplicate_book.full_clean()
     
+    def test_normalized_title(self):
+        book = Book.objects.create(title='Cell Biology', user=self.user, file=self.valid_pdf)
+        self.created_files.append(book.file.path)
+        self.assertEqual(book.normalized_title, 'cell biology')
+        book.title = 'CELL BIOLOGY'
+        book.save(update_fields=['title'])
+        book.refresh_from_db()
+        self.assertEqual(book.normalized_title, 'cell biology')
+        self.assertEqual(book_by_title(self.user, 'cell BIOLOGY'), book)
+
+        duplicate = Book(title='Cell biology', user=self.user, file=self.valid_pdf)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            duplicate.save()
+        # The file is stored before the insert fails.
+        self.created_files.append(duplicate.file.path)
+
+    def test_backfill_normalized_titles(self):
+        books = [Book.objects.create(title=title, user=self.user, file=self.valid_pdf) for title in ('Genetics', 'Ecology')]
+        self.created_files += [book.file.path for book in books]
+        Book.objects.update(normalized_title=None)
+        # Saved before titles were unique ignoring case.
+        Book.objects.filter(pk=books[1].pk).update(title='GENETICS')
+
+        with self.assertLogs('study_space.models', 'WARNING'):
+            self.assertEqual(backfill_normalized_titles(batch_size=1), 1)
+        self.assertEqual(list(Book.objects.order_by('pk').values_list('normalized_title', flat=True)), ['genetics', None])
+        self.assertEqual(book_by_title(self.user, 'genetics'), books[0])
+        self.assertEqual(book_by_title(self.user, 'GENETICS'), books[0])
+        self.assertEqual(backfill_normalized_titles(), 0)
+
+        Book.objects.filter(pk=books[0].pk).update(normalized_title=None, title='Botany')
+        self.assertEqual(backfill_normalized_titles(), 2)
+        self.assertEqual(book_by_title(self.user, 'genetics').pk, books[1].pk)
+
     def test_different_users_same_title(self):
 
         other_user = User.objects.create_user(username='otheruser', password='otherpass')
@@ -0,0 +1,48 @@
+from django.test import SimpleTestCase
+from study_space import pdf_engine
+from study_space.pdf_engine import count_pages, extract_range, iter_page_texts
+from unittest.mock import patch
+
+
+class PdfEngineTest(SimpleTestCase):
+
+    def setUp(self):
+        self.path = 'study_space/tests/files/Chapter_7.pdf'
+        with open(self.path, 'rb') as f:
+            self.content = f.read()
+        self.num_of_pages = count_pages(self.path)
+        patcher = patch('study_space.pdf_engine.available_cpus', return_value=2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_count_pages(self):
+        self.assertEqual(count_pages(self.content), self.num_of_pages)
+
+    def test_extract_range(self):
+        texts = list(iter_page_texts(self.path))
+        self.assertEqual(extract_range(self.content, 1, 3), texts[1:3])
+
+    def test_process_pool_keeps_page_order(self):
+        sequential = list(iter_page_texts(self.path))
+        parallel = list(iter_page_texts(self.path, workers=2, pages_per_task=2, page_timeout=30))
+        self.assertEqual(len(sequential), self.num_of_pages)
+        self.assertEqual(parallel, sequential)
+
+    def test_process_pool_from_bytes(self):
+        sequential = list(iter_page_texts(self.content))
+        self.assertEqual(list(iter_page_texts(self.content, workers=2, pages_per_task=3)), sequential)
+
+    def test_process_pool_is_reused(self):
+        list(iter_page_texts(self.path, workers=2, pages_per_task=2))
+        pool = pdf_engine.get_pool(2, None)
+        with patch.object(pool, 'submit', wraps=pool.submit) as submit:
+            list(iter_page_texts(self.path, workers=2, pages_per_task=2))
+        # One range of pages per worker, each parsed once.
+        self.assertEqual([call.args[2:] for call in submit.call_args_list], [(0, 6), (6, 12)])
+
+    def test_small_pdfs_and_single_cpus_stay_in_process(self):
+        with patch('study_space.pdf_engine.get_pool') as get_pool:
+            list(iter_page_texts(self.path, workers=2, pages_per_task=2, min_pages=self.num_of_pages + 1))
+            with patch('study_space.pdf_engine.available_cpus', return_value=1):
+                list(iter_page_texts(self.path, workers=2, pages_per_task=2))
+        get_pool.assert_not_called()
@@ -0,0 +1,67 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.test import override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APITestCase
+from study_space.models import Book, BookUpload, Questionairre, QuestionairreChunk, QuestionairreJob
+from study_space.tests.query_counts import QueryCountAssertionsMixin
+
+
+@override_settings(STORAGES={**settings.STORAGES, 'default': {'BACKEND': 'django.core.files.storage.InMemoryStorage'}})
+class EndpointQueryCountTests(QueryCountAssertionsMixin, APITestCase):
+    """Every study_space endpoint makes the same number of queries whatever the size of its result."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.user).key)
+        self.book = self.create_book('Main Book')
+
+    def create_book(self, title):
+        return Book.objects.create(title=title, user=self.user, file=ContentFile(b'%PDF-1.4', name='book.pdf'))
+
+    def create_questionairre(self, i, book=None):
+        questionairre = Questionairre.objects.create(book=book or self.create_book(f'Book {i}'), user=self.user)
+        questionairre.question_answers_file.save('questions.txt', ContentFile(b'question;answer\n'))
+        return questionairre
+
+    def test_book_list(self):
+        self.assertQueriesDoNotGrow(lambda: self.client.get('/book/'), lambda i: self.create_book(f'Book {i}'))
+
+    def test_book_detail(self):
+        self.assertQueriesDoNotGrow(lambda: self.client.get('/book/Main Book/'), lambda i: self.create_questionairre(i, self.book))
+
+    def test_questionairre_list(self):
+        self.assertQueriesDoNotGrow(lambda: self.client.get('/questionairre/'), self.create_questionairre)
+        self.assertQueriesDoNotGrow(lambda: self.client.get('/questionairre/?fields=id,book'), lambda i: self.create_questionairre(i + 5))
+
+    def test_partial_questionairre_download(self):
+        questionairre = Questionairre.objects.create(book=self.book, user=self.user, status='partial')
+        self.assertQueriesDoNotGrow(
+            lambda: self.client.get(f'/questionairre/{questionairre.pk}'),
+            lambda i: QuestionairreChunk.objects.create(questionairre=questionairre, start_page=i + 1, end_page=i + 1, question_answers='q;a\n'),
+        )
+
+    def test_job_detail(self):
+        job = QuestionairreJob.objects.create(book=self.book, user=self.user)
+        self.assertQueriesDoNotGrow(
+            lambda: self.client.get(f'/questionairre/jobs/{job.pk}'),
+            lambda i: QuestionairreJob.objects.create(book=self.create_book(f'Book {i}'), user=self.user),
+        )
+
+    def test_upload_detail(self):
+        upload = BookUpload.objects.create(user=self.user, title='Upload', filename='upload.pdf', size=10)
+        self.assertQueriesDoNotGrow(
+            lambda: self.client.get(f'/book/uploads/{upload.upload_id}'),
+            lambda i: BookUpload.objects.create(user=self.user, title=f'Upload {i}', filename='upload.pdf', size=10),
+        )
+
+    def test_book_delete(self):
+        queries = {}
+        for size in (1, 5):
+            book = self.create_book(f'Deleted {size}')
+            for i in range(size):
+                self.create_questionairre(i, book)
+            queries[size] = self.captureQueries(lambda: self.client.delete(f'/book/{book.title}/'))
+        self.assertSameQueryCounts(queries)
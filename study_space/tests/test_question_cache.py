@@ -0,0 +1,120 @@
+from rest_framework.test import APITestCase
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from study_space.models import Book, GeneratedChunk
+from study_space.question_cache import book_content_hash
+from study_space.chunking import plan_chunks, select_chunks
+from study_space.tokens import estimate_tokens
+from study_space.extraction import extract_page_texts
+from study_space.serializers import PROMPT_VERSION, QuestionairreSerializer
+from unittest.mock import patch
+import os
+
+
+@override_settings(QUESTIONAIRRE_CHUNK_TOKENS={'basic': 100000, 'intermediate': 100000, 'detailed': 100000})
+@patch('study_space.serializers.QuestionairreSerializer.under_token_limit', return_value=(True, 100))
+class QuestionairreResultCacheTest(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.other_user = User.objects.create_user(username='otheruser', password='otherpass')
+        with open('study_space/tests/files/Chapter_7.pdf', 'rb') as f:
+            self.content = f.read()
+        self.book = Book.objects.create(
+            title='Test Book',
+            user=self.user,
+            file=SimpleUploadedFile('test.pdf', self.content, content_type='application/pdf')
+        )
+        self.other_book = Book.objects.create(
+            title='Same Textbook',
+            user=self.other_user,
+            file=SimpleUploadedFile('copy.pdf', self.content, content_type='application/pdf')
+        )
+
+    def tearDown(self):
+        for book in Book.objects.all():
+            if os.path.isfile(book.file.path):
+                os.remove(book.file.path)
+
+    def generate(self, book, detail_level, start_page=None, end_page=None):
+        return QuestionairreSerializer().generate_question_answers(book, detail_level, start_page, end_page)
+
+    def test_content_hash_recorded_on_upload(self, mock_token_limit):
+        self.assertEqual(len(self.book.content_hash), 64)
+        self.assertEqual(self.book.content_hash, self.other_book.content_hash)
+
+    def test_content_hash_backfilled(self, mock_token_limit):
+        Book.objects.filter(pk=self.book.pk).update(content_hash='')
+        self.book.refresh_from_db()
+        expected = self.other_book.content_hash
+        self.assertEqual(book_content_hash(self.book), expected)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.content_hash, expected)
+
+    @patch('study_space.serializers.QuestionairreSerializer.question_generator')
+    def test_repeat_request_uses_cache(self, mock_generator, mock_token_limit):
+        mock_generator.side_effect = lambda prompt, tokens=0: f"{len(prompt)};generated\n"
+        first = self.generate(self.book, 'intermediate')
+        calls = mock_generator.call_count
+        self.assertEqual(GeneratedChunk.objects.count(), calls)
+
+        second = self.generate(self.other_book, 'intermediate')
+        self.assertEqual(second, first)
+        self.assertEqual(mock_generator.call_count, calls)
+
+    @patch('study_space.serializers.QuestionairreSerializer.question_generator', return_value='question;answer\n')
+    def test_overlapping_range_generates_missing_chunks(self, mock_generator, mock_token_limit):
+        page_texts = extract_page_texts(self.book.file)
+        chunk_tokens = max(estimate_tokens(text) for text in page_texts)
+        plan = plan_chunks(page_texts, chunk_tokens)
+        first_range = set(select_chunks(plan, page_texts, 1, 6))
+        second_range = set(select_chunks(plan, page_texts, 4, 9))
+
+        with override_settings(QUESTIONAIRRE_CHUNK_TOKENS={'detailed': chunk_tokens}):
+            self.generate(self.book, 'detailed', 1, 6)
+            self.assertEqual(mock_generator.call_count, len(first_range))
+            self.generate(self.book, 'detailed', 4, 9)
+
+        self.assertTrue(first_range & second_range)
+        self.assertEqual(mock_generator.call_count, len(first_range | second_range))
+        self.assertEqual(GeneratedChunk.objects.count(), len(first_range | second_range))
+
+    @patch('study_space.serializers.QuestionairreSerializer.question_generator', return_value='question;answer\n')
+    def test_cache_keyed_on_detail_level_and_prompt_version(self, mock_generator, mock_token_limit):
+        self.generate(self.book, 'detailed', 1, 3)
+        self.generate(self.book, 'intermediate', 1, 3)
+        self.assertEqual(mock_generator.call_count, 2)
+
+        GeneratedChunk.objects.update(prompt_version='old')
+        self.generate(self.book, 'detailed', 1, 3)
+        self.assertEqual(mock_generator.call_count, 3)
+        self.assertTrue(GeneratedChunk.objects.filter(prompt_version=PROMPT_VERSION).exists())
+
+    @override_settings(QUESTIONAIRRE_RESULT_CACHE=False)
+    @patch('study_space.serializers.QuestionairreSerializer.question_generator', return_value='question;answer\n')
+    def test_cache_disabled(self, mock_generator, mock_token_limit):
+        self.generate(self.book, 'detailed', 1, 3)
+        self.generate(self.book, 'detailed', 1, 3)
+        self.assertEqual(mock_generator.call_count, 2)
+        self.assertFalse(GeneratedChunk.objects.exists())
+
+    @patch('study_space.serializers.QuestionairreSerializer.question_generator', return_value='question;answer\n')
+    def test_cache_keyed_on_chunk_budget_and_model(self, mock_generator, mock_token_limit):
+        self.generate(self.book, 'detailed', 1, 3)
+        self.generate(self.book, 'detailed', 1, 3)
+        self.assertEqual(mock_generator.call_count, 1)
+
+        with override_settings(QUESTIONAIRRE_CHUNK_TOKENS={'detailed': 50000}):
+            self.generate(self.book, 'detailed', 1, 3)
+        self.assertEqual(mock_generator.call_count, 2)
+
+        with override_settings(LLM_BACKEND={'BACKEND': 'study_space.llm.StubBackend', 'MODEL': 'other-model'}):
+            self.generate(self.book, 'detailed', 1, 3)
+        self.assertEqual(mock_generator.call_count, 3)
+        model = settings.LLM_BACKEND['MODEL']
+        self.assertEqual(
+            sorted(GeneratedChunk.objects.values_list('chunk_tokens', 'model')),
+            sorted([(100000, model), (50000, model), (100000, 'other-model')]),
+        )
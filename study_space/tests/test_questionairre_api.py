@@ -7,6 +7,8 @@ from django.core.files.uploadedfile import SimpleUploadedFile
 from django.db import transaction
 import os
 from unittest.mock import patch
+from study_space.models import QuestionairreChunk, QuestionairreJob
+from study_space.jobs import run_pending_jobs
 
 class QuestionairreAPITests(APITestCase):
 
@@ -87,11 +89,15 @@ class QuestionairreAPITests(APITestCase):
             'end_page': 2
         }
         response = self.client.post('/questionairre/', data, format='multipart')
-        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], 'queued')
+        self.assertEqual(Questionairre.objects.count(), 1)
+        self.assertEqual(run_pending_jobs(), 1)
         self.assertEqual(Questionairre.objects.count(), 2)
         questionairre = Questionairre.objects.last()
         self.assertEqual(questionairre.book, self.book)
         self.files_to_clean.append(questionairre.question_answers_file.path)
+        mock_generate.assert_called_once_with(self.book, 'intermediate', 1, 2)
     
     @patch('study_space.serializers.QuestionairreSerializer.generate_question_answers')
     def test_post_questionairre_valid_no_pages(self, mock_generate):
@@ -101,7 +107,8 @@ class QuestionairreAPITests(APITestCase):
             'detail_level': 'detailed'
         }
         response = self.client.post('/questionairre/', data, format='multipart')
-        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        run_pending_jobs()
         self.assertEqual(Questionairre.objects.count(), 2)
         questionairre = Questionairre.objects.last()
         self.assertEqual(questionairre.book, self.book)
@@ -174,7 +181,52 @@ class QuestionairreAPITests(APITestCase):
 
         with open(self.questionairre.question_answers_file.path, 'rb') as f:
             expected_content = f.read()
-        self.assertEqual(response.content, expected_content)
+        self.assertEqual(response.getvalue(), expected_content)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('ETag', response)
+
+    def test_get_questionairre_detail_not_modified(self):
+        etag = self.client.get(f'/questionairre/{self.questionairre.pk}')['ETag']
+        response = self.client.get(f'/questionairre/{self.questionairre.pk}', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+
+        response = self.client.get(f'/questionairre/{self.questionairre.pk}', HTTP_IF_NONE_MATCH='"stale"')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_get_questionairre_detail_range(self):
+        url = f'/questionairre/{self.questionairre.pk}'
+        response = self.client.get(url, HTTP_RANGE='bytes=0-8')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(response.getvalue(), b'questions')
+        self.assertEqual(response['Content-Range'], 'bytes 0-8/17')
+        self.assertEqual(response['Content-Length'], '9')
+
+        response = self.client.get(url, HTTP_RANGE='bytes=10-')
+        self.assertEqual(response.getvalue(), b'content')
+        response = self.client.get(url, HTTP_RANGE='bytes=-7')
+        self.assertEqual(response.getvalue(), b'content')
+
+        response = self.client.get(url, HTTP_RANGE='bytes=17-')
+        self.assertEqual(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        self.assertEqual(response['Content-Range'], 'bytes */17')
+
+        response = self.client.get(url, HTTP_RANGE='bytes=0-8', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.getvalue(), b'questions_content')
+
+    def test_get_questionairre_detail_offloaded_to_proxy(self):
+        name = self.questionairre.question_answers_file.name
+        with self.settings(QUESTIONAIRRE_DOWNLOADS={'MODE': 'x-accel-redirect', 'ACCEL_REDIRECT_PREFIX': '/protected-media/'}):
+            response = self.client.get(f'/questionairre/{self.questionairre.pk}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{name}')
+        self.assertEqual(response.content, b'')
+        self.assertIn('attachment;', response['Content-Disposition'])
+
+        with self.settings(QUESTIONAIRRE_DOWNLOADS={'MODE': 'x-sendfile', 'ACCEL_REDIRECT_PREFIX': ''}):
+            response = self.client.get(f'/questionairre/{self.questionairre.pk}')
+        self.assertEqual(response['X-Sendfile'], self.questionairre.question_answers_file.path)
     
     @patch('study_space.serializers.QuestionairreSerializer.generate_question_answers')
     def test_get_questionairre_detail_not_found(self, mock_generate):
@@ -228,3 +280,63 @@ class QuestionairreAPITests(APITestCase):
         self.assertEqual(response.data, 'File not found ')
         self.assertTrue(Questionairre.objects.filter(pk=self.questionairre.pk).exists(), "Questionairre was incorrectly deleted")
 
+    @patch('study_space.serializers.QuestionairreSerializer.generate_question_answers')
+    def test_get_questionairre_job_status(self, mock_generate):
+        mock_generate.return_value = self.mock_generate_question_answers(None, None, None, None)
+        data = {
+            'book': 'Test Book',
+            'detail_level': 'basic'
+        }
+        response = self.client.post('/questionairre/', data, format='multipart')
+        job_id = response.data['id']
+
+        response = self.client.get(f'/questionairre/jobs/{job_id}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], 'queued')
+        self.assertEqual(response.data['book'], 'Test Book')
+        self.assertIsNone(response.data['questionairre'])
+
+        run_pending_jobs()
+        response = self.client.get(f'/questionairre/jobs/{job_id}')
+        self.assertEqual(response.data['status'], 'complete')
+        questionairre = Questionairre.objects.get(pk=response.data['questionairre'])
+        self.files_to_clean.append(questionairre.question_answers_file.path)
+
+    def test_get_questionairre_job_other_user(self):
+        job = QuestionairreJob.objects.create(book=self.book, user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.other_token.key)
+        response = self.client.get(f'/questionairre/jobs/{job.pk}')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.data, 'job not found')
+
+    def test_get_partial_questionairre_returns_recorded_chunks(self):
+        partial = Questionairre.objects.create(book=self.book, user=self.user, detail_level='basic', status='partial')
+        QuestionairreChunk.objects.create(questionairre=partial, start_page=4, end_page=6, question_answers='second;answer\n')
+        QuestionairreChunk.objects.create(questionairre=partial, start_page=1, end_page=3, question_answers='first;answer\n')
+        response = self.client.get(f'/questionairre/{partial.pk}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.content, b'first;answer\nsecond;answer\n')
+
+    def test_delete_partial_questionairre(self):
+        partial = Questionairre.objects.create(book=self.book, user=self.user, detail_level='basic', status='partial')
+        response = self.client.delete(f'/questionairre/{partial.pk}')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Questionairre.objects.filter(pk=partial.pk).exists())
+
+    @patch('study_space.serializers.QuestionairreSerializer.generate_question_answers')
+    def test_retry_failed_questionairre_job(self, mock_generate):
+        mock_generate.return_value = self.mock_generate_question_answers(None, None, None, None)
+        job = QuestionairreJob.objects.create(book=self.book, user=self.user, status='complete')
+        response = self.client.post(f'/questionairre/jobs/{job.pk}')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, 'only failed jobs can be retried')
+
+        QuestionairreJob.objects.filter(pk=job.pk).update(status='failed', error='quota exceeded')
+        response = self.client.post(f'/questionairre/jobs/{job.pk}')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], 'queued')
+
+        run_pending_jobs()
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'complete')
+        self.files_to_clean.append(job.questionairre.question_answers_file.path)
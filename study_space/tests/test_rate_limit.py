@@ -0,0 +1,104 @@
+from django.conf import settings
+from django.test import SimpleTestCase
+from study_space.rate_limit import FakeClock, RateLimiter, TokenBucket, get_gemini_rate_limiter
+import asyncio
+from unittest.mock import patch
+import threading
+
+
+class TokenBucketTest(SimpleTestCase):
+
+    def test_burst_up_to_capacity(self):
+        bucket = TokenBucket(per_minute=60, capacity=3)
+        self.assertEqual([bucket.reserve(1, 0.0) for _ in range(3)], [0.0, 0.0, 0.0])
+        self.assertAlmostEqual(bucket.reserve(1, 0.0), 1.0)
+
+    def test_refills_over_time(self):
+        bucket = TokenBucket(per_minute=60, capacity=1)
+        bucket.reserve(1, 0.0)
+        self.assertAlmostEqual(bucket.reserve(1, 0.5), 0.5)
+        self.assertEqual(bucket.reserve(1, 10.0), 0.0)
+
+
+class RateLimiterTest(SimpleTestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def test_spaces_requests_over_budget(self):
+        limiter = RateLimiter(requests_per_minute=15, clock=self.clock)
+        waits = [limiter.reserve() for _ in range(17)]
+        self.assertEqual(waits[:15], [0.0] * 15)
+        self.assertAlmostEqual(waits[15], 4.0)
+        self.assertAlmostEqual(waits[16], 8.0)
+
+    def test_acquire_sleeps_on_clock(self):
+        limiter = RateLimiter(requests_per_minute=1, clock=self.clock)
+        limiter.acquire()
+        waited = limiter.acquire()
+        self.assertAlmostEqual(waited, 60.0)
+        self.assertAlmostEqual(self.clock.now(), 60.0)
+        self.assertAlmostEqual(limiter.acquire(), 60.0)
+
+    def test_acquire_async_sleeps_on_clock(self):
+        limiter = RateLimiter(requests_per_minute=1, clock=self.clock)
+        self.assertEqual(asyncio.run(limiter.acquire_async()), 0.0)
+        self.assertAlmostEqual(asyncio.run(limiter.acquire_async()), 60.0)
+        self.assertEqual(self.clock.sleeps, [60.0])
+
+    def test_token_budget(self):
+        limiter = RateLimiter(requests_per_minute=100, tokens_per_minute=1000, clock=self.clock)
+        self.assertEqual(limiter.reserve(tokens=1000), 0.0)
+        self.assertAlmostEqual(limiter.reserve(tokens=500), 30.0)
+
+    def test_per_user_fairness(self):
+        limiter = RateLimiter(requests_per_minute=60, user_requests_per_minute=2, clock=self.clock)
+        self.assertEqual(limiter.reserve_user('heavy'), 0.0)
+        self.assertEqual(limiter.reserve_user('heavy'), 0.0)
+        self.assertAlmostEqual(limiter.reserve_user('heavy'), 30.0)
+        self.assertEqual(limiter.reserve_user('light'), 0.0)
+
+    def test_user_over_share_holds_no_global_capacity(self):
+        limiter = RateLimiter(requests_per_minute=2, user_requests_per_minute=1, clock=self.clock)
+        self.assertEqual(limiter.acquire(user='heavy'), 0.0)
+        light_waits = []
+
+        def sleep(seconds):
+            # Another user's request arrives while the heavy user waits for their share.
+            light_waits.append(limiter.acquire(user='light'))
+            self.clock.advance(seconds)
+
+        with patch.object(self.clock, 'sleep', side_effect=sleep):
+            self.assertAlmostEqual(limiter.acquire(user='heavy'), 60.0)
+        self.assertEqual(light_waits, [0.0])
+
+    def test_concurrent_reservations_are_atomic(self):
+        limiter = RateLimiter(requests_per_minute=60, clock=self.clock)
+        waits = []
+
+        def reserve():
+            for _ in range(30):
+                waits.append(limiter.reserve())
+
+        threads = [threading.Thread(target=reserve) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(waits), 120)
+        self.assertEqual(waits.count(0.0), 60)
+        self.assertAlmostEqual(max(waits), 60.0)
+
+
+class GeminiRateLimiterTest(SimpleTestCase):
+
+    def test_budgets_are_shared_by_default(self):
+        self.assertEqual(settings.GEMINI_RATE_LIMIT['CACHE'], 'rate_limit')
+        self.assertEqual(get_gemini_rate_limiter().cache, 'rate_limit')
+        self.assertIsNone(settings.CACHES['rate_limit']['OPTIONS']['MAX_ENTRIES'])
+
+    def test_process_budgets_are_opt_in(self):
+        with self.settings(GEMINI_RATE_LIMIT={**settings.GEMINI_RATE_LIMIT, 'CACHE': None}):
+            self.assertIsNone(get_gemini_rate_limiter().cache)
+        self.assertEqual(get_gemini_rate_limiter().cache, 'rate_limit')
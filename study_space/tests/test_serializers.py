@@ -6,8 +6,14 @@ from study_space.serializers import BookSerializer, QuestionairreSerializer
 import os
 import shutil
 from django.conf import settings
+from study_space.tokens import estimate_tokens
+from study_space.extraction import extract_page_texts
 from unittest.mock import patch
-from django.test import RequestFactory
+from django.test import RequestFactory, override_settings
+from rest_framework import serializers
+import asyncio
+import random
+import time
 
 class BookSerializerTest(APITestCase):
 
@@ -332,3 +338,69 @@ class QuestionairreSerializerTest(APITestCase):
         self.assertFalse(serializer.is_valid())
         self.assertIn('non_field_errors', serializer.errors)
         self.assertEqual(str(serializer.errors['non_field_errors'][0]),'start page can not be greater than end page')
+
+    def fake_question_generator(self, prompt, tokens=0):
+        time.sleep(random.uniform(0, 0.02))
+        return f"{len(prompt)};{prompt[-30:]}\n"
+
+    async def fake_question_generator_async(self, prompt, tokens=0):
+        await asyncio.sleep(random.uniform(0, 0.02))
+        return f"{len(prompt)};{prompt[-30:]}\n"
+
+    @patch('study_space.serializers.QuestionairreSerializer.under_token_limit', return_value=(True, 100))
+    def test_concurrent_chunks_keep_page_order(self, mock_token_limit):
+        serializer = QuestionairreSerializer(context=self.context)
+        chunk_tokens = max(estimate_tokens(text) for text in extract_page_texts(self.book.file))
+        with patch.object(QuestionairreSerializer, 'question_generator', side_effect=self.fake_question_generator) as mock_generator:
+            with override_settings(QUESTIONAIRRE_CHUNK_CONCURRENCY=1):
+                sequential = serializer.question_detail_level(self.book.file, chunk_tokens, None, None)
+            sequential_calls = mock_generator.call_count
+            mock_generator.reset_mock()
+            with override_settings(QUESTIONAIRRE_CHUNK_CONCURRENCY=4):
+                concurrent = serializer.question_detail_level(self.book.file, chunk_tokens, None, None)
+            self.assertEqual(mock_generator.call_count, sequential_calls)
+        self.assertGreater(sequential_calls, 1)
+        self.assertEqual(concurrent, sequential)
+
+    @override_settings(QUESTIONAIRRE_ASYNC_GENERATION=True, QUESTIONAIRRE_CHUNK_CONCURRENCY=4)
+    @patch('study_space.serializers.QuestionairreSerializer.under_token_limit', return_value=(True, 100))
+    def test_async_chunks_keep_page_order(self, mock_token_limit):
+        serializer = QuestionairreSerializer(context=self.context)
+        chunk_tokens = max(estimate_tokens(text) for text in extract_page_texts(self.book.file))
+        with patch.object(QuestionairreSerializer, 'question_generator', side_effect=self.fake_question_generator):
+            with override_settings(QUESTIONAIRRE_ASYNC_GENERATION=False):
+                expected = serializer.question_detail_level(self.book.file, chunk_tokens, None, None)
+        with patch.object(QuestionairreSerializer, 'question_generator_async', side_effect=self.fake_question_generator_async) as mock_generator:
+            questions = serializer.question_detail_level(self.book.file, chunk_tokens, None, None)
+        self.assertGreater(mock_generator.call_count, 1)
+        self.assertEqual(questions, expected)
+
+    @override_settings(QUESTIONAIRRE_ASYNC_GENERATION=True, QUESTIONAIRRE_CHUNK_CONCURRENCY=2)
+    @patch('study_space.serializers.QuestionairreSerializer.under_token_limit', return_value=(True, 100))
+    def test_async_failure_reports_chunks_in_flight(self, mock_token_limit):
+        async def generate(prompt, tokens=0):
+            if prompt == 'fail':
+                raise RuntimeError("quota exceeded")
+            await asyncio.sleep(0.01)
+            return prompt
+
+        done = []
+        serializer = QuestionairreSerializer(context=self.context)
+        with patch.object(QuestionairreSerializer, 'question_generator_async', side_effect=generate) as mock_generator:
+            with self.assertRaises(RuntimeError):
+                serializer.generate_chunks(['first', 'fail', 'never'], lambda index, questions: done.append(index))
+        self.assertEqual(done, [0])
+        self.assertEqual(mock_generator.call_count, 2)
+
+    @patch('study_space.serializers.QuestionairreSerializer.under_token_limit', return_value=(True, 100))
+    @patch('study_space.serializers.QuestionairreSerializer.question_generator', return_value='question;answer\n')
+    def test_page_range_chunks(self, mock_generator, mock_token_limit):
+        serializer = QuestionairreSerializer(context=self.context)
+        questions = serializer.question_detail_level(self.book.file, 100000, 1, 1)
+        self.assertEqual(questions, 'question;answer\n')
+        self.assertEqual(mock_generator.call_count, 1)
+
+    def test_page_range_out_of_bounds(self):
+        serializer = QuestionairreSerializer(context=self.context)
+        with self.assertRaises(serializers.ValidationError):
+            serializer.question_detail_level(self.book.file, 100000, 1, 500)
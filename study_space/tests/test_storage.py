@@ -0,0 +1,181 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import SimpleTestCase, override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APITestCase
+from study_space.benchmark import synthetic_pdf
+from study_space.models import Book, Questionairre
+from study_space.serializers import BookSerializer, QuestionairreSerializer
+from study_space.storage import S3Storage, ShardedFileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from unittest.mock import patch
+import io
+import os
+import shutil
+import tempfile
+
+
+class ClientError(Exception):
+
+    def __init__(self, code):
+        super().__init__(code)
+        self.response = {'Error': {'Code': code}}
+
+
+class FakeS3Client:
+    """An in-memory stand-in for a boto3 S3 client talking to MinIO, for one bucket."""
+
+    def __init__(self):
+        self.objects = {}
+
+    def object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise ClientError('404')
+        return self.objects[(Bucket, Key)]
+
+    def upload_fileobj(self, fileobj, bucket, key, ExtraArgs=None):
+        self.objects[(bucket, key)] = {'Body': fileobj.read(), 'LastModified': timezone.now(), **(ExtraArgs or {})}
+
+    def get_object(self, Bucket, Key):
+        return {'Body': io.BytesIO(self.object(Bucket, Key)['Body'])}
+
+    def head_object(self, Bucket, Key):
+        stored = self.object(Bucket, Key)
+        return {'ContentLength': len(stored['Body']), 'LastModified': stored['LastModified']}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+    def get_paginator(self, operation):
+        return self
+
+    def paginate(self, Bucket, Prefix, Delimiter):
+        keys = sorted(key[len(Prefix):] for bucket, key in self.objects if bucket == Bucket and key.startswith(Prefix))
+        yield {
+            'CommonPrefixes': [{'Prefix': Prefix + key.split(Delimiter)[0] + Delimiter} for key in keys if Delimiter in key],
+            'Contents': [{'Key': Prefix + key} for key in keys if Delimiter not in key],
+        }
+
+    def generate_presigned_url(self, operation, Params, ExpiresIn):
+        return f"https://minio.local/{Params['Bucket']}/{Params['Key']}?expires={ExpiresIn}"
+
+
+class S3StorageTest(SimpleTestCase):
+
+    def setUp(self):
+        self.client = FakeS3Client()
+        self.storage = S3Storage(bucket_name='books', location='media', client=self.client)
+
+    def test_save_open_delete(self):
+        name = self.storage.save('questions/biology.txt', ContentFile(b'question;answer\n'))
+        self.assertEqual(name, 'questions/biology.txt')
+        self.assertIn(('books', 'media/questions/biology.txt'), self.client.objects)
+        self.assertTrue(self.storage.exists(name))
+        self.assertEqual(self.storage.size(name), 16)
+        with self.storage.open(name) as f:
+            self.assertEqual(f.read(), b'question;answer\n')
+
+        other = self.storage.save('questions/biology.txt', ContentFile(b'other'))
+        self.assertTrue(other.startswith('questions/biology_'))
+        self.storage.delete(name)
+        self.assertFalse(self.storage.exists(name))
+
+    def test_listdir(self):
+        self.storage.save('files/a.pdf', ContentFile(b'a'))
+        self.storage.save('files/sub/b.pdf', ContentFile(b'b'))
+        self.assertEqual(self.storage.listdir('files'), (['sub'], ['a.pdf']))
+
+    def test_urls(self):
+        self.assertEqual(self.storage.url('questions/a b.txt'), 'https://minio.local/books/media/questions/a b.txt?expires=3600')
+        cdn = S3Storage(bucket_name='books', custom_domain='cdn.example.com', client=self.client)
+        self.assertEqual(cdn.url('questions/a b.txt'), 'https://cdn.example.com/questions/a%20b.txt')
+
+    def test_needs_boto3_or_client(self):
+        with patch('study_space.storage.boto3', None):
+            with self.assertRaises(ImproperlyConfigured):
+                S3Storage(bucket_name='books').exists('a')
+        with self.assertRaises(ImproperlyConfigured):
+            S3Storage()
+
+
+class ShardedFileSystemStorageTest(SimpleTestCase):
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.storage = ShardedFileSystemStorage(location=self.location)
+
+    def tearDown(self):
+        shutil.rmtree(self.location, ignore_errors=True)
+
+    def test_files_are_sharded(self):
+        name = self.storage.save('questions/biology.txt', ContentFile(b'question;answer\n'))
+        directory, shard_1, shard_2, filename = name.split('/')
+        self.assertEqual((directory, filename), ('questions', 'biology.txt'))
+        self.assertEqual((len(shard_1), len(shard_2)), (2, 2))
+        self.assertTrue(os.path.isfile(os.path.join(self.location, name)))
+
+        other = self.storage.save('questions/biology.txt', ContentFile(b'other'))
+        self.assertNotEqual(other, name)
+        self.assertEqual(os.path.dirname(other), os.path.dirname(name))
+
+
+@override_settings(
+    LLM_BACKEND={'BACKEND': 'study_space.llm.StubBackend', 'MODEL': 'stub', 'OPTIONS': {}},
+    GEMINI_RATE_LIMIT={'REQUESTS_PER_MINUTE': 10 ** 6},
+    QUESTIONAIRRE_RESULT_CACHE=False,
+    PDF_EXTRACTION={'WORKERS': 1, 'PAGES_PER_TASK': 8, 'PAGE_TIMEOUT': 10, 'MEMORY_LIMIT_MB': None, 'MIN_PAGES': 0},
+)
+class ObjectStorageFlowTest(APITestCase):
+    """Books and questionnaires kept on an S3-compatible store, with nothing on the local disk."""
+
+    def setUp(self):
+        self.s3 = FakeS3Client()
+        self.settings_override = override_settings(STORAGES={**settings.STORAGES, 'default': {
+            'BACKEND': 'study_space.storage.S3Storage',
+            'OPTIONS': {'bucket_name': 'books', 'custom_domain': 'cdn.example.com', 'client': self.s3},
+        }})
+        self.settings_override.enable()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.user).key)
+
+    def tearDown(self):
+        self.settings_override.disable()
+
+    @patch('study_space.serializers.count_tokens', side_effect=lambda text, model_name: len(text) // 4)
+    def test_generate_download_delete(self, mock_count_tokens):
+        serializer = BookSerializer(data={'title': 'Cells', 'file': SimpleUploadedFile('cells.pdf', synthetic_pdf(2), content_type='application/pdf')})
+        serializer.is_valid(raise_exception=True)
+        book = serializer.save(user=self.user)
+        self.assertIsInstance(default_storage._wrapped, S3Storage)
+        self.assertIn(('books', book.file.name), self.s3.objects)
+
+        questionairre = QuestionairreSerializer().create({'user': self.user, 'book': book, 'detail_level': 'basic'})
+        name = questionairre.question_answers_file.name
+        self.assertTrue(name.startswith('questions/Cells_'))
+        content = self.s3.objects[('books', name)]['Body']
+        self.assertTrue(content)
+
+        response = self.client.get(f'/questionairre/{questionairre.pk}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.getvalue(), content)
+        etag = response['ETag']
+        response = self.client.get(f'/questionairre/{questionairre.pk}', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        with self.settings(QUESTIONAIRRE_DOWNLOADS={**settings.QUESTIONAIRRE_DOWNLOADS, 'MODE': 'redirect'}):
+            response = self.client.get(f'/questionairre/{questionairre.pk}')
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        self.assertEqual(response['Location'], f'https://cdn.example.com/{name}')
+
+        self.assertEqual(self.client.delete(f'/questionairre/{questionairre.pk}').status_code, status.HTTP_204_NO_CONTENT)
+        self.assertNotIn(('books', name), self.s3.objects)
+        self.assertEqual(self.client.delete('/book/Cells/').status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.s3.objects, {})
+        self.assertFalse(Book.objects.exists())
+        self.assertFalse(Questionairre.objects.exists())
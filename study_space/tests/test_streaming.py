@@ -0,0 +1,121 @@
+from rest_framework.test import APITestCase, APIClient
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from asgiref.sync import async_to_sync
+from study_space.models import Book, Questionairre, QuestionairreChunk, QuestionairreJob
+from study_space.streaming import JobEventStream
+import json
+import os
+
+
+def parse_events(text):
+    events = []
+    for block in text.split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if line and not line.startswith(":"))
+        if 'event' in fields:
+            events.append((fields['event'], json.loads(fields['data']), fields.get('id')))
+    return events
+
+
+class JobEventStreamTest(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.token = Token.objects.get_or_create(user=self.user)[0]
+        self.other_user = User.objects.create_user(username='otheruser', password='otherpass')
+        self.other_token = Token.objects.get_or_create(user=self.other_user)[0]
+        self.book = Book.objects.create(
+            title='Test Book',
+            user=self.user,
+            file=SimpleUploadedFile('book.pdf', b'book_content', content_type='application/pdf')
+        )
+        self.questionairre = Questionairre.objects.create(book=self.book, user=self.user, status='partial')
+        self.job = QuestionairreJob.objects.create(
+            book=self.book,
+            user=self.user,
+            questionairre=self.questionairre,
+            status='running',
+            total_chunks=2,
+        )
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def tearDown(self):
+        if os.path.isfile(self.book.file.path):
+            os.remove(self.book.file.path)
+
+    def add_chunk(self, start_page, end_page, text):
+        return QuestionairreChunk.objects.create(
+            questionairre=self.questionairre, start_page=start_page, end_page=end_page, question_answers=text
+        )
+
+    def finish_job(self, completed_chunks=2):
+        QuestionairreJob.objects.filter(pk=self.job.pk).update(status='complete', completed_chunks=completed_chunks)
+
+    def test_poll_emits_chunks_as_they_are_recorded(self):
+        stream = JobEventStream(self.job.pk)
+        self.add_chunk(4, 6, 'second;answer\n')
+        QuestionairreJob.objects.filter(pk=self.job.pk).update(completed_chunks=1)
+
+        events = parse_events("".join(stream.poll()))
+        self.assertEqual([event for event, data, event_id in events], ['chunk', 'progress'])
+        self.assertEqual(events[0][1]['question_answers'], 'second;answer\n')
+        self.assertEqual(events[0][1]['start_page'], 4)
+        self.assertEqual(events[1][1]['completed_chunks'], 1)
+        self.assertEqual(stream.poll(), [])
+        self.assertFalse(stream.finished)
+
+        self.add_chunk(1, 3, 'first;answer\n')
+        self.finish_job()
+        events = parse_events("".join(stream.poll()))
+        self.assertEqual([event for event, data, event_id in events], ['chunk', 'progress', 'complete'])
+        self.assertEqual(events[2][1], {'questionairre': self.questionairre.pk})
+        self.assertTrue(stream.finished)
+
+    def test_failed_job_ends_stream(self):
+        QuestionairreJob.objects.filter(pk=self.job.pk).update(status='failed', error='quota exceeded')
+        stream = JobEventStream(self.job.pk)
+        events = parse_events("".join(stream.poll()))
+        self.assertEqual(events[-1][:2], ('failed', {'error': 'quota exceeded'}))
+        self.assertTrue(stream.finished)
+
+    def test_keepalive_when_idle(self):
+        stream = JobEventStream(self.job.pk, keepalive=0)
+        message, quiet_since = stream.next_message([], 0)
+        self.assertEqual(message, ": keep-alive\n\n")
+
+    def test_stream_endpoint(self):
+        self.add_chunk(1, 3, 'first;answer\n')
+        self.add_chunk(4, 6, 'second;answer\n')
+        self.finish_job()
+        response = self.client.get(f'/questionairre/jobs/{self.job.pk}/stream', HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = parse_events(b"".join(response.streaming_content).decode())
+        self.assertEqual([event for event, data, event_id in events], ['chunk', 'chunk', 'progress', 'complete'])
+
+    def test_stream_endpoint_resumes_from_last_event_id(self):
+        first = self.add_chunk(1, 3, 'first;answer\n')
+        self.add_chunk(4, 6, 'second;answer\n')
+        self.finish_job()
+        response = self.client.get(f'/questionairre/jobs/{self.job.pk}/stream', HTTP_LAST_EVENT_ID=str(first.pk))
+        events = parse_events(b"".join(response.streaming_content).decode())
+        chunks = [data['question_answers'] for event, data, event_id in events if event == 'chunk']
+        self.assertEqual(chunks, ['second;answer\n'])
+
+    def test_stream_endpoint_other_user(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.other_token.key)
+        response = self.client.get(f'/questionairre/jobs/{self.job.pk}/stream', HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_async_stream(self):
+        self.add_chunk(1, 3, 'first;answer\n')
+        self.finish_job(completed_chunks=1)
+
+        async def collect():
+            return "".join([message async for message in JobEventStream(self.job.pk, poll_interval=0)])
+
+        events = parse_events(async_to_sync(collect)())
+        self.assertEqual([event for event, data, event_id in events], ['chunk', 'progress', 'complete'])
@@ -0,0 +1,40 @@
+from django.test import SimpleTestCase, override_settings
+from study_space.serializers import QuestionairreSerializer
+from study_space.tokens import count_tokens, estimate_tokens
+from unittest.mock import patch
+
+
+class TokenEstimatorTest(SimpleTestCase):
+
+    def test_estimate_tokens(self):
+        self.assertEqual(estimate_tokens(''), 0)
+        self.assertEqual(estimate_tokens('The cell divides.'), 5)
+        self.assertEqual(estimate_tokens('mitochondrion'), 4)
+        self.assertEqual(estimate_tokens('a, b; c'), 5)
+
+    def test_estimate_scales_with_text(self):
+        text = 'Mitochondria are the powerhouse of the cell. ' * 100
+        self.assertEqual(estimate_tokens(text), 100 * estimate_tokens('Mitochondria are the powerhouse of the cell. '))
+
+    @patch('study_space.tokens.count_tokens_remote')
+    def test_count_tokens_is_local_by_default(self, mock_remote):
+        self.assertEqual(count_tokens('The cell divides.'), 5)
+        mock_remote.assert_not_called()
+
+    @override_settings(QUESTIONAIRRE_TOKEN_VERIFY_RATE=1.0)
+    @patch('study_space.tokens.count_tokens_remote', return_value=7)
+    def test_sampled_remote_verification(self, mock_remote):
+        self.assertEqual(count_tokens('The cell divides.'), 7)
+        mock_remote.assert_called_once_with('The cell divides.', 'gemini-2.0-flash')
+
+    @override_settings(QUESTIONAIRRE_TOKEN_VERIFY_RATE=1.0)
+    @patch('study_space.tokens.count_tokens_remote', side_effect=ConnectionError('offline'))
+    def test_remote_failure_falls_back_to_estimate(self, mock_remote):
+        self.assertEqual(count_tokens('The cell divides.'), 5)
+
+    @patch('study_space.tokens.count_tokens_remote')
+    def test_under_token_limit(self, mock_remote):
+        serializer = QuestionairreSerializer()
+        self.assertEqual(serializer.under_token_limit('The cell divides.'), (True, 5))
+        self.assertEqual(serializer.under_token_limit('The cell divides.', max_tokens=4), (False, 5))
+        mock_remote.assert_not_called()
@@ -0,0 +1,167 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APITestCase
+from study_space.benchmark import synthetic_pdf
+from study_space.models import Book, BookUpload, file_content_hash
+from study_space.uploads import assemble_upload, clear_stale_uploads, write_chunk
+from datetime import timedelta
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from io import BytesIO
+
+
+@override_settings(STORAGES={**settings.STORAGES, 'default': {'BACKEND': 'django.core.files.storage.InMemoryStorage'}})
+class BookUploadAPITests(APITestCase):
+
+    def setUp(self):
+        self.settings_override = override_settings(BOOK_UPLOADS={**settings.BOOK_UPLOADS, 'MAX_CHUNK_SIZE': 4096})
+        self.settings_override.enable()
+
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.user).key)
+        self.pdf = synthetic_pdf(3)
+
+    def tearDown(self):
+        self.settings_override.disable()
+
+    def stored_parts(self, url):
+        directory = f"uploads/{url.rsplit('/', 1)[1]}"
+        return default_storage.listdir(directory)[1] if default_storage.exists(directory) else []
+
+    def start(self, title='Chunked Book', size=None):
+        response = self.client.post('/book/uploads', {'title': title, 'filename': 'chunked.pdf', 'size': size or len(self.pdf)}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        return f"/book/uploads/{response.data['upload_id']}"
+
+    def send(self, url, first, last, data=None):
+        data = self.pdf[first:last + 1] if data is None else data
+        return self.client.put(url, data, content_type='application/octet-stream',
+                               HTTP_CONTENT_RANGE=f'bytes {first}-{last}/{len(self.pdf)}')
+
+    def send_all(self, url, start=0, size=4096):
+        for first in range(start, len(self.pdf), size):
+            response = self.send(url, first, min(first + size, len(self.pdf)) - 1)
+            self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+
+    def test_chunked_upload_creates_book(self):
+        url = self.start()
+        self.send_all(url)
+        self.assertEqual(self.client.get(url).data['received'], len(self.pdf))
+
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        book = Book.objects.get(title='Chunked Book', user=self.user)
+        with book.file.open('rb') as f:
+            self.assertEqual(f.read(), self.pdf)
+        self.assertEqual(book.content_hash, file_content_hash(ContentFile(self.pdf)))
+        self.assertFalse(BookUpload.objects.exists())
+        self.assertEqual(self.stored_parts(url), [])
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_resume_after_interruption(self):
+        url = self.start()
+        self.assertEqual(self.send(url, 0, 4095).status_code, status.HTTP_200_OK)
+        # The connection drops halfway through the second chunk.
+        response = self.send(url, 4096, 8191, data=self.pdf[4096:6000])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        received = self.client.get(url).data['received']
+        self.assertEqual(received, 4096)
+        self.assertEqual([default_storage.size(name) for name in BookUpload.objects.get().parts], [4096])
+        # A chunk whose response was lost is sent again, in part.
+        self.assertEqual(self.send(url, 0, 4095).data['received'], 4096)
+        self.assertEqual(self.send(url, 2048, 6143).data['received'], 6144)
+        self.assertEqual([default_storage.size(name) for name in BookUpload.objects.get().parts], [4096, 2048])
+        self.send_all(url, start=6144)
+        self.assertEqual(self.client.post(url).status_code, status.HTTP_201_CREATED)
+
+    def test_chunk_recorded_while_another_is_received(self):
+        self.start()
+        upload = BookUpload.objects.get()
+        pdf = self.pdf
+
+        class SlowStream(BytesIO):
+            # Another request saves the first half while this one is still being received.
+            def read(self, size=-1):
+                if self.tell() == 0:
+                    write_chunk(upload, BytesIO(pdf[:2048]), 0, 2047)
+                return super().read(size)
+
+        upload = write_chunk(upload, SlowStream(self.pdf[:4096]), 0, 4095)
+        self.assertEqual(upload.received, 4096)
+        self.assertEqual([default_storage.size(name) for name in upload.parts], [2048, 2048])
+        assembled, _ = assemble_upload(upload)
+        with assembled:
+            self.assertEqual(assembled.read(), self.pdf[:4096])
+
+    def test_chunk_past_received_conflicts(self):
+        url = self.start()
+        response = self.send(url, 4096, 8191)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['received'], 0)
+
+    def test_invalid_content_range(self):
+        url = self.start()
+        self.assertEqual(self.client.put(url, b'abc', content_type='application/octet-stream').status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.put(url, b'abc', content_type='application/octet-stream', HTTP_CONTENT_RANGE='bytes 0-2/99')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.send(url, 0, 4096).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_complete_before_all_bytes_received(self):
+        url = self.start()
+        self.send(url, 0, 4095)
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertTrue(BookUpload.objects.exists())
+
+    def test_non_pdf_rejected_at_first_chunk(self):
+        self.pdf = b'Not a pdf' * 1000
+        url = self.start()
+        response = self.send(url, 0, 4095)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {'file': ['File type not Known']})
+        self.assertEqual(self.client.get(url).data['received'], 0)
+        self.assertEqual(self.stored_parts(url), [])
+
+    def test_invalid_file_rejected_at_completion(self):
+        self.pdf = b'%PDF-1.4\n' + b'Not a pdf' * 10
+        url = self.start()
+        self.send(url, 0, len(self.pdf) - 1)
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('file', response.data)
+        self.assertFalse(BookUpload.objects.exists())
+        self.assertFalse(Book.objects.exists())
+        self.assertEqual(self.stored_parts(url), [])
+
+    def test_start_validation(self):
+        Book.objects.create(title='Taken', user=self.user, file=ContentFile(self.pdf, name='taken.pdf'))
+        response = self.client.post('/book/uploads', {'title': 'Taken', 'filename': 'a.pdf', 'size': 10}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('title', response.data)
+        response = self.client.post('/book/uploads', {'title': 'Huge', 'filename': 'a.pdf', 'size': settings.BOOK_VALIDATION['MAX_SIZE'] + 1}, format='json')
+        self.assertIn('size', response.data)
+
+    def test_other_user_cannot_see_upload(self):
+        url = self.start()
+        other = User.objects.create_user(username='otheruser', password='otherpass')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=other).key)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.send(url, 0, 4095).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_abort_and_clear_stale(self):
+        url = self.start()
+        self.send(url, 0, 4095)
+        self.assertEqual(len(self.stored_parts(url)), 1)
+        self.assertEqual(self.client.delete(url).status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.stored_parts(url), [])
+
+        self.send(self.start(), 0, 4095)
+        self.assertEqual(clear_stale_uploads(), 0)
+        self.assertEqual(clear_stale_uploads(now=timezone.now() + timedelta(hours=25)), 1)
+        self.assertFalse(BookUpload.objects.exists())
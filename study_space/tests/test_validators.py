@@ -0,0 +1,86 @@
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import SkipFile
+from django.test import SimpleTestCase, override_settings
+from study_space.benchmark import synthetic_pdf
+from study_space.pdf_engine import declared_page_count
+from study_space.upload_handlers import BookFileUploadHandler
+from study_space.validators import validate_fIle_size_and_type
+from unittest.mock import patch
+
+
+def page_tree_pdf(count):
+    """A PDF whose page tree declares 'count' pages but holds none."""
+
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [] /Count %d >>" % count,
+    ]
+    pdf = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(pdf)
+    pdf += b"xref\n0 3\n0000000000 65535 f \n" + b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size 3 /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % xref
+    return bytes(pdf)
+
+
+@override_settings(BOOK_VALIDATION={'MAX_SIZE': 64 * 1024, 'MAX_PAGES': 100})
+class ValidatorTest(SimpleTestCase):
+
+    def test_valid_pdf(self):
+        validate_fIle_size_and_type(SimpleUploadedFile('book.pdf', synthetic_pdf(3)))
+
+    def test_page_count_read_from_page_tree(self):
+        self.assertEqual(declared_page_count(synthetic_pdf(7)), 7)
+        with patch('pypdf.PdfReader._flatten') as mock_flatten:
+            with self.assertRaisesMessage(ValidationError, 'PDF file must not be greater than 100 pages'):
+                validate_fIle_size_and_type(SimpleUploadedFile('book.pdf', page_tree_pdf(5000)))
+        mock_flatten.assert_not_called()
+
+    def test_size_checked_before_content(self):
+        with patch('study_space.validators.declared_page_count') as mock_count:
+            with self.assertRaisesMessage(ValidationError, 'File must not be larger than 0.0625 MB'):
+                validate_fIle_size_and_type(SimpleUploadedFile('book.pdf', b'%PDF-1.4\n' + b'0' * 64 * 1024))
+        mock_count.assert_not_called()
+
+    def test_type_checked_from_first_bytes(self):
+        with patch('study_space.validators.declared_page_count') as mock_count:
+            with self.assertRaisesMessage(ValidationError, 'File type not Known'):
+                validate_fIle_size_and_type(SimpleUploadedFile('book.pdf', b'plain text'))
+        mock_count.assert_not_called()
+
+    def test_unreadable_pdf(self):
+        with self.assertRaises(ValidationError):
+            validate_fIle_size_and_type(SimpleUploadedFile('book.pdf', b'%PDF-1.4\nno objects here'))
+
+
+@override_settings(BOOK_VALIDATION={'MAX_SIZE': 64 * 1024, 'MAX_PAGES': 100})
+class BookFileUploadHandlerTest(SimpleTestCase):
+
+    def receive(self, chunks):
+        handler = BookFileUploadHandler()
+        handler.new_file('file', 'book.pdf', 'application/pdf', None)
+        start = 0
+        for chunk in chunks:
+            self.assertEqual(handler.receive_data_chunk(chunk, start), chunk)
+            start += len(chunk)
+        return handler
+
+    def test_passes_pdf_through(self):
+        handler = self.receive([b'%PDF-1.4\n' + b'0' * 2000, b'0' * 2000])
+        self.assertEqual(handler.errors, {})
+
+    def test_skips_file_past_ceiling(self):
+        handler = self.receive([b'%PDF-1.4\n' + b'0' * 1000] + [b'0' * 16 * 1024] * 3)
+        with self.assertRaises(SkipFile):
+            handler.receive_data_chunk(b'0' * 16 * 1024, 1009 + 3 * 16 * 1024)
+        self.assertEqual(handler.errors, {'file': ['File must not be larger than 0.0625 MB']})
+
+    def test_skips_non_pdf_at_first_bytes(self):
+        handler = self.receive([b'plain text ' * 50])
+        with self.assertRaises(SkipFile):
+            handler.receive_data_chunk(b'more text ' * 100, 550)
+        self.assertEqual(handler.errors, {'file': ['File type not Known']})
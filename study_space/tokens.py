@@ -0,0 +1,75 @@
+import logging
+import math
+import random
+import re
+
+from django.conf import settings
+
+
+# Gemini's tokenizer averages about four characters per token on English prose; words
+# are counted separately so long words and punctuation are not underestimated.
+CHARS_PER_TOKEN = 4
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text):
+    """
+    Estimates the number of tokens in a text without calling the model.
+
+    Each word costs one token per CHARS_PER_TOKEN characters (at least one) and each
+    punctuation mark one token.
+
+    Parameters:
+    text (str): The text.
+
+    Returns:
+    int: The estimated number of tokens.
+    """
+
+    return sum(math.ceil(len(piece) / CHARS_PER_TOKEN) for piece in TOKEN_PATTERN.findall(text))
+
+
+def count_tokens_remote(text, model_name="gemini-2.0-flash"):
+    """
+    Counts the tokens in a text with the model's own tokenizer, through the shared model backend.
+
+    Parameters:
+    text (str): The text.
+    model_name (str, optional): The model whose tokenizer is used.
+
+    Returns:
+    int: The number of tokens.
+    """
+
+    from study_space.llm import get_llm_backend
+
+    return get_llm_backend().count_tokens(text, model_name)
+
+
+def count_tokens(text, model_name="gemini-2.0-flash"):
+    """
+    Returns the number of tokens in a text, estimated locally.
+
+    A fraction QUESTIONAIRRE_TOKEN_VERIFY_RATE of calls is also counted remotely; the
+    remote count is logged next to the estimate, to keep the estimator calibrated, and
+    returned instead of it.
+
+    Parameters:
+    text (str): The text.
+    model_name (str, optional): The model whose tokenizer is used for verification.
+
+    Returns:
+    int: The number of tokens.
+    """
+
+    estimate = estimate_tokens(text)
+    if random.random() >= settings.QUESTIONAIRRE_TOKEN_VERIFY_RATE:
+        return estimate
+
+    try:
+        actual = count_tokens_remote(text, model_name)
+    except Exception as e:
+        logging.error(f"An error occured during token count verification: {e}")
+        return estimate
+    logging.info(f"Token estimate {estimate}, counted {actual} by {model_name}")
+    return actual
@@ -0,0 +1,42 @@
+from django.core.exceptions import ValidationError
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+
+from study_space.validators import HEADER_SIZE, validate_pdf_header, validate_pdf_size
+
+
+class BookFileUploadHandler(FileUploadHandler):
+    """
+    Checks book files while a multipart request is being received.
+
+    It goes before Django's handlers, which store the file, and drops a file as soon as
+    its first bytes are not a PDF or it grows past BOOK_VALIDATION['MAX_SIZE'], so the rest
+    of it is never buffered or written to disk. The reasons are kept in 'errors', by field.
+    The full checks run later in validate_fIle_size_and_type.
+
+    Usage, before the request's data is read:
+        handler = BookFileUploadHandler(request)
+        request.upload_handlers.insert(0, handler)
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.errors = {}
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self.header = b''
+
+    def receive_data_chunk(self, raw_data, start):
+        try:
+            validate_pdf_size(start + len(raw_data))
+            if len(self.header) < HEADER_SIZE:
+                self.header += raw_data[:HEADER_SIZE - len(self.header)]
+                if len(self.header) == HEADER_SIZE:
+                    validate_pdf_header(self.header)
+        except ValidationError as e:
+            self.errors[self.field_name] = e.messages
+            raise SkipFile()
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
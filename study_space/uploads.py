@@ -0,0 +1,263 @@
+import hashlib
+import posixpath
+import re
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from study_space import validators as validate
+from study_space.models import Book, BookUpload
+
+BLOCK_SIZE = 64 * 1024
+# Chunks are kept in memory up to this size while they are received, then spooled to disk.
+SPOOL_SIZE = 1024 * 1024
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+
+class UploadOffsetMismatch(Exception):
+    """Raised when a chunk starts after the end of the bytes received so far."""
+
+    def __init__(self, received):
+        super().__init__(f"chunk must start at or before byte {received}")
+        self.received = received
+
+
+def part_name(upload, first):
+    """
+    Returns the storage name of the part of an upload starting at byte 'first'.
+
+    Parameters:
+    upload (BookUpload): The upload.
+    first (int): The first byte of the part.
+
+    Returns:
+    str: The name. The storage may save the part under another name.
+    """
+
+    return posixpath.join(settings.BOOK_UPLOADS['LOCATION'], str(upload.upload_id), f"{first:015d}.part")
+
+
+def parse_content_range(header, size):
+    """
+    Parses the Content-Range header of a chunk.
+
+    Parameters:
+    header (str): The header, 'bytes <first>-<last>/<total>'.
+    size (int): The size of the upload.
+
+    Returns:
+    tuple: The first and last byte of the chunk, inclusive.
+
+    Raises:
+    ValueError: If the header is malformed, the total is not the upload's size, or the
+    chunk is empty, past the end of the upload or larger than BOOK_UPLOADS['MAX_CHUNK_SIZE'].
+    """
+
+    match = CONTENT_RANGE_RE.match(header or '')
+    if not match:
+        raise ValueError("Content-Range must be 'bytes <first>-<last>/<total>'")
+    first, last, total = (int(value) for value in match.groups())
+    if total != size:
+        raise ValueError(f"Content-Range total must be the upload size, {size}")
+    if first > last or last >= size:
+        raise ValueError("Content-Range is outside the upload")
+    if last - first + 1 > settings.BOOK_UPLOADS['MAX_CHUNK_SIZE']:
+        raise ValueError(f"chunks must not be larger than {settings.BOOK_UPLOADS['MAX_CHUNK_SIZE']} bytes")
+    return first, last
+
+
+def copy_bytes(source, destination, length):
+    """
+    Copies up to 'length' bytes between file objects, in blocks.
+
+    Returns:
+    int: The number of bytes copied, less than 'length' if the source ended first.
+    """
+
+    copied = 0
+    while copied < length:
+        block = source.read(min(BLOCK_SIZE, length - copied))
+        if not block:
+            break
+        if destination is not None:
+            destination.write(block)
+        copied += len(block)
+    return copied
+
+
+def write_chunk(upload, stream, first, last):
+    """
+    Saves a chunk of an upload to storage.
+
+    A chunk may start anywhere up to the bytes already received, so a client that did not
+    see the response to a chunk can send it again; only the bytes past 'received' are
+    kept. The body is copied from the request stream in blocks and saved as a part once
+    it is complete, so a dropped connection leaves nothing behind. The first chunk must
+    start like a PDF, so other files are turned away before the rest is sent. No lock is
+    held while the body is received and saved: the upload row is only locked to record
+    the part, and a part saved while another chunk moved 'received' is saved again from
+    the new offset.
+
+    Parameters:
+    upload (BookUpload): The upload.
+    stream (file): The request body.
+    first (int): The first byte of the chunk.
+    last (int): The last byte of the chunk, inclusive.
+
+    Returns:
+    BookUpload: The upload, with 'received' updated.
+
+    Raises:
+    UploadOffsetMismatch: If the chunk starts after the bytes received so far.
+    ValueError: If the body is shorter than the Content-Range.
+    ValidationError: If the first chunk is not the start of a PDF.
+    """
+
+    length = last - first + 1
+    upload = BookUpload.objects.get(pk=upload.pk)
+    if first > upload.received:
+        raise UploadOffsetMismatch(upload.received)
+
+    skip = min(upload.received - first, length)
+    chunk = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    try:
+        copied = copy_bytes(stream, None, skip)
+        copied += copy_bytes(stream, chunk, length - skip)
+        if copied < length:
+            raise ValueError(f"chunk body has {copied} bytes, Content-Range announced {length}")
+        start = first + skip
+
+        while start <= last:
+            if start == 0:
+                chunk.seek(0)
+                try:
+                    validate.validate_pdf_header(chunk.read(validate.HEADER_SIZE))
+                except ValidationError as e:
+                    raise serializers.ValidationError({'file': e.messages})
+            name = default_storage.save(part_name(upload, start), File(chunk))
+
+            with transaction.atomic():
+                upload = BookUpload.objects.select_for_update().get(pk=upload.pk)
+                if upload.received == start:
+                    upload.parts.append(name)
+                    upload.received = last + 1
+                    upload.save(update_fields=['received', 'parts', 'updated_at'])
+                    return upload
+
+            # Another chunk was recorded meanwhile; keep only the bytes past it.
+            default_storage.delete(name)
+            if upload.received < start:
+                raise UploadOffsetMismatch(upload.received)
+            trimmed = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+            chunk.seek(min(upload.received, last + 1) - start)
+            copy_bytes(chunk, trimmed, last + 1 - start)
+            chunk.close()
+            chunk = trimmed
+            start = max(start, upload.received)
+        return upload
+    finally:
+        chunk.close()
+
+
+def discard_upload(upload):
+    """
+    Removes an upload and its parts.
+
+    Parameters:
+    upload (BookUpload): The upload.
+    """
+
+    for name in upload.parts:
+        default_storage.delete(name)
+    upload.delete()
+
+
+def assemble_upload(upload):
+    """
+    Joins the parts of an upload into a local temporary file, hashing it on the way.
+
+    Parameters:
+    upload (BookUpload): The upload.
+
+    Returns:
+    tuple: The TemporaryUploadedFile and its SHA-256 hex digest.
+    """
+
+    assembled = TemporaryUploadedFile(upload.filename, 'application/pdf', upload.size, None)
+    digest = hashlib.sha256()
+    for name in upload.parts:
+        with default_storage.open(name, 'rb') as part:
+            for block in part.chunks(BLOCK_SIZE):
+                digest.update(block)
+                assembled.write(block)
+    assembled.seek(0)
+    return assembled, digest.hexdigest()
+
+
+def complete_upload(upload):
+    """
+    Creates the book of a fully received upload.
+
+    The parts are joined and hashed in one pass, the file is checked like a book uploaded
+    in one request (a PDF within the BOOK_VALIDATION limits) and saved to storage as the book's file;
+    FileSystemStorage moves the joined file into place rather than copying it. The upload
+    and its parts are removed, also when the file is rejected.
+
+    Parameters:
+    upload (BookUpload): The upload.
+
+    Returns:
+    Book: The new book.
+
+    Raises:
+    ValidationError: If bytes are missing, the file is not a valid PDF, or the user already
+    has a book with this title.
+    """
+
+    if upload.received != upload.size:
+        raise serializers.ValidationError(f"upload incomplete, {upload.received} of {upload.size} bytes received")
+
+    assembled, content_hash = assemble_upload(upload)
+    with assembled:
+        try:
+            validate.validate_fIle_size_and_type(assembled)
+        except ValidationError as e:
+            discard_upload(upload)
+            raise serializers.ValidationError({'file': e.messages})
+        book = Book(title=upload.title, user=upload.user, content_hash=content_hash)
+        book.file.save(upload.filename, assembled, save=False)
+    try:
+        with transaction.atomic():
+            book.save()
+    except IntegrityError:
+        book.file.delete(save=False)
+        discard_upload(upload)
+        raise serializers.ValidationError({'title': ["You already have a book with this title."]})
+    discard_upload(upload)
+    return book
+
+
+def clear_stale_uploads(now=None):
+    """
+    Removes unfinished uploads that received no chunk for BOOK_UPLOADS['EXPIRY_HOURS'].
+
+    Parameters:
+    now (datetime, optional): The current time.
+
+    Returns:
+    int: The number of uploads removed.
+    """
+
+    cutoff = (now or timezone.now()) - timedelta(hours=settings.BOOK_UPLOADS['EXPIRY_HOURS'])
+    stale = list(BookUpload.objects.filter(updated_at__lt=cutoff))
+    for upload in stale:
+        discard_upload(upload)
+    return len(stale)
@@ -4,8 +4,13 @@ from django.urls.resolvers import URLPattern
 
 urlpatterns = [
     path('book/',views.BookList.as_view(), name='book-list'),
+    path('book/uploads', views.BookUploadList.as_view(), name='book-upload-list'),
+    path('book/uploads/<uuid:upload_id>', views.BookUploadDetail.as_view(), name='book-upload-detail'),
     path('book/<str:current_title>/', views.BookDetail.as_view(), name='book-detail'),
     path('questionairre/', views.QuestionairreList.as_view(), name='questionairre-list'),
-    path('questionairre/<int:pk>', views.QuestionairreDetail.as_view(), name='questionairre-detail')
+    path('questionairre/<int:pk>', views.QuestionairreDetail.as_view(), name='questionairre-detail'),
+    path('questionairre/jobs/<int:pk>', views.QuestionairreJobDetail.as_view(), name='questionairre-job-detail'),
+    path('questionairre/jobs/<int:pk>/stream', views.QuestionairreJobStream.as_view(), name='questionairre-job-stream'),
+    path('metrics', views.Metrics.as_view(), name='metrics')
 
 ]
\ No newline at end of file
@@ -1,21 +1,71 @@
 import filetype
+from django.conf import settings
 from django.core.exceptions import ValidationError
-from pypdf import PdfReader
+from .pdf_engine import declared_page_count
 
-def validate_fIle_size_and_type(value):
-    file_info = filetype.guess(value.file)
+# A PDF's header must be within its first 1024 bytes.
+HEADER_SIZE = 1024
+
+
+def validate_pdf_header(header):
+    """
+    Checks the type of a file from its first bytes.
+
+    Parameters:
+    header (bytes): The first HEADER_SIZE bytes of the file, or all of it if shorter.
+
+    Raises:
+    ValidationError: If the file is not a PDF.
+    """
+
+    file_info = filetype.guess(header)
     if file_info is None:
         raise ValidationError('File type not Known')
     allowed_mime_types = ['application/pdf']
     if file_info.mime not in allowed_mime_types:
         raise ValidationError('only pdf and word files are allowed')
-    
+
+
+def validate_pdf_size(size):
+    """
+    Checks a file's size against BOOK_VALIDATION['MAX_SIZE'].
+
+    Parameters:
+    size (int): The size in bytes.
+
+    Raises:
+    ValidationError: If the file is too large.
+    """
+
+    max_size = settings.BOOK_VALIDATION['MAX_SIZE']
+    if size > max_size:
+        raise ValidationError(f'File must not be larger than {max_size / (1024 * 1024):g} MB')
+
+
+def validate_fIle_size_and_type(value):
+    """
+    Checks that a file is a PDF within the size and page limits of BOOK_VALIDATION.
+
+    The checks go from cheapest to dearest and stop at the first failure: the size, the
+    type from the first bytes, then the page count declared in the page tree, which is
+    read through the cross-reference table without loading the pages.
+
+    Parameters:
+    value (File): The uploaded file.
+
+    Raises:
+    ValidationError: If the file is too large, not a PDF, unreadable or has too many pages.
+    """
+
+    validate_pdf_size(value.size)
+    file = value.file
+    file.seek(0)
+    validate_pdf_header(file.read(HEADER_SIZE))
+
     try:
-        value.file.seek(0)
-        pdf = PdfReader(value.file)
-        num_pages = len(pdf.pages)
-        if num_pages > 100:
-            raise ValidationError('PDF file must not be greater than 100 pages')
-    
+        num_pages = declared_page_count(file)
     except Exception as e:
-        raise ValidationError(f'{str(e)}')
\ No newline at end of file
+        raise ValidationError(f'{str(e)}')
+    max_pages = settings.BOOK_VALIDATION['MAX_PAGES']
+    if num_pages > max_pages:
+        raise ValidationError(f'PDF file must not be greater than {max_pages} pages')
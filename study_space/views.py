@@ -1,17 +1,35 @@
 from rest_framework.views import APIView
-from study_space.models import Book, Questionairre
-from study_space.serializers import BookSerializer,QuestionairreSerializer
+from study_space.models import Book, BookUpload, Questionairre, QuestionairreJob, book_by_title, book_title_taken
+from study_space.serializers import BookSerializer, BookUploadSerializer, QuestionairreSerializer, QuestionairreJobSerializer
+from study_space.fast_serializers import BookReadSerializer, QuestionairreReadSerializer
+from study_space.jobs import enqueue_questionairre_job, retry_job
+from study_space.upload_handlers import BookFileUploadHandler
+from study_space.uploads import UploadOffsetMismatch, complete_upload, discard_upload, parse_content_range, write_chunk
+from study_space.streaming import EventStreamRenderer, JobEventStream
+from study_space.async_api import AsyncAPIView
+from study_space.downloads import file_download
+from study_space.listings import listing_response
+from study_space.metrics import CONTENT_TYPE, registry
+from asgiref.sync import sync_to_async
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.permissions import IsAuthenticated
-from drf_yasg.utils import swagger_auto_schema
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from drf_yasg.utils import no_body, swagger_auto_schema
 from rest_framework.parsers import MultiPartParser, FormParser
 from drf_yasg import openapi
 from rest_framework.authentication import TokenAuthentication
-import os
-from django.http import HttpResponse
-from wsgiref.util import FileWrapper
-from pathlib import Path
+from io import BytesIO
+from django.http import HttpResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from rest_framework.renderers import JSONRenderer
+
+DUPLICATE_TITLE = "You already have a book with this title."
+
+LISTING_PARAMETERS = [
+    openapi.Parameter('cursor', openapi.IN_QUERY, type=openapi.TYPE_STRING, description='Page cursor, from the Link header'),
+    openapi.Parameter('page_size', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, description='Rows per page'),
+    openapi.Parameter('fields', openapi.IN_QUERY, type=openapi.TYPE_STRING, description='Comma separated fields to return'),
+]
 
 class BookList(APIView):
     """
@@ -22,12 +40,22 @@ class BookList(APIView):
     authentication_classes = [TokenAuthentication]
     parser_classes = [MultiPartParser, FormParser]
 
+    @swagger_auto_schema(manual_parameters=LISTING_PARAMETERS, responses={200: BookSerializer(many=True)})
     def get(self, request, format=None):
-        """Returns a list of books owned by the current user."""
+        """
+        Returns a page of the books owned by the current user.
+
+        See listing_response for pagination, '?fields=', caching and ETags.
+
+        Parameters:
+        request (Request): The HTTP request object.
+        format (str, optional): The format of the response (not used).
 
-        books = Book.objects.filter(user= request.user)
-        serializer = BookSerializer(books, many=True)
-        return Response(serializer.data)
+        Returns:
+        Response: Serialized list of books (200), 304, or error messages (400 or 404).
+        """
+
+        return listing_response(request, 'books', Book.objects.filter(user=request.user), BookReadSerializer)
     
     @swagger_auto_schema(request_body=BookSerializer, content_type='multipart/form-data' , responses={201: BookSerializer})
     def post(self, request, format=None):
@@ -35,7 +63,8 @@ class BookList(APIView):
         Creates a new book for the authenticated user.
 
         This endpoint expects multipart/form-data input including the book title and file.
-        If the data is valid, the book is saved with the current user as the owner.
+        If the data is valid, the book is saved with the current user as the owner. A file that
+        is not a PDF or is too large is rejected while it is received, see BookFileUploadHandler.
 
         Parameters:
         request (Request): The HTTP request object containing the book data.
@@ -45,8 +74,14 @@ class BookList(APIView):
         Response: Serialized book data on success (201), or validation errors (400).
         """
 
+        handler = BookFileUploadHandler(request)
+        request.upload_handlers.insert(0, handler)
         serializer = BookSerializer(data= request.data)
+        if handler.errors:
+            return Response(handler.errors, status=status.HTTP_400_BAD_REQUEST)
         if serializer.is_valid():
+            if book_title_taken(request.user, serializer.validated_data['title']):
+                return Response({'title': [DUPLICATE_TITLE]}, status=status.HTTP_400_BAD_REQUEST)
             serializer.save(user=request.user)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -77,11 +112,10 @@ class BookDetail(APIView):
         Response: Serialized book data on success (200), or "book not found" (404).
         """
 
-        book = Book.objects.filter(title__iexact=current_title, user=request.user).first()
+        book = book_by_title(request.user, current_title)
         if not book:   
             return Response("book not found",status.HTTP_404_NOT_FOUND)
-        serializer = BookSerializer(book)
-        return Response(serializer.data)
+        return Response(BookReadSerializer().serialize_instance(book))
 
 
     @swagger_auto_schema(
@@ -121,14 +155,20 @@ class BookDetail(APIView):
         Response: Serialized updated book data on success (200), or error messages (404 or 400).
         """
 
-        book = Book.objects.filter(title__iexact=current_title, user=request.user).first()
+        book = book_by_title(request.user, current_title)
         
         if not book:
             return Response({"error": "Book not found with the given current title."}, status=status.HTTP_404_NOT_FOUND)
         
 
+        handler = BookFileUploadHandler(request)
+        request.upload_handlers.insert(0, handler)
         serializer = BookSerializer(book, data=request.data, partial=True)
+        if handler.errors:
+            return Response(handler.errors, status=status.HTTP_400_BAD_REQUEST)
         serializer.is_valid(raise_exception=True)
+        if 'title' in serializer.validated_data and book_title_taken(request.user, serializer.validated_data['title'], exclude=book):
+            return Response({'title': [DUPLICATE_TITLE]}, status=status.HTTP_400_BAD_REQUEST)
         serializer.save()  
         
         return Response(serializer.data, status=status.HTTP_200_OK)
@@ -140,7 +180,7 @@ class BookDetail(APIView):
         """
         Deletes a specific book by its current title.
 
-        The book file is removed from the filesystem, and the database record is deleted.
+        The book file is removed from storage, and the database record is deleted.
         The book must belong to the authenticated user. The title comparison is case-insensitive.
 
         Parameters:
@@ -152,74 +192,321 @@ class BookDetail(APIView):
         Response: No content on success (204), or "book not found" (404).
         """
 
-        book = Book.objects.filter(title__iexact=current_title, user=request.user).first()
+        book = book_by_title(request.user, current_title)
         if not book:   
             return Response("book not found",status.HTTP_404_NOT_FOUND)
-        os.remove(book.file.path)
+        book.file.delete(save=False)
         book.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class QuestionairreList(APIView):
+class BookUploadList(APIView):
+    """
+    API view to start a resumable, chunked upload of a book.
+
+    Large books are sent as a series of short requests instead of one long multipart
+    request: start the upload here, PUT its chunks to the upload, then POST to the upload
+    to create the book. See study_space/uploads.py.
+    """
+
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [TokenAuthentication]
+
+    @swagger_auto_schema(request_body=BookUploadSerializer, responses={201: BookUploadSerializer})
+    def post(self, request, format=None):
+        """
+        Starts a chunked upload.
+
+        Parameters:
+        request (Request): The HTTP request object, with the book's 'title', the file's 'filename'
+        and its 'size' in bytes.
+        format (str, optional): The format of the response (not used).
+
+        Returns:
+        Response: The upload, with the 'upload_id' to send chunks to (201), or validation errors (400).
+        """
+
+        serializer = BookUploadSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        serializer.save(user=request.user)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+class BookUploadDetail(APIView):
+    """
+    API view to send the chunks of an upload, resume it, complete it or abort it.
+    """
+
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [TokenAuthentication]
+
+    def get(self, request, upload_id, format=None):
+        """
+        Returns an upload, whose 'received' is the byte to resume it from.
+
+        Parameters:
+        request (Request): The HTTP request object.
+        upload_id (UUID): The upload.
+        format (str, optional): The format of the response (not used).
+
+        Returns:
+        Response: The upload (200), or "upload not found" (404).
+        """
+
+        upload = BookUpload.objects.filter(upload_id=upload_id, user=request.user).first()
+        if not upload:
+            return Response("upload not found", status=status.HTTP_404_NOT_FOUND)
+        return Response(BookUploadSerializer(upload).data)
+
+    @swagger_auto_schema(auto_schema=None)
+    def put(self, request, upload_id, format=None):
+        """
+        Stores a chunk of an upload.
+
+        The body is the chunk's raw bytes and the 'Content-Range' header places it in the file,
+        as in 'bytes 0-1048575/5242880'. A chunk may start anywhere up to 'received', so chunks
+        whose response was lost can be sent again.
+
+        Parameters:
+        request (Request): The HTTP request object.
+        upload_id (UUID): The upload.
+        format (str, optional): The format of the response (not used).
+
+        Returns:
+        Response: The upload (200), "upload not found" (404), the upload with the byte to
+        resume from if the chunk starts after it (409), or an error message (400).
+        """
+
+        upload = BookUpload.objects.filter(upload_id=upload_id, user=request.user).first()
+        if not upload:
+            return Response("upload not found", status=status.HTTP_404_NOT_FOUND)
+        try:
+            first, last = parse_content_range(request.META.get('HTTP_CONTENT_RANGE'), upload.size)
+            upload = write_chunk(upload, request.stream or BytesIO(), first, last)
+        except UploadOffsetMismatch as e:
+            upload.received = e.received
+            return Response(BookUploadSerializer(upload).data, status=status.HTTP_409_CONFLICT)
+        except ValueError as e:
+            return Response(str(e), status=status.HTTP_400_BAD_REQUEST)
+        return Response(BookUploadSerializer(upload).data)
+
+    @swagger_auto_schema(request_body=no_body, responses={201: BookSerializer})
+    def post(self, request, upload_id, format=None):
+        """
+        Completes an upload, creating its book.
+
+        The file is validated as in BookList.post. A rejected file ends the upload.
+
+        Parameters:
+        request (Request): The HTTP request object.
+        upload_id (UUID): The upload.
+        format (str, optional): The format of the response (not used).
+
+        Returns:
+        Response: The new book (201), "upload not found" (404), or validation errors (400).
+        """
+
+        upload = BookUpload.objects.filter(upload_id=upload_id, user=request.user).select_related('user').first()
+        if not upload:
+            return Response("upload not found", status=status.HTTP_404_NOT_FOUND)
+        book = complete_upload(upload)
+        return Response(BookSerializer(book).data, status=status.HTTP_201_CREATED)
+
+    def delete(self, request, upload_id, format=None):
+        """
+        Aborts an upload, removing the chunks received.
+
+        Parameters:
+        request (Request): The HTTP request object.
+        upload_id (UUID): The upload.
+        format (str, optional): The format of the response (not used).
+
+        Returns:
+        Response: No content (204), or "upload not found" (404).
+        """
+
+        upload = BookUpload.objects.filter(upload_id=upload_id, user=request.user).first()
+        if not upload:
+            return Response("upload not found", status=status.HTTP_404_NOT_FOUND)
+        discard_upload(upload)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class QuestionairreList(AsyncAPIView):
     """
     API view to list all questionnaires for the authenticated user or create a new one.
+
+    The handlers are async, see AsyncAPIView.
     """
 
     permission_classes = [IsAuthenticated]
     authentication_classes = [TokenAuthentication]
 
-    def get(self, request, format=None):
+    @swagger_auto_schema(manual_parameters=LISTING_PARAMETERS, responses={200: QuestionairreSerializer(many=True)})
+    async def get(self, request, format=None):
         """
-        Returns a list of questionnaires owned by the current user.
+        Returns a page of the questionnaires owned by the current user.
+
+        See listing_response for pagination, '?fields=', caching and ETags.
 
         Parameters:
         request (Request): The HTTP request object.
         format (str, optional): The format of the response (not used).
 
         Returns:
-        Response: Serialized list of questionnaires (200).
+        Response: Serialized list of questionnaires (200), 304, or error messages (400 or 404).
         """
 
-        questionairre = Questionairre.objects.filter(user= request.user)
-        serializer = QuestionairreSerializer(questionairre, many=True)
-        return Response(serializer.data)
+        # The book is listed by title, joined in by values() rather than fetched for each row.
+        questionairres = Questionairre.objects.filter(user=request.user)
+        return await sync_to_async(listing_response)(request, 'questionairres', questionairres, QuestionairreReadSerializer)
     
     @swagger_auto_schema(request_body=QuestionairreSerializer,
         responses={
-        201: openapi.Response
-            (description='File downloaded successfully',
-              schema=openapi.Schema(type=openapi.TYPE_FILE,
-                description='Text file containing the questionnaire')),
-                 
+        202: openapi.Response(description='Generation job queued', schema=QuestionairreJobSerializer),
         400: openapi.Response(description='Validation error', schema=QuestionairreSerializer)})    
-    def post(self, request, format=None):
+    async def post(self, request, format=None):
         """
-        Creates a new questionnaire for the authenticated user.
+        Queues the generation of a new questionnaire for the authenticated user.
 
-        Expects data including the associated book and detail level. The questionnaire is saved
-        with the current user as the owner.
+        Expects data including the associated book and detail level. The request is validated
+        and handed to a background worker; the questionnaire is created with the current user
+        as the owner once the job completes. Progress can be followed on the job status endpoint.
 
         Parameters:
         request (Request): The HTTP request object containing the questionnaire data.
         format (str, optional): The format of the response (not used).
 
         Returns:
-        Response: Serialized questionnaire data on success (201), or validation errors (400).
+        Response: Serialized generation job on success (202), or validation errors (400).
         """
 
         serializer = QuestionairreSerializer(data=request.data, context={"request": request})
         
-        if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        if await sync_to_async(serializer.is_valid)():
+            job = await sync_to_async(enqueue_questionairre_job)(request.user, **serializer.validated_data)
+            job_serializer = QuestionairreJobSerializer(job)
+            return Response(await sync_to_async(lambda: job_serializer.data)(), status=status.HTTP_202_ACCEPTED)
                 
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class QuestionairreDetail(APIView):
+class QuestionairreJobDetail(APIView):
+    """
+    API view to follow the progress of a questionnaire generation job owned by the authenticated user.
+    """
+
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [TokenAuthentication]
+
+    @swagger_auto_schema(responses={200: QuestionairreJobSerializer})
+    def get(self, request, pk, format=None):
+        """
+        Returns the status and chunk progress of a generation job.
+
+        Parameters:
+        request (Request): The HTTP request object.
+        pk (int): The primary key of the job.
+        format (str, optional): The format of the response (not used).
+
+        Returns:
+        Response: Serialized job data (200), or "job not found" (404).
+        """
+
+        job = QuestionairreJob.objects.filter(pk=pk, user=request.user).select_related('book').first()
+        if not job:
+            return Response("job not found", status=status.HTTP_404_NOT_FOUND)
+        return Response(QuestionairreJobSerializer(job).data)
+
+    @swagger_auto_schema(responses={202: QuestionairreJobSerializer})
+    def post(self, request, pk, format=None):
+        """
+        Retries a failed generation job.
+
+        The job resumes from its partial questionnaire, so chunks generated before the
+        failure are not generated again.
+
+        Parameters:
+        request (Request): The HTTP request object.
+        pk (int): The primary key of the job.
+        format (str, optional): The format of the response (not used).
+
+        Returns:
+        Response: Serialized job data (202), "job not found" (404), or "only failed jobs can be retried" (400).
+        """
+
+        job = QuestionairreJob.objects.filter(pk=pk, user=request.user).select_related('book').first()
+        if not job:
+            return Response("job not found", status=status.HTTP_404_NOT_FOUND)
+        if not retry_job(job):
+            return Response("only failed jobs can be retried", status=status.HTTP_400_BAD_REQUEST)
+        return Response(QuestionairreJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+
+class QuestionairreJobStream(APIView):
+    """
+    API view to follow a questionnaire generation job owned by the authenticated user live,
+    as Server-Sent Events.
+    """
+
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [TokenAuthentication]
+    renderer_classes = [JSONRenderer, EventStreamRenderer]
+
+    @swagger_auto_schema(responses={200: openapi.Response(description='text/event-stream of chunk, progress, complete and failed events')})
+    def get(self, request, pk, format=None):
+        """
+        Streams the question-answer pairs of a generation job as each chunk is generated.
+
+        Emits a 'chunk' event per generated chunk, 'progress' events as the job advances, and
+        ends with a 'complete' event carrying the questionnaire id or a 'failed' event carrying
+        the error. Clients reconnecting with a Last-Event-ID header only receive the chunks
+        they have not seen. Runs as an async stream when served through ASGI.
+
+        Parameters:
+        request (Request): The HTTP request object.
+        pk (int): The primary key of the job.
+        format (str, optional): The format of the response (not used).
+
+        Returns:
+        StreamingHttpResponse: The event stream (200), or "job not found" (404).
+        """
+
+        if not QuestionairreJob.objects.filter(pk=pk, user=request.user).exists():
+            return Response("job not found", status=status.HTTP_404_NOT_FOUND)
+
+        last_event_id = request.headers.get('Last-Event-ID', '')
+        events = JobEventStream(pk, last_event_id=int(last_event_id) if last_event_id.isdigit() else 0)
+        stream = events.__aiter__() if isinstance(request._request, ASGIRequest) else iter(events)
+        response = StreamingHttpResponse(stream, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+class Metrics(APIView):
+    """
+    API view exporting the questionnaire generation metrics in the Prometheus text format.
+
+    Only staff users can read them; Prometheus authenticates with a staff user's token.
+    """
+
+    permission_classes = [IsAdminUser]
+    authentication_classes = [TokenAuthentication]
+
+    @swagger_auto_schema(auto_schema=None)
+    def get(self, request, format=None):
+        """Returns the time spent in each generation stage, and the counters, of this process."""
+
+        return HttpResponse(registry.render(), content_type=CONTENT_TYPE)
+
+
+class QuestionairreDetail(AsyncAPIView):
     """
     API view to retrieve (download) or delete a specific questionnaire owned by the authenticated user.
+
+    The handlers are async, see AsyncAPIView.
     """
 
     permission_classes = [IsAuthenticated]
@@ -228,12 +515,13 @@ class QuestionairreDetail(APIView):
 
 
     
-    def get(self, request, pk, format= None):
+    async def get(self, request, pk, format= None):
         """
         Downloads the question answers file for a specific questionnaire.
 
         The questionnaire must belong to the authenticated user. Returns the file as an attachment
-        if it exists.
+        if it exists, see file_download for how it is sent and for Range and ETag support. For a
+        partial questionnaire the chunks generated so far are returned instead, in page order.
 
         Parameters:
         request (Request): The HTTP request object.
@@ -241,20 +529,22 @@ class QuestionairreDetail(APIView):
         format (str, optional): The format of the response (not used).
 
         Returns:
-        HttpResponse: File download response on success (200), or error messages (404 or 400).
+        HttpResponse: File download response on success (200 or 206), 304 if the client's copy is
+        current, or error messages (404, 400 or 416).
         """
 
-        questionairre = Questionairre.objects.filter(pk=pk, user=request.user).first()
+        questionairre = await Questionairre.objects.filter(pk=pk, user=request.user).afirst()
         if not questionairre:
             return Response("questionairre not found", status=status.HTTP_404_NOT_FOUND)
         # serializer = QuestionairreSerializer(questionairre)
-        file_path = Path(questionairre.question_answers_file.path)
-        if file_path.is_file():
-            with open(file_path, 'rb') as file_obj:
-                response = HttpResponse(FileWrapper(file_obj), content_type='text/plain')
-                filename = file_path.name
-                response['Content-Disposition'] = f'attachment; filename="{filename}"'
-                return response
+        if questionairre.status == 'partial':
+            chunks = questionairre.questionairre_chunk.order_by('start_page', 'part').values_list('question_answers', flat=True)
+            response = HttpResponse("".join([chunk async for chunk in chunks]), content_type='text/plain')
+            response['Content-Disposition'] = f'attachment; filename="partial_{questionairre.pk}.txt"'
+            return response
+        file = questionairre.question_answers_file
+        if await sync_to_async(file.storage.exists)(file.name):
+            return await sync_to_async(file_download)(request, file)
         else:
             return Response("File not found", status=status.HTTP_400_BAD_REQUEST)
 
@@ -273,11 +563,11 @@ class QuestionairreDetail(APIView):
     #         return Response(serializer.data, status=status.HTTP_200_OK)
     #     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
-    def delete(self, request, pk, format=None):
+    async def delete(self, request, pk, format=None):
         """
         Deletes a specific questionnaire by its primary key.
 
-        The associated question answers file is removed from the filesystem if it exists,
+        The associated question answers file is removed from storage if it exists,
         and the database record is deleted. The questionnaire must belong to the authenticated user.
 
         Parameters:
@@ -289,16 +579,17 @@ class QuestionairreDetail(APIView):
         Response: No content on success (204), or error messages (404, 400, or 500).
         """
 
-        questionairre = Questionairre.objects.filter(pk= pk, user=request.user).first()
+        questionairre = await Questionairre.objects.filter(pk= pk, user=request.user).afirst()
         if not questionairre:
             return Response('questionairre not found', status=status.HTTP_404_NOT_FOUND)
+        if not questionairre.question_answers_file:
+            await questionairre.adelete()
+            return Response(status=status.HTTP_204_NO_CONTENT)
         try:
-            file_path = questionairre.question_answers_file.path
-
-
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                questionairre.delete()
+            file = questionairre.question_answers_file
+            if await sync_to_async(file.storage.exists)(file.name):
+                await sync_to_async(file.delete)(save=False)
+                await questionairre.adelete()
             else:
                 return Response("File not found ", status=status.HTTP_400_BAD_REQUEST)
             
@@ -1,3 +1,46 @@
-from django.test import TestCase
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.test import override_settings
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APITestCase
+from study_space.models import Book, Questionairre
+from study_space.tests.query_counts import QueryCountAssertionsMixin
 
-# Create your tests here.
+
+@override_settings(STORAGES={**settings.STORAGES, 'default': {'BACKEND': 'django.core.files.storage.InMemoryStorage'}})
+class UserEndpointQueryCountTests(QueryCountAssertionsMixin, APITestCase):
+    """User endpoints make the same number of queries however many books the user has."""
+
+    def create_user(self, username, books):
+        user = User.objects.create_user(username=username, email=f'{username}@example.com', password='testpass')
+        for i in range(books):
+            book = Book.objects.create(title=f'Book {i}', user=user, file=ContentFile(b'%PDF-1.4', name='book.pdf'))
+            Questionairre.objects.create(book=book, user=user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=user).key)
+        return client
+
+    def test_signup(self):
+        queries = {}
+        for size in (1, 5):
+            self.create_user(f'existing{size}', size)
+            queries[size] = self.captureQueries(lambda: APIClient().post(
+                '/signup/', {'username': f'new{size}', 'email': f'new{size}@example.com', 'password': 'testpass'}, format='json'))
+        self.assertSameQueryCounts(queries)
+
+    def test_user_detail(self):
+        for method in ('get', 'put', 'delete'):
+            queries = {}
+            for size in (1, 5):
+                client = self.create_user(f'{method}{size}', size)
+                data = {'email': f'{method}{size}@example.org', 'password': 'newpass'} if method == 'put' else None
+                queries[size] = self.captureQueries(lambda: getattr(client, method)('/edituser/', data, format='json'))
+            self.assertSameQueryCounts(queries)
+
+    def test_delete_removes_user_data(self):
+        client = self.create_user('leaving', 3)
+        self.assertEqual(client.delete('/edituser/').status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(User.objects.filter(username='leaving').exists())
+        self.assertFalse(Book.objects.exists())